@@ -34,14 +34,15 @@ if not server_is_up():
     sys.exit(1)
 # admin.py  – Secure‑Chat Admin GUI (v2.0)
 import customtkinter as ctk
-import sqlite3, time, importlib, win32api, win32file
+import time, importlib, win32api, win32file
 from CTkMessagebox import CTkMessagebox
 from customtkinter import CTkInputDialog
 from security.email_alert import get_system_info, format_email_body, send_email_alert
 
 from security.email_otp import send_otp_email, verify_otp
 from ui.otp_ui import OTPWindow 
-from utils.db_setup import _verify_password, DB_PATH
+from utils.db_setup import _verify_password
+from utils import db_access
 from utils.usb_auth  import admin_usb_authentication as usb_authenticate
 from ctk_gui.widgets.full_log_tab import FullLogTab  # Import the LogTab viewer
 
@@ -91,10 +92,7 @@ def choose_usb_dialog():
     return None
 
 def serial_in_use(serial):
-    conn = sqlite3.connect(DB_PATH); cur = conn.cursor()
-    cur.execute("SELECT username FROM users WHERE usb_serial=?", (serial,))
-    row = cur.fetchone(); conn.close()
-    return row[0] if row else None
+    return db_access.serial_owner(serial)
 
 # ---------- Main GUI ----------
 class AdminApp(ctk.CTk):
@@ -126,9 +124,7 @@ class AdminApp(ctk.CTk):
 
         def try_login():
             username = u_ent.get().strip(); pwd = p_ent.get().strip()
-            conn = sqlite3.connect(DB_PATH); cur = conn.cursor()
-            cur.execute("SELECT password, role FROM users WHERE username=?", (username,))
-            row = cur.fetchone(); conn.close()
+            row = db_access.password_and_role(username)
 
             if not (row and row[1] == "admin" and _verify_password(row[0], pwd)):
                 # 2) Wrong creds → increment and maybe OTP
@@ -203,10 +199,9 @@ class AdminApp(ctk.CTk):
     # ----- helpers -----
     def _refresh_users(self):  # updating a user interface element with a list of usernames retrieved from a database. 
         self.user_list.configure(state="normal"); self.user_list.delete("1.0","end")
-        conn = sqlite3.connect(DB_PATH); cur = conn.cursor()
-        for (u,) in cur.execute("SELECT username FROM users ORDER BY username"):
+        for u in db_access.usernames():
             self.user_list.insert("end", u + "\n")
-        conn.close(); self.user_list.configure(state="disabled")
+        self.user_list.configure(state="disabled")
 
     def _prompt(self, title, text):
         dlg = CTkInputDialog(title=title, text=text); val = dlg.get_input()
@@ -251,8 +246,7 @@ class AdminApp(ctk.CTk):
             CTkMessagebox(title="USB in use", message=f"Stick already assigned to '{used}'."); return
 
         # user exists?
-        conn = sqlite3.connect(DB_PATH); cur = conn.cursor()
-        cur.execute("SELECT usb_serial FROM users WHERE username=?", (u,)); row = cur.fetchone(); conn.close()
+        row = db_access.usb_serial(u)
         if not row:
             CTkMessagebox(title="Error", message="User not found."); return
         if row[0] and row[0] != serial:
@@ -269,9 +263,7 @@ class AdminApp(ctk.CTk):
     # -- view / unlock locks --
     def _view_locked(self):
         now = int(time.time())
-        conn = sqlite3.connect(DB_PATH); cur = conn.cursor()
-        cur.execute("SELECT username, usb_locked_until FROM users WHERE usb_locked_until > ?", (now,))
-        rows = cur.fetchall(); conn.close()
+        rows = db_access.locked_users(now)
         if not rows:
             CTkMessagebox(title="Locked Users", message="No locked accounts."); return
         lines = [f"{u} locked for {((t-now)//60)}m {((t-now)%60)}s" for u,t in rows]
@@ -280,9 +272,7 @@ class AdminApp(ctk.CTk):
     def _unlock(self):
         u = self._prompt("Unlock user","Username to unlock")
         if not u: return
-        conn = sqlite3.connect(DB_PATH); cur = conn.cursor()
-        cur.execute("UPDATE users SET usb_locked_until=0, usb_fail_count=0 WHERE username=?", (u,))
-        ok = cur.rowcount; conn.commit(); conn.close()
+        ok = db_access.unlock_user(u)
         if ok:
             CTkMessagebox(title="Unlocked", message=f"User '{u}' unlocked.")
         else:
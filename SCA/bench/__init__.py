@@ -0,0 +1,3 @@
+# bench/__init__.py
+"""Micro- and load-benchmarks; run from the SCA folder, e.g.
+   python -m bench.bench_aead"""
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+"""
+bench/bench_aead.py
+───────────────────
+Messages/sec for AES-256-GCM encryption, per message size:
+
+  legacy   new Cipher(AES(key), GCM(iv)) object per call (old encrypt_message)
+  session  one AEADSession per peer key, reused for every message
+
+Usage:  python -m bench.bench_aead [--seconds 1.0]
+"""
+import argparse, os, time
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.backends import default_backend
+
+from security import AEADSession
+
+SIZES = (64, 1024, 16 * 1024)
+
+
+def _legacy_encrypt(key: bytes, plaintext: bytes) -> bytes:
+    iv = os.urandom(12)
+    enc = Cipher(algorithms.AES(key), modes.GCM(iv), backend=default_backend()).encryptor()
+    ct = enc.update(plaintext) + enc.finalize()
+    return iv + enc.tag + ct
+
+
+def _rate(fn, payload: bytes, seconds: float) -> float:
+    n, t0 = 0, time.perf_counter()
+    deadline = t0 + seconds
+    while time.perf_counter() < deadline:
+        for _ in range(100):
+            fn(payload)
+        n += 100
+    return n / (time.perf_counter() - t0)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n")[3])
+    ap.add_argument("--seconds", type=float, default=1.0, help="time per case")
+    args = ap.parse_args()
+
+    key  = os.urandom(32)
+    sess = AEADSession(key)
+    print(f"{'size':>8} {'legacy msg/s':>14} {'session msg/s':>14} {'speed-up':>9}")
+    for size in SIZES:
+        payload = os.urandom(size)
+        old = _rate(lambda p: _legacy_encrypt(key, p), payload, args.seconds)
+        new = _rate(sess.encrypt, payload, args.seconds)
+        print(f"{size:>8} {old:>14,.0f} {new:>14,.0f} {new / old:>8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
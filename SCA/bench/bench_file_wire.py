@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+"""
+bench/bench_file_wire.py
+────────────────────────
+File-transfer payload throughput (MB/s of file data) and wire overhead:
+
+  v1  FILE_CHUNK  16 KB chunks, base64 → JSON → AES-GCM → base64
+  v2  FILE_DATA   60 KB chunks, fixed header + raw AES-GCM
+
+"encode" is the sender side, "decode" the receiver side (incl. parsing).
+
+Usage:  python -m bench.bench_file_wire [--mb 64]
+"""
+import argparse, base64, os, time, uuid
+
+from security import AEADSession
+from security.file_wire import (
+    V1_CHUNK_SIZE, V2_CHUNK_SIZE, encode_v1, encode_v2, decode_v2, open_json
+)
+
+
+def _decode_v1(sess, payload):
+    msg = open_json(sess, payload)
+    return msg["file_id"], msg["index"], base64.b64decode(msg["data"])
+
+
+def _run(name, encode, decode, chunk_size, data, sess):
+    fid = str(uuid.uuid4())
+    chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+
+    t0 = time.perf_counter()
+    frames = [encode(sess, fid, i, c) for i, c in enumerate(chunks)]
+    t_enc = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for f in frames:
+        decode(sess, f)
+    t_dec = time.perf_counter() - t0
+
+    mb = len(data) / 1e6
+    wire = sum(len(f) for f in frames)
+    print(f"{name:>4} {chunk_size // 1024:>6} KB {mb / t_enc:>12.1f} {mb / t_dec:>12.1f} "
+          f"{wire / len(data):>10.3f}x")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n")[3])
+    ap.add_argument("--mb", type=int, default=64, help="file size to push through")
+    args = ap.parse_args()
+
+    sess = AEADSession(os.urandom(32))
+    data = os.urandom(args.mb * 1024 * 1024)
+    print(f"{'wire':>4} {'chunk':>9} {'encode MB/s':>12} {'decode MB/s':>12} {'overhead':>11}")
+    _run("v1", encode_v1, _decode_v1, V1_CHUNK_SIZE, data, sess)
+    _run("v2", encode_v2, decode_v2, V2_CHUNK_SIZE, data, sess)
+
+
+if __name__ == "__main__":
+    main()
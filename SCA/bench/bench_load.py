@@ -0,0 +1,337 @@
+#!/usr/bin/env python
+"""
+bench/bench_load.py
+───────────────────
+End-to-end load test: simulated users (core/headless_client.py) log in to
+a running server, then drive a mix of CIPH, BCAST and FILE_DATA traffic.
+
+Reports the connection rate and login latency, message latency
+percentiles (send → decrypted at the recipient), throughput, and the
+server's RSS, summed over its worker and auth-pool processes.
+
+The bench users are `<prefix>00000 …` with stub USB tokens (serial
+"BENCH-<user>", digest = its SHA-256) written straight to users.db, so no
+USB stick is involved.  Create them once, with the server stopped or
+running:
+
+    python -m bench.bench_load --create-users 2000
+    python secure_chat_server.py --engine asyncio &
+    python -m bench.bench_load --users 2000 --procs 4 --duration 30 --mix ciph=80,bcast=5,file=1
+    python -m bench.bench_load --drop-users
+"""
+import argparse, hashlib, multiprocessing, os, random, sqlite3, threading, time
+from concurrent.futures import ThreadPoolExecutor
+
+from core.headless_client import HeadlessClient, LoginError, ServerBusy, SERVER_CERT
+from utils import db_access
+from utils.db_setup import init_user_db, _hash_password
+
+PREFIX        = "bench"
+PASSWORD      = "bench-pass"
+HEARTBEAT     = 20               # seconds between PINGs to idle bench sessions
+SETTLE_SECS   = 2.0              # after ramp-up, for the last KEYPUBs to arrive
+DRAIN_SECS    = 3.0              # after the run, for messages still in flight
+RSS_EVERY     = 0.5
+
+
+# ── bench users ─────────────────────────────────────────────────────
+def bench_name(i: int, prefix: str = PREFIX) -> str:
+    return f"{prefix}{i:05d}"
+
+def usb_token(username: str) -> tuple[str, str]:
+    """Stub USB token: what the USB picker would read off the user's stick."""
+    serial = f"BENCH-{username}"
+    return serial, hashlib.sha256(serial.encode()).hexdigest()
+
+def create_users(n: int, prefix: str = PREFIX, password: str = PASSWORD) -> None:
+    init_user_db()
+    blob = _hash_password(password)                  # one PBKDF2 run shared by all
+    rows = [bench_name(i, prefix) for i in range(n)]
+    with db_access.transaction() as conn:
+        for name in rows:
+            try:
+                conn.execute(db_access.SQL_INSERT_USER, (name, blob))
+            except sqlite3.IntegrityError:
+                conn.execute(db_access.SQL_SET_PASSWORD, (blob, name))
+            conn.execute(db_access.SQL_SET_USB, (*usb_token(name), name))
+            conn.execute(db_access.SQL_USB_SET_FAILS, (0, 0, name))
+    print(f"{n} bench users ready ({rows[0]} … {rows[-1]}), password {password!r}")
+
+def drop_users(prefix: str = PREFIX) -> None:
+    gone = 0
+    for name in db_access.usernames():
+        if name.startswith(prefix) and name[len(prefix):].isdigit():
+            gone += db_access.delete_user(name)
+    print(f"{gone} bench users removed")
+
+
+# ── server RSS (Linux /proc) ────────────────────────────────────────
+def find_server_pids() -> list[int]:
+    pids = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit() or int(entry) == os.getpid():
+            continue
+        try:
+            with open(f"/proc/{entry}/cmdline", "rb") as f:
+                if b"secure_chat_server.py" in f.read():
+                    pids.append(int(entry))
+        except OSError:
+            pass
+    return pids
+
+def _descendants(pid: int) -> list[int]:
+    out, todo = [], [pid]
+    while todo:
+        p = todo.pop()
+        out.append(p)
+        try:
+            for tid in os.listdir(f"/proc/{p}/task"):
+                with open(f"/proc/{p}/task/{tid}/children") as f:
+                    todo.extend(int(c) for c in f.read().split())
+        except OSError:
+            pass
+    return out
+
+def server_rss(roots: list[int]) -> tuple[float, int]:
+    """(MB resident, process count) over *roots* and all their children."""
+    procs = {p for r in roots for p in _descendants(r)}
+    kb = 0
+    for p in procs:
+        try:
+            with open(f"/proc/{p}/status") as f:
+                kb += next(int(l.split()[1]) for l in f if l.startswith("VmRSS:"))
+        except (OSError, StopIteration):
+            pass
+    return kb / 1024, len(procs)
+
+
+# ── one load process ────────────────────────────────────────────────
+def _percentiles(samples: list[float], qs=(50, 95, 99)) -> dict[int, float]:
+    data = sorted(samples)
+    if not data:
+        return {q: 0.0 for q in qs}
+    return {q: data[min(len(data) - 1, int(len(data) * q / 100))] for q in qs}
+
+def _login(name: str, args, on_message, on_file_data):
+    """(client or None, login ms, BUSY replies seen, error text or None)."""
+    busy = 0
+    for _ in range(args.busy_retries + 1):
+        client = HeadlessClient(name, args.password, usb_token(name), args.host, args.port,
+                                cafile=None if args.no_verify else SERVER_CERT,
+                                on_message=on_message, on_file_data=on_file_data)
+        t0 = time.perf_counter()
+        try:
+            client.connect()
+        except ServerBusy as e:
+            busy += 1
+            time.sleep(e.retry_after * random.uniform(0.5, 1.0))
+            continue
+        except (LoginError, OSError) as e:
+            return None, None, busy, str(e)[:60]
+        return client, (time.perf_counter() - t0) * 1000, busy, None
+    return None, None, busy, "still BUSY after retries"
+
+def _run_slice(names: list[str], args, ramp_done, results) -> None:
+    """Log in *names*, wait for every process to finish ramping, drive traffic."""
+    lock = threading.Lock()
+    stats = {"login_ms": [], "busy": 0, "failed": 0, "errors": {},
+             "lat": {"CIPH": [], "BCAST": []}, "sent": {"CIPH": 0, "BCAST": 0, "FILE": 0},
+             "file_sent": 0, "file_recv": 0, "send_errors": 0}
+
+    def on_message(kind, sender, text):
+        sent_ns = int(text.split(" ", 1)[0])
+        with lock:
+            stats["lat"][kind].append((time.monotonic_ns() - sent_ns) / 1e6)
+
+    def on_file_data(sender, file_id, n):
+        with lock:
+            stats["file_recv"] += n
+
+    clients = []
+    stop = threading.Event()
+    def heartbeat():                                 # from the start: ramp-up can be long
+        while not stop.wait(HEARTBEAT):
+            for c in list(clients):
+                try:
+                    c.ping()
+                except OSError:
+                    pass
+    threading.Thread(target=heartbeat, daemon=True).start()
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(args.connect_concurrency) as pool:
+        for client, ms, busy, err in pool.map(
+                lambda n: _login(n, args, on_message, on_file_data), names):
+            stats["busy"] += busy
+            if client is None:
+                stats["failed"] += 1
+                stats["errors"][err] = stats["errors"].get(err, 0) + 1
+            else:
+                clients.append(client)
+                stats["login_ms"].append(ms)
+    stats["ramp_secs"] = time.perf_counter() - t0
+    ramp_done.wait()
+    time.sleep(SETTLE_SECS)
+
+    kinds, weights = zip(*args.mix.items())
+    blob = os.urandom(args.file_kb * 1024)
+    pad = "x" * max(0, args.msg_bytes - 20)
+    interval = 1.0 / (args.rate * len(clients)) if clients else 0
+    t_start = time.perf_counter()
+    next_at = t_start
+    while clients and time.perf_counter() - t_start < args.duration:
+        client = random.choice(clients)
+        kind = random.choices(kinds, weights)[0]
+        peers = client.peers
+        try:
+            if kind == "BCAST":
+                client.send_broadcast(f"{time.monotonic_ns()} {pad}")
+            elif peers and kind == "CIPH":
+                client.send_private(random.choice(peers), f"{time.monotonic_ns()} {pad}")
+            elif peers and kind == "FILE":
+                client.send_file(random.choice(peers), blob)
+                stats["file_sent"] += len(blob)
+            else:
+                continue
+            stats["sent"][kind] += 1
+        except (OSError, KeyError):
+            stats["send_errors"] += 1
+        next_at += interval
+        delay = next_at - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+    stats["run_secs"] = time.perf_counter() - t_start
+    time.sleep(DRAIN_SECS)
+    stop.set()
+    for c in clients:
+        c.close()
+    stats["connected"] = len(clients)
+    results.put(stats)
+
+
+# ── driver ──────────────────────────────────────────────────────────
+def _parse_mix(text: str) -> dict[str, float]:
+    mix = {}
+    for part in text.split(","):
+        kind, _, weight = part.partition("=")
+        kind = kind.strip().upper()
+        if kind not in ("CIPH", "BCAST", "FILE"):
+            raise argparse.ArgumentTypeError(f"unknown traffic kind {kind!r}")
+        mix[kind] = float(weight or 1)
+    return mix
+
+def _merge(parts: list[dict]) -> dict:
+    total = {"login_ms": [], "busy": 0, "failed": 0, "errors": {}, "connected": 0,
+             "lat": {"CIPH": [], "BCAST": []}, "sent": {"CIPH": 0, "BCAST": 0, "FILE": 0},
+             "file_sent": 0, "file_recv": 0, "send_errors": 0, "ramp_secs": 0.0, "run_secs": 0.0}
+    for p in parts:
+        total["login_ms"] += p["login_ms"]
+        for k in ("busy", "failed", "connected", "file_sent", "file_recv", "send_errors"):
+            total[k] += p[k]
+        for k in ("ramp_secs", "run_secs"):
+            total[k] = max(total[k], p[k])
+        for k, v in p["lat"].items():
+            total["lat"][k] += v
+        for k, v in p["sent"].items():
+            total["sent"][k] += v
+        for k, v in p["errors"].items():
+            total["errors"][k] = total["errors"].get(k, 0) + v
+    return total
+
+def _report(r: dict, args, rss: dict) -> None:
+    lp = _percentiles(r["login_ms"])
+    run = max(r["run_secs"], 1e-9)
+    delivered = sum(len(v) for v in r["lat"].values())
+    print(f"users       {args.users} in {args.procs} process(es): {r['connected']} logged in, "
+          f"{r['failed']} failed, {r['busy']} BUSY retries")
+    for err, n in r["errors"].items():
+        print(f"            {n} x {err}")
+    print(f"connect     {r['connected'] / max(r['ramp_secs'], 1e-9):.1f} logins/s   "
+          f"login p50 {lp[50]:.1f} ms  p95 {lp[95]:.1f} ms  p99 {lp[99]:.1f} ms")
+    print(f"traffic     {run:.1f}s: CIPH {r['sent']['CIPH']}, BCAST {r['sent']['BCAST']}, "
+          f"FILE {r['sent']['FILE']} ({r['file_sent'] / 1e6:.1f} MB), "
+          f"{r['send_errors']} send errors")
+    print(f"throughput  {sum(r['sent'].values()) / run:.0f} msg/s sent, "
+          f"{delivered / run:.0f} deliveries/s, "
+          f"{r['file_recv'] / 1e6 / run:.2f} MB/s file data received")
+    for kind, lat in r["lat"].items():
+        if lat:
+            p = _percentiles(lat, (50, 95, 99, 100))
+            print(f"latency     {kind:<5} p50 {p[50]:.2f} ms  p95 {p[95]:.2f} ms  "
+                  f"p99 {p[99]:.2f} ms  max {p[100]:.2f} ms  ({len(lat)} delivered)")
+    if rss:
+        print(f"server RSS  idle {rss['idle']:.1f} MB, peak {rss['peak']:.1f} MB, "
+              f"end {rss['end']:.1f} MB ({rss['procs']} processes)")
+    else:
+        print("server RSS  n/a (no local server process found)")
+
+def run(args) -> None:
+    roots = [args.server_pid] if args.server_pid else find_server_pids()
+    rss = {}
+    if roots and os.path.isdir("/proc"):
+        rss["idle"], rss["procs"] = server_rss(roots)
+        rss["peak"] = rss["idle"]
+    done = threading.Event()
+    def sample():
+        while not done.wait(RSS_EVERY):
+            mb, rss["procs"] = server_rss(roots)
+            rss["peak"] = max(rss["peak"], mb)
+    if rss:
+        threading.Thread(target=sample, daemon=True).start()
+
+    names = [bench_name(i, args.prefix) for i in range(args.users)]
+    ctx = multiprocessing.get_context()
+    ramp_done = ctx.Barrier(args.procs)
+    results = ctx.Queue()
+    procs = [ctx.Process(target=_run_slice, args=(names[i::args.procs], args, ramp_done, results),
+                         name=f"load-{i}")
+             for i in range(args.procs)]
+    for p in procs:
+        p.start()
+    parts = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    done.set()
+    if rss:
+        rss["end"], rss["procs"] = server_rss(roots)
+    _report(_merge(parts), args, rss)
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n")[3])
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=4444)
+    ap.add_argument("--no-verify", action="store_true",
+                    help="skip pinning to utils/cert/server_cert.pem (throwaway test certs)")
+    ap.add_argument("--users", type=int, default=100, help="simulated users to log in")
+    ap.add_argument("--procs", type=int, default=1,
+                    help="load-generator processes (a few hundred users each is plenty)")
+    ap.add_argument("--connect-concurrency", type=int, default=16, metavar="N",
+                    help="logins in flight per process")
+    ap.add_argument("--busy-retries", type=int, default=10, metavar="N",
+                    help="retries per user after a BUSY reply")
+    ap.add_argument("--duration", type=float, default=10, metavar="SECS")
+    ap.add_argument("--rate", type=float, default=1.0, metavar="MSGS",
+                    help="messages per user per second")
+    ap.add_argument("--mix", type=_parse_mix, default=_parse_mix("ciph=90,bcast=10"),
+                    help="traffic weights, e.g. ciph=80,bcast=15,file=5")
+    ap.add_argument("--msg-bytes", type=int, default=64, help="chat message size")
+    ap.add_argument("--file-kb", type=int, default=256, help="size of each file send")
+    ap.add_argument("--server-pid", type=int, default=None,
+                    help="server process for RSS (default: found by command line)")
+    ap.add_argument("--prefix", default=PREFIX, help="bench user name prefix")
+    ap.add_argument("--password", default=PASSWORD)
+    ap.add_argument("--create-users", type=int, metavar="N",
+                    help="write N bench users with stub USB tokens to users.db and exit")
+    ap.add_argument("--drop-users", action="store_true",
+                    help="remove the bench users from users.db and exit")
+    args = ap.parse_args()
+    if args.create_users:
+        create_users(args.create_users, args.prefix, args.password)
+    elif args.drop_users:
+        drop_users(args.prefix)
+    else:
+        run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+# core/headless_client.py
+"""
+core/headless_client.py
+=======================
+GUI-free Secure-Chat client: same wire protocol as secure_chat_client*.py,
+no Tk, no USB scan.  Meant for load tests (bench/bench_load.py) and scripts.
+
+• The USB factor is passed in as a (serial, digest) token, as the USB
+  picker would produce it; see bench_load's stub tokens.
+• Pairwise keys are derived lazily, the first time a peer is used.  With
+  thousands of users online, deriving for every KEYPUB would cost O(n²)
+  ECDH operations before a single message moves.
+• One reader thread per client.  Callbacks run on it, so they must be quick.
+"""
+from __future__ import annotations
+import base64, logging, os, socket, ssl, threading, uuid
+from typing import Callable, Dict, Optional, Tuple
+
+from cryptography.hazmat.primitives import serialization
+
+from security import (
+    AEADSession, GroupSession, MessageIds, DedupWindow,
+    generate_ecdh_keypair, derive_shared_key
+)
+from security.file_wire import V2_CHUNK_SIZE, encode_v2, decode_v2
+from utils.tls_setup import configure_tls_context
+
+logger = logging.getLogger("secure_chat.headless_client")
+
+MAX_MSG_LEN = 64 * 1024
+SERVER_CERT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                           "utils", "cert", "server_cert.pem")
+_KDF_INFO   = b"SecureChat AES-GCM"
+
+
+class LoginError(Exception):
+    """The server refused the login (wrong password, bad token, locked)."""
+
+class ServerBusy(LoginError):
+    """`BUSY <secs>`: the password-check queue is full - retry after *retry_after*."""
+    def __init__(self, retry_after: int):
+        super().__init__(f"server busy, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class HeadlessClient:
+    """
+    One logged-in session.  `connect()` runs TLS + password + USB token +
+    KEYPUB and starts the reader; then use send_private / send_broadcast /
+    send_file.  Incoming traffic is reported through the callbacks:
+
+      on_message(kind, sender, text)      kind "CIPH" or "BCAST", new IDs only
+      on_file_data(sender, file_id, n)    one FILE_DATA chunk of n bytes
+      on_close()                          the connection ended
+    """
+
+    def __init__(self, username: str, password: str, usb_token: Tuple[str, str],
+                 host: str = "127.0.0.1", port: int = 4444, cafile: str | None = SERVER_CERT,
+                 on_message: Callable[[str, str, str], None] | None = None,
+                 on_file_data: Callable[[str, str, int], None] | None = None,
+                 on_close: Callable[[], None] | None = None):
+        self.username, self.password, self.usb_token = username, password, usb_token
+        self.host, self.port, self.cafile = host, port, cafile
+        self.on_message, self.on_file_data, self.on_close = on_message, on_file_data, on_close
+        self.sock: ssl.SSLSocket | None = None
+        self.priv, pub = generate_ecdh_keypair()
+        self.keypub = base64.b64encode(pub.public_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PublicFormat.SubjectPublicKeyInfo))
+        self.online: set[str] = set()
+        self._presence_seq: int | None = None            # last JOIN/LEAVE seq applied
+        self.group = GroupSession()
+        self.msg_ids = MessageIds()
+        self._peer_pubs: Dict[str, bytes] = {}           # user → PEM, as announced
+        self._sessions: Dict[str, AEADSession] = {}      # user → pairwise session (lazy)
+        self._dedup: Dict[Tuple[str, str], DedupWindow] = {}
+        self._keys_lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._reader: threading.Thread | None = None
+
+    # ── connection ────────────────────────────────────────────────────
+    def connect(self, timeout: float = 30.0) -> None:
+        """Open TLS and log in; raises LoginError / ServerBusy / OSError."""
+        ctx = configure_tls_context(certfile=None, keyfile=None,
+                                    purpose=ssl.Purpose.SERVER_AUTH, cafile=self.cafile)
+        raw = socket.create_connection((self.host, self.port), timeout=timeout)
+        raw.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock = ctx.wrap_socket(raw, server_hostname=self.host)
+        try:
+            self._login()
+        except BaseException:
+            self.sock.close()
+            raise
+        self.sock.settimeout(None)
+        self._reader = threading.Thread(target=self._recv_loop, daemon=True,
+                                        name=f"hc-{self.username}")
+        self._reader.start()
+
+    def _login(self) -> None:
+        self._send(f"{self.username}:{self.password}".encode())
+        reply = self._recv()
+        if reply.startswith(b"BUSY"):
+            raise ServerBusy(int(reply.split()[1]))
+        if reply != b"USBREQ":
+            raise LoginError(reply.decode(errors="replace") or "connection closed")
+        self._send(f"{self.usb_token[0]}:{self.usb_token[1]}".encode())
+        reply = self._recv()
+        if reply != b"SUCCESS":
+            raise LoginError(reply.decode(errors="replace") or "connection closed")
+        self._send(b"KEYPUB " + self.keypub)
+        reply = self._recv()
+        if reply != b"SUCCESS":
+            raise LoginError(reply.decode(errors="replace") or "connection closed")
+
+    def close(self) -> None:
+        if self.sock is None:
+            return
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+    # ── framing ───────────────────────────────────────────────────────
+    def _send(self, payload: bytes) -> None:
+        with self._send_lock:
+            self.sock.sendall(len(payload).to_bytes(4, "big") + payload)
+
+    def _read_exact(self, n: int) -> Optional[bytearray]:
+        buf = bytearray(n)
+        view, got = memoryview(buf), 0
+        while got < n:
+            k = self.sock.recv_into(view[got:])
+            if not k:
+                return None
+            got += k
+        return buf
+
+    def _recv(self) -> bytes:
+        """One frame's payload; b"" once the server has closed the connection."""
+        hdr = self._read_exact(4)
+        if hdr is None:
+            return b""
+        length = int.from_bytes(hdr, "big")
+        if length <= 0 or length > MAX_MSG_LEN:
+            raise ConnectionError(f"bad frame length {length}")
+        return bytes(self._read_exact(length) or b"")
+
+    def ping(self) -> None:
+        """Keep an idle session inside the server's read timeout."""
+        self._send(b"PING")
+
+    # ── keys ──────────────────────────────────────────────────────────
+    def session(self, peer: str) -> AEADSession | None:
+        """Pairwise session with *peer*, derived on first use; None if no KEYPUB yet."""
+        with self._keys_lock:
+            sess = self._sessions.get(peer)
+            if sess is None and peer in self._peer_pubs:
+                key = derive_shared_key(self.priv, base64.b64decode(self._peer_pubs[peer]),
+                                        b"", _KDF_INFO)
+                sess = self._sessions[peer] = AEADSession(key)
+        return sess
+
+    @property
+    def peers(self) -> list[str]:
+        """Users whose KEYPUB we hold - the ones we can message."""
+        with self._keys_lock:
+            return list(self._peer_pubs)
+
+    def _is_new(self, peer: str, channel: str, msg_id: bytes) -> bool:
+        window = self._dedup.get((peer, channel))
+        if window is None:
+            window = self._dedup[(peer, channel)] = DedupWindow()
+        return window.accept(msg_id)
+
+    def _members_changed(self) -> None:
+        """New sender key when the set of peers changed (we are not our own peer)."""
+        self.group.update_members(u for u in self.online if u != self.username)
+
+    # ── outgoing ──────────────────────────────────────────────────────
+    def send_private(self, peer: str, text: str) -> bytes:
+        """CIPH to *peer*; returns the message ID."""
+        sess = self.session(peer)
+        if sess is None:
+            raise KeyError(f"no key for {peer}")
+        mid = self.msg_ids.next(peer).encode()
+        self._send(b"CIPH " + self.username.encode() + b" " + peer.encode() + b" " +
+                   mid + b" " + base64.b64encode(sess.encrypt(text, mid)))
+        return mid
+
+    def send_broadcast(self, text: str) -> bytes:
+        """BCAST to everyone, handing out the sender key (SKEY) where needed first."""
+        for peer in self.group.undelivered(self.peers):
+            sess = self.session(peer)
+            if sess is not None:
+                self._send(b"SKEY " + self.username.encode() + b" " + peer.encode() + b" " +
+                           base64.b64encode(self.group.wrap_for(peer, sess)))
+        mid = self.msg_ids.next("Everyone").encode()
+        self._send(b"BCAST " + self.username.encode() + b" " + mid + b" " +
+                   base64.b64encode(self.group.seal(text, mid)))
+        return mid
+
+    def send_file(self, peer: str, data: bytes) -> str:
+        """Stream *data* to *peer* as v2 FILE_DATA chunks (no offer/accept round)."""
+        sess = self.session(peer)
+        if sess is None:
+            raise KeyError(f"no key for {peer}")
+        file_id = str(uuid.uuid4())
+        prefix = b"FILE_DATA " + self.username.encode() + b" " + peer.encode() + b" "
+        view = memoryview(data)
+        for idx, off in enumerate(range(0, len(data), V2_CHUNK_SIZE)):
+            self._send(prefix + encode_v2(sess, file_id, idx, view[off:off + V2_CHUNK_SIZE]))
+        return file_id
+
+    # ── incoming ──────────────────────────────────────────────────────
+    def _recv_loop(self) -> None:
+        try:
+            while True:
+                data = self._recv()
+                if not data:
+                    break
+                self._handle(data)
+        except (OSError, ValueError) as e:             # ValueError: closed under us
+            logger.debug("%s: connection lost: %s", self.username, e)
+        finally:
+            if self.on_close is not None:
+                self.on_close()
+
+    def _handle(self, data: bytes) -> None:
+        kind = data[:data.find(b" ")] if b" " in data else data
+        if kind == b"CIPH":
+            _, sender_b, recipient_b, mid_b, blob_b64 = data.split(b" ", 4)
+            sender = sender_b.decode()
+            sess = self.session(sender)
+            if sess is None or recipient_b.decode() != self.username:
+                return                                # no ACK: the server keeps it
+            pt = sess.decrypt_text(base64.b64decode(blob_b64), mid_b)
+            if pt is None:
+                logger.warning("%s: could not decrypt %s from %s", self.username,
+                               mid_b.decode(errors="replace"), sender)
+                return                                # no ACK for what we could not read
+            self._send(b"ACK " + sender_b + b" " + mid_b)
+            if self._is_new(sender, "CIPH", mid_b) and self.on_message:
+                self.on_message("CIPH", sender, pt)
+        elif kind == b"BCAST":
+            _, sender_b, mid_b, blob_b64 = data.split(b" ", 3)
+            sender = sender_b.decode()
+            pt = self.group.open(sender, base64.b64decode(blob_b64), mid_b)
+            if pt is not None and self._is_new(sender, "BCAST", mid_b) and self.on_message:
+                self.on_message("BCAST", sender, pt)
+        elif kind == b"FILE_DATA":
+            _, sender_b, _, payload = data.split(b" ", 3)
+            sender = sender_b.decode()
+            sess = self.session(sender)
+            decoded = decode_v2(sess, payload) if sess is not None else None
+            if decoded is not None and self.on_file_data:
+                self.on_file_data(sender, decoded[0], len(decoded[2]))
+        elif kind == b"SKEY":
+            _, sender_b, recipient_b, blob_b64 = data.split(b" ", 3)
+            sess = self.session(sender_b.decode())
+            if sess is not None and recipient_b.decode() == self.username:
+                self.group.install(sender_b.decode(), base64.b64decode(blob_b64), sess)
+        elif kind == b"KEYPUB":
+            _, user_b, pub_b64 = data.split(b" ", 2)
+            user = user_b.decode()
+            if user == self.username:
+                return
+            with self._keys_lock:
+                if self._peer_pubs.get(user) != pub_b64:
+                    self._peer_pubs[user] = pub_b64
+                    self._sessions.pop(user, None)    # re-derived on next use
+                    self.group.forget_delivery(user)
+        elif kind == b"USERS":
+            _, seq, csv = data.decode().split(" ", 2)
+            self.online = {u for u in csv.split(",") if u}
+            self._presence_seq = int(seq)
+            with self._keys_lock:                     # left while we were out of step
+                for user in set(self._peer_pubs) - self.online:
+                    self._peer_pubs.pop(user, None)
+                    self._sessions.pop(user, None)
+            self._members_changed()
+        elif kind in (b"JOIN", b"LEAVE"):
+            _, seq, user = data.decode().split(" ", 2)
+            if self._presence_seq is None or int(seq) != self._presence_seq + 1:
+                if self._presence_seq is not None:
+                    logger.info("%s: presence gap (%s after %s) - resyncing",
+                                self.username, seq, self._presence_seq)
+                    self._presence_seq = None
+                    self._send(b"USERS?")
+                return                                # the snapshot supersedes this delta
+            self._presence_seq = int(seq)
+            if kind == b"JOIN":
+                self.online.add(user)
+            else:
+                self.online.discard(user)
+                with self._keys_lock:
+                    self._peer_pubs.pop(user, None)
+                    self._sessions.pop(user, None)
+            self._members_changed()
@@ -0,0 +1,43 @@
+# core/test_headless_client.py
+import pytest
+
+from core.headless_client import HeadlessClient
+
+
+@pytest.fixture
+def client():
+    c = HeadlessClient("alice", "pw", ("serial", "digest"))
+    c.sent = []
+    c._send = c.sent.append
+    return c
+
+
+def test_self_is_not_a_group_member(client):
+    client._handle(b"USERS 4 alice,bob")
+    client._handle(b"JOIN 5 carol")
+    assert client.online == {"alice", "bob", "carol"}
+    assert client.group._members == {"bob", "carol"}
+
+
+def test_deltas_apply_in_sequence(client):
+    client._handle(b"USERS 4 alice,bob")
+    client._handle(b"JOIN 5 carol")
+    client._handle(b"LEAVE 6 bob")
+    assert client.online == {"alice", "carol"} and client.sent == []
+
+
+def test_gap_asks_for_a_snapshot(client):
+    client._handle(b"USERS 4 alice,bob")
+    client._handle(b"JOIN 6 carol")                  # 5 went missing
+    client._handle(b"LEAVE 7 bob")                   # ignored until the snapshot
+    assert client.sent == [b"USERS?"] and client.online == {"alice", "bob"}
+    client._handle(b"USERS 7 alice,carol")
+    client._handle(b"JOIN 8 dave")
+    assert client.online == {"alice", "carol", "dave"} and client.sent == [b"USERS?"]
+
+
+def test_snapshot_drops_keys_of_users_gone(client):
+    client._handle(b"USERS 1 alice,bob")
+    client._handle(b"KEYPUB bob BOBPUB")
+    client._handle(b"USERS 3 alice")
+    assert client.peers == []
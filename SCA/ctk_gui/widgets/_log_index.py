@@ -0,0 +1,238 @@
+"""
+_log_index
+==========
+
+Line-offset index over logs/secure_chat.log and its rotated siblings
+(secure_chat.log.5 … .1, oldest first), for the virtualized FullLogTab.
+
+• Each file is memory-mapped; only line start offsets are kept (8 bytes a
+  line), so any window of lines is a slice away without reading the rest.
+• `refresh()` indexes whatever was appended since the last call and starts
+  over when the live file has rotated.  It is meant for a background
+  thread: readers work on a snapshot and never wait for a rebuild.
+• Lines are numbered across the whole chain; `find_time` and `search`
+  cover every file.  Both the text format and JSON lines are understood.
+"""
+
+from __future__ import annotations
+import bisect, datetime, json, mmap, pathlib, re, threading, time
+from array import array
+
+MAX_ROTATED = 5                       # RotatingFileHandler backupCount in logging_config
+_PUBLISH_EVERY = 65536                # lines indexed between progress updates
+_TEXT_TS = re.compile(rb"(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d),(\d{3})")
+_JSON_TS = re.compile(rb'"ts": ?([0-9.]+)')
+_TS_LOOKAHEAD = 64                    # lines scanned for a timestamp (tracebacks have none)
+
+
+def line_time(line: bytes) -> float | None:
+    """Epoch seconds of a log line, or None for continuation lines."""
+    if line.startswith(b"{"):
+        m = _JSON_TS.search(line, 0, 40)
+        return float(m.group(1)) if m else None
+    m = _TEXT_TS.match(line)
+    if not m:
+        return None
+    stamp = datetime.datetime.strptime(m.group(1).decode(), "%Y-%m-%d %H:%M:%S")
+    return stamp.timestamp() + int(m.group(2)) / 1000
+
+
+def display(line: bytes) -> str:
+    """A log line as shown in the viewer: JSON records in the text layout."""
+    text = line.decode("utf-8", errors="replace")
+    if not line.startswith(b"{"):
+        return text
+    try:
+        rec = json.loads(text)
+        stamp = datetime.datetime.fromtimestamp(rec.pop("ts"))
+        head = (f"{stamp:%Y-%m-%d %H:%M:%S},{stamp.microsecond // 1000:03d} - "
+                f"{rec.pop('logger', '?')} - {rec.pop('level', '?')} - {rec.pop('msg', '')}")
+    except (ValueError, KeyError, TypeError):
+        return text
+    extra = " ".join(f"{k}={v}" for k, v in rec.items())
+    return f"{head}  [{extra}]" if extra else head
+
+
+class _IndexedFile:
+    """One mapped file and the start offset of each complete line in it."""
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self.starts = array("Q")
+        self.end = 0                          # just past the last complete line
+        self.size = 0
+        self.ident = None                     # (device, inode) when first opened
+        self._mm: mmap.mmap | None = None
+
+    def grow(self, on_progress=None) -> bool:
+        """Map and index anything new; False if the file was truncated or replaced."""
+        try:
+            st = self.path.stat()
+        except FileNotFoundError:
+            return self.ident is None
+        ident = (st.st_dev, st.st_ino)
+        if self.ident is None:
+            self.ident = ident
+        elif ident != self.ident or st.st_size < self.size:
+            return False
+        if st.st_size == self.size:
+            return True
+        with self.path.open("rb") as f:       # map the file as it is now
+            mm = mmap.mmap(f.fileno(), st.st_size, access=mmap.ACCESS_READ)
+        self._mm, self.size = mm, st.st_size
+        pos, batch = self.end, array("Q")
+        while True:
+            nl = mm.find(b"\n", pos)
+            if nl < 0:
+                break
+            batch.append(pos)
+            pos = nl + 1
+            if len(batch) >= _PUBLISH_EVERY:
+                self.starts.extend(batch)
+                self.end, batch = pos, array("Q")
+                if on_progress:
+                    on_progress()
+        self.starts.extend(batch)
+        self.end = pos
+        return True
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def line(self, i: int) -> bytes:
+        stop = self.starts[i + 1] if i + 1 < len(self.starts) else self.end
+        return self._mm[self.starts[i]:stop].rstrip(b"\r\n")
+
+    def find(self, needle: bytes, start: int) -> int:
+        """Line number of the first match at or after line *start*, or -1."""
+        if start >= len(self.starts):
+            return -1
+        at = self._mm.find(needle, self.starts[start], self.end)
+        return -1 if at < 0 else bisect.bisect_right(self.starts, at) - 1
+
+    def rfind(self, needle: bytes, before: int) -> int:
+        """Line number of the last match in the lines before *before*, or -1."""
+        if before <= 0:
+            return -1
+        stop = self.starts[before] if before < len(self.starts) else self.end
+        at = self._mm.rfind(needle, 0, stop)
+        return -1 if at < 0 else bisect.bisect_right(self.starts, at) - 1
+
+
+class LogChain:
+    """secure_chat.log.N … .1 + secure_chat.log as one sequence of lines."""
+
+    def __init__(self, path: pathlib.Path, rotated: int = MAX_ROTATED):
+        self.path = pathlib.Path(path)
+        self.rotated = rotated
+        self.generation = 0                   # bumped on every rebuild
+        # (files, first global line of each) - swapped whole, read without a lock
+        self._view: tuple[list[_IndexedFile], list[int]] = ([], [])
+        self._lock = threading.Lock()         # one refresher at a time
+
+    # ── indexing ──────────────────────────────────────────────────────
+    def refresh(self) -> None:
+        with self._lock:
+            files = self._view[0]
+            if not files or not files[-1].grow(lambda: self._publish(files)):
+                files = self._rebuild()
+            self._publish(files)
+
+    def _rebuild(self) -> list[_IndexedFile]:
+        paths = [self.path.with_name(f"{self.path.name}.{n}")
+                 for n in range(self.rotated, 0, -1)]
+        files = [_IndexedFile(p) for p in paths if p.exists()] + [_IndexedFile(self.path)]
+        self.generation += 1
+        done: list[_IndexedFile] = []
+        for f in files:
+            done.append(f)
+            f.grow(lambda: self._publish(done))
+            self._publish(done)
+        return files
+
+    def _publish(self, files: list[_IndexedFile]) -> None:
+        offsets, total = [], 0
+        for f in files:
+            offsets.append(total)
+            total += len(f)
+        self._view = (list(files), offsets)
+
+    # ── reading (any thread) ──────────────────────────────────────────
+    def __len__(self) -> int:
+        files, offsets = self._view
+        return offsets[-1] + len(files[-1]) if files else 0
+
+    def paths(self) -> list[pathlib.Path]:
+        return [f.path for f in self._view[0] if f.size]
+
+    @property
+    def file_count(self) -> int:
+        return sum(1 for f in self._view[0] if f.size)
+
+    def lines(self, start: int, count: int) -> list[bytes]:
+        files, offsets = self._view
+        out: list[bytes] = []
+        k = max(0, bisect.bisect_right(offsets, start) - 1)
+        while k < len(files) and len(out) < count:
+            f, base = files[k], offsets[k]
+            i = max(0, start + len(out) - base)
+            while i < len(f) and len(out) < count:
+                out.append(f.line(i))
+                i += 1
+            k += 1
+        return out
+
+    def _time_from(self, n: int) -> float | None:
+        for line in self.lines(n, _TS_LOOKAHEAD):
+            ts = line_time(line)
+            if ts is not None:
+                return ts
+        return None
+
+    def find_time(self, when: float) -> int:
+        """First line logged at or after *when* (epoch seconds)."""
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            ts = self._time_from(mid)
+            if ts is not None and ts < when:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def search(self, needle: bytes, start: int, backwards: bool = False) -> int:
+        """Global line number of the next (or previous) line containing
+           *needle*, beginning after (before) line *start*; -1 if none."""
+        files, offsets = self._view
+        if not files:
+            return -1
+        k = max(0, bisect.bisect_right(offsets, start) - 1)
+        order = range(k, -1, -1) if backwards else range(k, len(files))
+        for j in order:
+            f, base = files[j], offsets[j]
+            if backwards:
+                local = f.rfind(needle, start - base if j == k else len(f))
+            else:
+                local = f.find(needle, start + 1 - base if j == k else 0)
+            if local >= 0:
+                return base + local
+        return -1
+
+
+def parse_time(text: str, now: float | None = None) -> float:
+    """'YYYY-MM-DD HH:MM[:SS]' or 'HH:MM[:SS]' (today) → epoch seconds."""
+    text = text.strip()
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return datetime.datetime.strptime(text, fmt).timestamp()
+        except ValueError:
+            pass
+    today = datetime.date.fromtimestamp(time.time() if now is None else now)
+    for fmt in ("%H:%M:%S", "%H:%M"):
+        try:
+            t = datetime.datetime.strptime(text, fmt).time()
+            return datetime.datetime.combine(today, t).timestamp()
+        except ValueError:
+            pass
+    raise ValueError(f"not a time: {text!r}")
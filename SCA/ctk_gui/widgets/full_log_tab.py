@@ -1,16 +1,25 @@
 from __future__ import annotations
-import pathlib, io
+import pathlib, queue, shutil, threading
 import customtkinter as ctk
 from tkinter import filedialog
 from ctk_gui.ui_theme.utils.style_utils import get_theme_colors
 from ctk_gui.widgets._job_tracker import JobTracker
+from ctk_gui.widgets._log_index import LogChain, display, parse_time
 
 # Path to the secure_chat server log
 LOG_PATH = pathlib.Path(__file__).resolve().parents[2] / "logs" / "secure_chat.log"
 
+INDEX_SECS = 0.3          # how often the indexer looks for new lines
+POLL_MS    = 150          # GUI picks up index progress and search results
+
+
 class FullLogTab(JobTracker):
     """
-    Live viewer that first loads *all* existing log entries, then tails new ones.
+    Viewer for the whole log, rotated files included, that stays responsive
+    with millions of lines: a background thread keeps a line-offset index
+    (ctk_gui/widgets/_log_index.py) and the textbox only ever holds the
+    lines on screen.  Follows new entries unless paused or scrolled up;
+    jump-to-time and search cover every secure_chat.log.N file.
     """
     def __init__(self, master, **kw):
         super().__init__(master, **kw)
@@ -24,32 +33,69 @@ class FullLogTab(JobTracker):
         self.card = ctk.CTkFrame(self, corner_radius=12, fg_color=card_color)
         self.card.grid(row=0, column=0, padx=20, pady=20, sticky="nsew")
 
-        # Toolbar with Pause/Save
+        # Toolbar: Pause/Save, jump-to-time, search
         bar = ctk.CTkFrame(self.card, fg_color="transparent")
-        bar.grid(row=0, column=0, sticky="w")
-        self.btn_pause = ctk.CTkButton(bar, text="Pause", width=100, height=30,
-                                        font=(None, 12, "bold"), corner_radius=6,
-                                        command=self._toggle_pause)
-        self.btn_save  = ctk.CTkButton(bar, text="Save log …", width=100, height=30,
-                                        font=(None, 12, "bold"), corner_radius=6,
-                                        command=self._save_dialog)
+        bar.grid(row=0, column=0, columnspan=2, sticky="we")
+        btn = dict(height=30, font=(None, 12, "bold"), corner_radius=6)
+        self.btn_pause = ctk.CTkButton(bar, text="Pause", width=100,
+                                        command=self._toggle_pause, **btn)
+        self.btn_save  = ctk.CTkButton(bar, text="Save log …", width=100,
+                                        command=self._save_dialog, **btn)
+        self.time_entry = ctk.CTkEntry(bar, width=150, height=30,
+                                       placeholder_text="HH:MM or YYYY-MM-DD HH:MM")
+        self.btn_time  = ctk.CTkButton(bar, text="Go", width=50,
+                                        command=self._jump_to_time, **btn)
+        self.find_entry = ctk.CTkEntry(bar, width=180, height=30, placeholder_text="Search")
+        self.btn_next  = ctk.CTkButton(bar, text="▼", width=36,
+                                        command=lambda: self._search(False), **btn)
+        self.btn_prev  = ctk.CTkButton(bar, text="▲", width=36,
+                                        command=lambda: self._search(True), **btn)
         self.btn_pause.pack(side="left", padx=(0,8))
-        self.btn_save.pack(side="left")
+        self.btn_save.pack(side="left", padx=(0,16))
+        self.time_entry.pack(side="left", padx=(0,4))
+        self.btn_time.pack(side="left", padx=(0,16))
+        self.find_entry.pack(side="left", padx=(0,4))
+        self.btn_next.pack(side="left", padx=(0,4))
+        self.btn_prev.pack(side="left")
+        self.time_entry.bind("<Return>", lambda _e: self._jump_to_time())
+        self.find_entry.bind("<Return>", lambda _e: self._search(False))
+        self.find_entry.bind("<Shift-Return>", lambda _e: self._search(True))
 
-        # Text area for logs
+        # Text area: holds only the visible window; the scrollbar spans the index
+        self._font = ctk.CTkFont(family="Bahnschrift Condensed", size=16)
         self.out = ctk.CTkTextbox(self.card, state="disabled", wrap="none",
-                                  font=("Bahnschrift Condensed", 16))
+                                  font=self._font, activate_scrollbars=False)
         self.out.grid(row=1, column=0, sticky="nsew", pady=(8,0))
+        self.out.tag_config("hit", background="#188781")
+        self.scroll = ctk.CTkScrollbar(self.card, command=self._on_scrollbar)
+        self.scroll.grid(row=1, column=1, sticky="ns", pady=(8,0))
+        self.status = ctk.CTkLabel(self.card, text="Indexing …", anchor="w")
+        self.status.grid(row=2, column=0, columnspan=2, sticky="we")
         self.card.grid_rowconfigure(1, weight=1)
         self.card.grid_columnconfigure(0, weight=1)
 
-        # File and state
-        self._file = None
+        self.out.bind("<Configure>", self._on_resize)
+        self.out.bind("<MouseWheel>", self._on_wheel)
+        self.out.bind("<Button-4>", lambda _e: self._scroll_by(-3))
+        self.out.bind("<Button-5>", lambda _e: self._scroll_by(3))
+        for key, step in (("<Prior>", "-page"), ("<Next>", "page"),
+                          ("<Home>", "home"), ("<End>", "end")):
+            self.out.bind(key, lambda _e, s=step: self._key_scroll(s))
+
+        # View state
+        self._chain = LogChain(LOG_PATH)
         self._paused = False
+        self._top = 0                 # first line on screen
+        self._rows = 30               # lines that fit, updated on resize
+        self._hit: int | None = None  # highlighted search / time match
+        self._shown = (-1, -1, -1, None)   # (top, rows, total, hit) last rendered
+        self._generation = 0
+        self._results: queue.Queue[tuple] = queue.Queue()
+        self._stop = threading.Event()
 
-        # Open and read everything, then start tailing
-        self._open_file()
-        self._after_poll = self.schedule(300, self._poll_file)
+        # Index in the background, then keep up with new entries
+        threading.Thread(target=self._indexer, daemon=True, name="log-index").start()
+        self._after_poll = self.schedule(POLL_MS, self._poll)
 
     def update_theme(self):
         """Re-apply theme colors when mode changes."""
@@ -57,46 +103,142 @@ class FullLogTab(JobTracker):
         self.card.configure(fg_color=colors["fg"])
         self.out.configure(fg_color=colors["fg"], text_color=colors["text"])
 
-    def _open_file(self):
-        try:
-            # Open log and read all existing content
-            self._file = LOG_PATH.open("r", encoding="utf-8", errors="replace")
-            content = self._file.read()
-            for line in content.splitlines():
-                self._append(line)
-            # Seek to end for new entries
-            self._file.seek(0, io.SEEK_END)
-        except Exception as exc:
-            self._append(f"[FullLogTab] Cannot open {LOG_PATH}: {exc}")
-            self._file = None
-
-    def _poll_file(self):
-        if self._file and not self._paused:
-            where = self._file.tell()
-            line = self._file.readline()
-            if not line:
-                self._file.seek(where)
-            else:
-                self._append(line.rstrip())
-        # Schedule next poll
-        self._after_poll = self.schedule(300, self._poll_file)
-
-    def _append(self, txt: str):
-        """Append a line to the textbox, scrolling to end."""
+    def destroy(self):
+        self._stop.set()
+        super().destroy()
+
+    # ---------------------------------------------------------------- indexer
+    def _indexer(self):
+        while not self._stop.is_set():
+            try:
+                self._chain.refresh()
+            except Exception as exc:
+                self._results.put(("error", f"Cannot read {LOG_PATH}: {exc}"))
+            self._stop.wait(INDEX_SECS)
+
+    def _poll(self):
+        while True:
+            try:
+                kind, value = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if kind in ("goto", "found"):
+                self._hit = value
+                self._set_paused(True)
+                self._top = max(0, value - self._rows // 3)
+            elif kind in ("notfound", "error"):
+                self.status.configure(text=value)
+
+        total = len(self._chain)
+        if self._chain.generation != self._generation:     # first index or rotation
+            self._generation = self._chain.generation
+            self._hit = None
+        at_end = self._top + self._rows >= self._shown[2]
+        if not self._paused and at_end:
+            self._top = max(0, total - self._rows)
+        self._render(total)
+        self._after_poll = self.schedule(POLL_MS, self._poll)
+
+    # ---------------------------------------------------------------- render
+    def _render(self, total: int):
+        """Show lines [top, top+rows); skipped when nothing changed."""
+        self._top = max(0, min(self._top, total - self._rows))
+        state = (self._top, self._rows, total, self._hit)
+        if state == self._shown:
+            return
+        self._shown = state
+        lines = self._chain.lines(self._top, self._rows)
         self.out.configure(state="normal")
-        self.out.insert("end", txt + "\n")
+        self.out.delete("1.0", "end")
+        self.out.insert("1.0", "\n".join(display(l) for l in lines))
+        if self._hit is not None and self._top <= self._hit < self._top + len(lines):
+            row = self._hit - self._top + 1
+            self.out.tag_add("hit", f"{row}.0", f"{row}.end")
         self.out.configure(state="disabled")
-        self.out.see("end")
+        if total:
+            self.scroll.set(self._top / total, min(1.0, (self._top + len(lines)) / total))
+        else:
+            self.scroll.set(0.0, 1.0)
+        files = self._chain.file_count
+        self.status.configure(text=f"{total:,} lines in {files} file{'s' * (files != 1)}"
+                                   f"  ·  line {self._top + 1:,}"
+                                   + ("  ·  paused" if self._paused else ""))
+
+    def _scroll_to(self, top: int):
+        self._top = top
+        self._render(len(self._chain))
+
+    def _scroll_by(self, lines: int):
+        self._scroll_to(self._top + lines)
+        return "break"
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self._scroll_to(int(float(amount) * len(self._chain)))
+        elif action == "scroll":
+            step = self._rows if unit == "pages" else 1
+            self._scroll_by(int(amount) * step)
+
+    def _on_wheel(self, event):
+        return self._scroll_by(-3 if event.delta > 0 else 3)
+
+    def _key_scroll(self, step: str):
+        total = len(self._chain)
+        target = {"-page": self._top - self._rows, "page": self._top + self._rows,
+                  "home": 0, "end": total}[step]
+        return self._scroll_by(target - self._top)
+
+    def _on_resize(self, event):
+        rows = max(1, event.height // self._font.metrics("linespace"))
+        if rows != self._rows:
+            self._rows = rows
+            self._render(len(self._chain))
+
+    # ---------------------------------------------------------------- slots
+    def _jump_to_time(self):
+        """Scroll to the first entry logged at or after the time typed in."""
+        try:
+            when = parse_time(self.time_entry.get())
+        except ValueError as exc:
+            self.status.configure(text=str(exc))
+            return
+        threading.Thread(target=lambda: self._results.put(("goto", self._chain.find_time(when))),
+                         daemon=True).start()
+
+    def _search(self, backwards: bool):
+        """Next (or previous) line containing the search text, in any log file."""
+        text = self.find_entry.get()
+        if not text:
+            return
+        start = self._hit if self._hit is not None else (self._top - 1 if not backwards
+                                                         else self._top + self._rows)
+        def run():
+            found = self._chain.search(text.encode("utf-8"), start, backwards)
+            self._results.put(("found", found) if found >= 0
+                              else ("notfound", f"'{text}' not found"))
+        self.status.configure(text=f"Searching for '{text}' …")
+        threading.Thread(target=run, daemon=True).start()
 
     def _toggle_pause(self):
-        """Pause or resume tailing new entries."""
-        self._paused = not self._paused
+        """Pause or resume following new entries."""
+        self._set_paused(not self._paused)
+
+    def _set_paused(self, paused: bool):
+        self._paused = paused
         self.btn_pause.configure(text=("Resume" if self._paused else "Pause"))
+        if not paused:
+            self._hit = None
+            self._scroll_to(len(self._chain))
 
     def _save_dialog(self):
-        """Save current textbox content to a file."""
+        """Save the whole log, rotated files included, oldest first."""
         file = filedialog.asksaveasfilename(defaultextension=".log",
                                             initialfile="secure_chat_full.log")
         if file:
-            with open(file, "w", encoding="utf-8") as f:
-                f.write(self.out.get("1.0", "end-1c"))
+            paths = self._chain.paths()
+            def run():
+                with open(file, "wb") as dst:
+                    for p in paths:
+                        with p.open("rb") as src:
+                            shutil.copyfileobj(src, dst)
+            threading.Thread(target=run, daemon=True).start()
@@ -1,9 +1,160 @@
 #logging_config.py
+"""
+logging_config.py
+=================
+Non-blocking logging for the server and the clients.
+
+• Loggers only enqueue: `secure_chat` carries a single QueueHandler, and a
+  background QueueListener thread does the formatting and file / console
+  I/O.  A slow disk or terminal no longer stalls the thread that logged.
+• The listener drains whatever is queued (up to BATCH_MAX records) and
+  flushes once per batch instead of once per record.
+• Per-module levels, e.g. quieter relay logs with the rest at DEBUG:
+      SECURE_CHAT_LOG_LEVEL="DEBUG,secure_chat.file_wire=INFO"
+  or `set_levels(...)` with the same spec (the server's --log-level).
+• Optional JSON-lines file format (SECURE_CHAT_LOG_FORMAT=json, the
+  server's --log-format): one object per line, ASCII-only, so any payload
+  bytes stay on one parseable line.  The console stays plain text.
+
+      {"ts": 1792182689.123, "level": "INFO", "logger": "secure_chat",
+       "event": "relay", "user": "jamal", "to": "ahmad", "frame": "CIPH",
+       "size": 412, "ms": 0.08, "msg": "Relaying E2E private message ..."}
+
+  `event`, `user`, `addr`, `to`, `frame`, `size` and `ms` appear only when
+  the call passes them, via `extra=event("relay", user=..., ...)`.
+"""
+import atexit
+import json
 import logging
-from logging.handlers import RotatingFileHandler
 import os
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+ROOT_LOGGER = 'secure_chat'
+LEVEL_ENV   = 'SECURE_CHAT_LOG_LEVEL'
+FORMAT_ENV  = 'SECURE_CHAT_LOG_FORMAT'
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+FIELDS      = ('event', 'user', 'addr', 'to', 'frame', 'size', 'ms')
+BATCH_MAX   = 256            # records written between two flushes, at most
+
+_listener = None
+
+
+class _DeferredFlush:
+    """Handler mixin: emit() leaves the data buffered; the listener flushes."""
+    def flush(self):
+        pass
+
+    def flush_now(self):
+        super().flush()
+
+class _FileHandler(_DeferredFlush, RotatingFileHandler):
+    pass
+
+class _ConsoleHandler(_DeferredFlush, logging.StreamHandler):
+    pass
+
+
+class _BatchListener(QueueListener):
+    """QueueListener that writes everything already queued, then flushes once."""
+
+    def _monitor(self):
+        q = self.queue
+        while True:
+            batch = [q.get()]
+            while len(batch) < BATCH_MAX:
+                try:
+                    batch.append(q.get_nowait())
+                except queue.Empty:
+                    break
+            for record in batch:
+                if record is self._sentinel:
+                    self._flush()
+                    return
+                self.handle(record)
+            self._flush()
+
+    def _flush(self):
+        for h in self.handlers:
+            try:
+                h.flush_now()
+            except Exception:
+                h.handleError(None)
+
+
+def event(name, **fields):
+    """`extra=` for a structured record: event("login", user=u, addr=addr)."""
+    return {'event': name, **fields}
+
+
+def _json_value(value):
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value).decode('utf-8', 'backslashreplace')
+    if isinstance(value, tuple) and len(value) >= 2:       # socket address
+        return f"{value[0]}:{value[1]}"
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record; see the module docstring for the keys."""
+
+    def format(self, record):
+        out = {'ts': round(record.created, 3), 'level': record.levelname,
+               'logger': record.name}
+        for key in FIELDS:
+            value = record.__dict__.get(key)
+            if value is not None:
+                out[key] = _json_value(value)
+        out['msg'] = record.getMessage()         # a traceback is already part of it
+        return json.dumps(out, default=str)             # ensure_ascii: one line, 7-bit
+
+
+def set_format(fmt):
+    """'text' or 'json' for the log file (the console is always text)."""
+    if fmt not in ('text', 'json'):
+        raise ValueError(f"unknown log format {fmt!r}")
+    formatter = JsonFormatter() if fmt == 'json' else logging.Formatter(TEXT_FORMAT)
+    for h in _listener.handlers if _listener is not None else ():
+        if isinstance(h, RotatingFileHandler):
+            h.setFormatter(formatter)
+
+
+def set_levels(spec):
+    """Apply a level spec: "INFO", "secure_chat.auth=WARNING", or both,
+       comma-separated.  A bare level applies to the whole `secure_chat` tree.
+       ValueError for an unknown level, before any of the spec is applied."""
+    levels = []
+    for item in filter(None, (s.strip() for s in spec.split(','))):
+        name, _, level = item.rpartition('=')
+        level = level.strip().upper()
+        if not isinstance(logging.getLevelName(level), int):
+            raise ValueError(f"unknown log level {level!r} in {item!r}")
+        levels.append((name.strip() or ROOT_LOGGER, level))
+    for name, level in levels:
+        logging.getLogger(name).setLevel(level)
+
+
+def _restart_after_fork():
+    """A forked child (e.g. the auth pool) has no listener thread - give it one."""
+    global _listener
+    if _listener is None:
+        return
+    q = queue.SimpleQueue()
+    for h in logging.getLogger(ROOT_LOGGER).handlers:
+        if isinstance(h, QueueHandler):
+            h.queue = q
+    _listener = _BatchListener(q, *_listener.handlers, respect_handler_level=True)
+    _listener.start()
+
 
 def setup_logging(level=logging.DEBUG):
+    # Initialize a logger with the name 'secure_chat'
+    logger = logging.getLogger(ROOT_LOGGER)
+    if _listener is not None:               # already set up in this process
+        return logger
+    logger.setLevel(level)
+
     # Get the absolute path of the directory where the current script is located
     base_dir = os.path.dirname(os.path.abspath(__file__))
 
@@ -14,30 +165,53 @@ def setup_logging(level=logging.DEBUG):
     # Define the full path to the log file
     log_file = os.path.join(log_dir, 'secure_chat.log')
 
-    # Initialize a logger with the name 'secure_chat'
-    logger = logging.getLogger('secure_chat')
-    logger.setLevel(level)
-
     #  Rotating file handler with UTF-8 encoding for emoji support
-    file_handler = RotatingFileHandler(
+    file_handler = _FileHandler(
         log_file,
         maxBytes=10**6,
         backupCount=5,
         encoding='utf-8'  # This allows logging emojis!
     )
-    file_handler.setLevel(level)
 
-    # Console handler (stdout)
-    console_handler = logging.StreamHandler()
-    console_handler.setLevel(level)
+    # Console handler (stderr)
+    console_handler = _ConsoleHandler()
 
     # Log format
-    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    formatter = logging.Formatter(TEXT_FORMAT)
     file_handler.setFormatter(formatter)
     console_handler.setFormatter(formatter)
 
-    # Add both handlers
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
-
+    # Levels are decided by the loggers; the handlers write whatever arrives
+    spec = os.environ.get(LEVEL_ENV, '')
+    try:
+        set_levels(spec)
+        bad_spec = None
+    except ValueError as e:                  # a typo must not stop the import
+        logger.setLevel(logging.INFO)
+        bad_spec = e
+    _start_listener(logger, file_handler, console_handler)
+    if bad_spec is not None:
+        logger.warning("Ignoring %s=%r (%s) - logging at INFO", LEVEL_ENV, spec, bad_spec)
+    fmt = os.environ.get(FORMAT_ENV, 'text')
+    try:
+        set_format(fmt.lower())
+    except ValueError as e:                  # handlers already write text
+        logger.warning("Ignoring %s=%r (%s) - logging as text", FORMAT_ENV, fmt, e)
     return logger
+
+
+def _start_listener(logger, *handlers):
+    global _listener
+    q = queue.SimpleQueue()                  # unbounded: enqueueing never blocks
+    logger.addHandler(QueueHandler(q))
+    _listener = _BatchListener(q, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)            # runs before logging's own shutdown
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def stop_logging():
+    """Write out everything still queued and stop the listener thread."""
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
@@ -6,6 +6,12 @@ Secure-Chat Client
 • Login GUI (CustomTkinter)
 • USB 2-factor picker
 • Heartbeat + auto-reconnect (keeps GUI alive)
+• "Everyone" uses a rotating sender key: one BCAST per message, not one CIPH per peer
+• Presence: one USERS snapshot, then numbered JOIN/LEAVE deltas patch the sidebar
+• Message IDs + ACKs: the server re-delivers what we did not ACK, duplicates
+  are dropped by a per-peer window, so reconnecting never loses or repeats
+• Fast reconnect: TLS session resumption + a server session ticket - no
+  password/USB round, same ECDH key, peers keep their derived keys
 """
 
 import os, socket, ssl, sys, threading, time, logging
@@ -15,8 +21,8 @@ from cryptography.hazmat.primitives import serialization
 import queue
 import base64, os                                   
 from security import (                              
-    encrypt_message, decrypt_message,
-    generate_ecdh_keypair, derive_shared_key
+    AEADSession, NonceExhausted, GroupSession,
+    MessageIds, DedupWindow, generate_ecdh_keypair, derive_shared_key
 )
 
 import customtkinter as ctk
@@ -60,9 +66,14 @@ class ChatClient:
         self.username = self.password = ""
         self.tls_ctx: Optional[ssl.SSLContext] = None
         self.sock: Optional[ssl.SSLSocket] = None
+        self.tls_session: Optional[ssl.SSLSession] = None   # for TLS resumption
+        self.ticket: Optional[bytes] = None                 # server session ticket
+        self.ticket_expiry = 0.0                            # time.monotonic()
         self.send_lock = threading.Lock()
         self.running = False       #for controls loops (heartbeat & recv loop)                
         self.recipient = "Everyone"
+        self.online: Dict[str, None] = {}   # ordered set of users the server reports
+        self.presence_seq: Optional[int] = None   # None → waiting for a USERS snapshot
         
 
         
@@ -74,6 +85,12 @@ class ChatClient:
         self.priv, self.pub = generate_ecdh_keypair()
         cm.add_secret(self.priv.private_numbers().private_value.to_bytes(32, "big")) # may goes wrong in app 
         self.peer_keys : Dict[str, bytes] = {} 
+        self.peer_sessions: Dict[str, AEADSession] = {}   # cached AES-GCM context per peer key
+        self.peer_pubs: Dict[str, str] = {}               # KEYPUB behind each derived key
+        self.group = GroupSession()                        # own + peers' sender keys for "Everyone"
+        cm.add_secret(self.group.current()[1])
+        self.msg_ids = MessageIds()                        # outgoing, per conversation
+        self.dedup: Dict[Tuple[str, str], DedupWindow] = {}  # (peer, "CIPH"/"BCAST") → seen IDs
 
         self.peer_keys[self.username] = b""
 
@@ -99,6 +116,7 @@ class ChatClient:
             try:
                 self._open_socket()
                 self._authenticate()
+                self.tls_session = self.sock.session
                 break                        # SUCCESS → out of login loop
             except AuthRetryError as e:
                 messagebox.showerror("Login error", str(e))
@@ -131,9 +149,25 @@ class ChatClient:
         raw = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         raw.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         raw.bind(("0.0.0.0", self.client_port))
-        self.sock = self.tls_ctx.wrap_socket(raw, server_hostname=self.host)
+        self.sock = self.tls_ctx.wrap_socket(raw, server_hostname=self.host,
+                                             session=self.tls_session)
         self.sock.connect((self.host, self.server_port))
-        logger.info("Connected to %s:%s", self.host, self.server_port)
+        logger.info("Connected to %s:%s%s", self.host, self.server_port,
+                    " (TLS session resumed)" if self.sock.session_reused else "")
+
+    def _resume(self) -> bool:
+        """Fast re-login with the session ticket: one round trip, no password/USB.
+           False (server then expects a normal login) if we hold no valid ticket."""
+        if self.ticket is None or time.monotonic() >= self.ticket_expiry:
+            return False
+        ticket, self.ticket = self.ticket, None          # single use
+        self._send_prefixed(b"RESUME " + ticket + b" " + self._keypub_b64())
+        reply = self._recv_prefixed()
+        if reply == b"SUCCESS":
+            logger.info("Session resumed")
+            return True
+        logger.info("Session ticket refused (%s) - full login", reply.decode(errors="replace"))
+        return False
 
     def _authenticate(self):
         # 1) send credentials
@@ -151,6 +185,10 @@ class ChatClient:
             mins = max(1, int(reply.split()[1]) // 60)
             raise AuthRetryError(f"Too many failures. Try again in {mins} minute(s).")
 
+        elif reply.startswith("BUSY"):
+            secs = int(reply.split()[1])
+            raise AuthRetryError(f"Server busy - try again in {secs} second(s).")
+
         else:
             raise RuntimeError("Login rejected")
 
@@ -220,14 +258,16 @@ class ChatClient:
         win.wait_window();return choice[0] if choice else None                               # .wait_window() blocks until closed (until USB selected)
 
     # ---------------- announce pubkey
-    def _send_keypub(self):
-        pub_b64 = base64.b64encode(
+    def _keypub_b64(self) -> bytes:
+        return base64.b64encode(
             self.pub.public_bytes(
                 encoding = serialization.Encoding.PEM,
                 format   = serialization.PublicFormat.SubjectPublicKeyInfo
             )
         )
-        self._send_prefixed(b"KEYPUB " + pub_b64)
+
+    def _send_keypub(self):
+        self._send_prefixed(b"KEYPUB " + self._keypub_b64())
 
     # ── heartbeat ───────────────────────────────────────────────────
     def _heartbeat(self):      #firewalls will silently drop idle TCP connections after a minute or two so we send a ping every 20 seconds to keep the connection alive
@@ -335,8 +375,8 @@ class ChatClient:
                         break
                     raise ConnectionError("EOF")
                 # ---- frame types ----
-                if data.startswith(b"FILE_OFFER ") or data.startswith(b"FILE_CHUNK ") \
-                   or data.startswith(b"FILE_CANCEL ") or data.startswith(b"FILE_COMPLETE "):
+                if data.startswith((b"FILE_OFFER ", b"FILE_ACCEPT ", b"FILE_CHUNK ", b"FILE_DATA ",
+                                    b"FILE_ACK ", b"FILE_RESUME ", b"FILE_CANCEL ", b"FILE_COMPLETE ")):
                     parts  = data.split(b" ", 3)
                     ftype  = parts[0].decode()
                     sender = parts[1].decode()
@@ -344,47 +384,91 @@ class ChatClient:
                     self.file_manager.handle_frame(ftype, sender, blob_b64)
                     continue
 
-                # 1) user-list update
+                if data.startswith(b"TICKET "):      # for the next fast reconnect
+                    _, ticket, lifetime = data.split(b" ", 2)
+                    self.ticket = ticket
+                    self.ticket_expiry = time.monotonic() + int(lifetime) - 5
+                    continue
+
+                # 1) presence: snapshot, then numbered deltas
                 if data.startswith(b"USERS "):
-                    users = data.split(b" ", 1)[1].decode().split(",")
-                    self._ui(self._update_user_list, users)
+                    _, seq, csv = data.decode().split(" ", 2)
+                    self.online = dict.fromkeys(u for u in csv.split(",") if u)
+                    self.presence_seq = int(seq)
+                    self._members_changed()
+                    self._ui(self._update_user_list, list(self.online))
+                    continue
+                if data.startswith((b"JOIN ", b"LEAVE ")):
+                    kind, seq, user = data.decode().split(" ", 2)
+                    if self.presence_seq is None or int(seq) != self.presence_seq + 1:
+                        if self.presence_seq is not None:
+                            logger.info("Presence gap (%s after %s) - resyncing", seq, self.presence_seq)
+                            self.presence_seq = None
+                            self._send_prefixed(b"USERS?")
+                        continue                  # the snapshot supersedes this delta
+                    self.presence_seq = int(seq)
+                    if kind == "JOIN":
+                        self.online[user] = None
+                        self._ui(self._add_user_label, user)
+                    else:
+                        self.online.pop(user, None)
+                        self._ui(self._remove_user_label, user)
+                    self._members_changed()
                     continue
                 if data.startswith(b"KEYPUB "):      # peer pubkey
                     _, user, blob_b64 = data.decode().split(" ", 2)
                     if user == self.username: continue
-                    peer_pub = base64.b64decode(blob_b64)
-                    self.peer_keys[user] = derive_shared_key(
-                        self.priv, peer_pub, b"", b"SecureChat AES-GCM")
-                    cm.add_secret(self.peer_keys[user])
+                    if self.peer_pubs.get(user) != blob_b64:   # resumed peers keep their key
+                        peer_pub = base64.b64decode(blob_b64)
+                        self.peer_keys[user] = derive_shared_key(
+                            self.priv, peer_pub, b"", b"SecureChat AES-GCM")
+                        self.peer_sessions[user] = AEADSession(self.peer_keys[user])
+                        self.peer_pubs[user] = blob_b64
+                        cm.add_secret(self.peer_keys[user])
+                    self.group.forget_delivery(user)       # new pairwise key → resend sender key
+                    self._distribute_sender_key([user])
+                    self.file_manager.on_peer_rekeyed(user) # ask for missing chunks of our transfers
                     if user == self.recipient:
                         self._ui(self.entry.configure, state="normal")
                     continue
     
                 
 
+                if data.startswith(b"SKEY "):         # peer's sender key, pairwise-wrapped
+                    _, sender_b, recipient_b, blob_b64 = data.split(b" ", 3)
+                    sender = sender_b.decode()
+                    sess = self.peer_sessions.get(sender)
+                    if sess is None or recipient_b.decode() != self.username:
+                        continue
+                    self.group.install(sender, base64.b64decode(blob_b64), sess)
+                    continue
+
                 if data.startswith(b"BCAST "):
-                    _, sender_b, blob_b64 = data.split(b" ", 2)
+                    _, sender_b, mid_b, blob_b64 = data.split(b" ", 3)
                     sender = sender_b.decode()
-                    # lookup the same key we used originally
-                    key = self.peer_keys.get(sender)
-                    if not key: 
-                        return
-                    pt = decrypt_message(key, base64.b64decode(blob_b64))
-                    if pt is not None:
+                    pt = self.group.open(sender, base64.b64decode(blob_b64), mid_b)
+                    if pt is not None and self._is_new(sender, "BCAST", mid_b):
                         self._ui(self._display, f"[{sender}] {pt}")
                     continue
 
                 elif data.startswith(b"CIPH "):
-                    _, sender_b, recipient_b, blob_b64 = data.split(b" ", 3)
+                    _, sender_b, recipient_b, mid_b, blob_b64 = data.split(b" ", 4)
 
                     sender    = sender_b.decode()      # <-- keep as str
                     recipient = recipient_b.decode()   # <-- keep as str
                     if recipient != self.username:
                         continue
 
-                    key = self.peer_keys.get(sender)
-                    pt  = decrypt_message(key, base64.b64decode(blob_b64))
-                    if pt is not None:
+                    sess = self.peer_sessions.get(sender)
+                    if sess is None:
+                        continue                   # no ACK: the server keeps it for later
+                    pt  = sess.decrypt_text(base64.b64decode(blob_b64), mid_b)
+                    if pt is None:
+                        logger.warning("Could not decrypt message %s from %s",
+                                       mid_b.decode(errors="replace"), sender)
+                        continue                   # no ACK: only what we could read
+                    self._send_prefixed(b"ACK " + sender_b + b" " + mid_b)
+                    if self._is_new(sender, "CIPH", mid_b):
                         if isinstance(pt, (bytes, bytearray)):
                             pt = pt.decode()
                         self._ui(self._display, f"{sender}: {pt}")
@@ -413,10 +497,17 @@ class ChatClient:
             logger.info("Reconnect attempt %s in %ss …", attempt, wait)
             time.sleep(wait)
             try:
-                self.peer_keys.clear()
-                self.priv, self.pub = generate_ecdh_keypair()
-                self._open_socket(); self._authenticate(); self._send_keypub()
-                self.running = True; self._restart_heartbeat(); return True
+                self.group = GroupSession(); cm.add_secret(self.group.current()[1])
+                self.presence_seq = None
+                # same ECDH keypair: frames the server stored for us while we
+                # were away are sealed to it, and peers need not re-derive
+                self._open_socket()
+                if not self._resume():
+                    self._authenticate()
+                self.tls_session = self.sock.session
+                self.running = True; self._restart_heartbeat()
+                threading.Thread(target=self._recv_loop, daemon=True).start()
+                return True
             except Exception as e:
                 logger.warning("reconnect failed: %s", e)
         return False
@@ -604,19 +695,40 @@ class ChatClient:
 
         cm.wipe()      # flushes clipboard only (no file shredding)
         self.close()   # graceful shutdown
+    def _members_changed(self):
+        """Rotate/hand out the sender key when the set of peers changed."""
+        if self.group.update_members(u for u in self.online if u != self.username):
+            cm.add_secret(self.group.current()[1])
+            self._distribute_sender_key()
+
     def _update_user_list(self, users):
+        """Full rebuild - only for a USERS snapshot (login, reconnect, resync)."""
         for w in self.user_list.winfo_children():
-            w.pack_forget()
+            w.destroy()
         self.user_labels = {}
         for u in ["Everyone", self.username] + [x for x in users if x != self.username]:
-            lbl = ctk.CTkLabel(self.user_list, text=u, fg_color="#212121",
-                               text_color="white", anchor="w", padx=10)
-            lbl.pack(pady=2, padx=2, anchor="w", fill="x")
-            lbl.bind("<Button-1>", lambda e, usr=u: self._set_recipient(usr))
-            self.user_labels[u] = lbl
+            self._add_user_label(u)
         if self.recipient not in users + ["Everyone"]:
             self._set_recipient("Everyone")
 
+    def _add_user_label(self, user):
+        if user in self.user_labels:
+            return
+        lbl = ctk.CTkLabel(self.user_list, text=user, fg_color="#212121",
+                           text_color="white", anchor="w", padx=10)
+        lbl.pack(pady=2, padx=2, anchor="w", fill="x")
+        lbl.bind("<Button-1>", lambda e, usr=user: self._set_recipient(usr))
+        self.user_labels[user] = lbl
+
+    def _remove_user_label(self, user):
+        if user == self.username:
+            return
+        lbl = self.user_labels.pop(user, None)
+        if lbl is not None:
+            lbl.destroy()
+        if self.recipient == user:
+            self._set_recipient("Everyone")
+
     def _set_recipient(self, user):
         # de-highlight old label
         if hasattr(self, "user_labels") and self.recipient in self.user_labels:
@@ -650,6 +762,10 @@ class ChatClient:
         or b'' if not available.
         """
         return self.peer_keys.get(user, b"")
+
+    def get_session(self, user: str) -> Optional[AEADSession]:
+        """Cached AES-GCM context for *user* (None until key exchange is done)."""
+        return self.peer_sessions.get(user)
     
     def _send(self, _=None):
         msg = self.entry.get().strip()
@@ -675,31 +791,36 @@ class ChatClient:
                     )
                     return
 
-                # loop, encrypt once per recipient, send via CIPH route
-                for peer in ready:
-                    key = self.peer_keys[peer]
-                    blob = encrypt_message(key, msg)
-                    frame = (
-                        b"CIPH " +
-                        self.username.encode() + b" " +
-                        peer.encode() + b" " +
-                        base64.b64encode(blob)
-                    )
-                    self._send_prefixed(frame)
+                # sender key first (only peers that lack it), then encrypt once
+                self._distribute_sender_key(ready)
+                mid = self.msg_ids.next("Everyone").encode()
+                try:
+                    sealed = self.group.seal(msg, mid)
+                except NonceExhausted:             # sender key spent: re-key and resend SKEY
+                    self.group.rotate()
+                    self._distribute_sender_key(ready)
+                    sealed = self.group.seal(msg, mid)
+                frame = (
+                    b"BCAST " +
+                    self.username.encode() + b" " + mid + b" " +
+                    base64.b64encode(sealed)
+                )
+                self._send_prefixed(frame)
 
                 shown = f"You: {msg}"
 
             # ── private PM ── (unchanged)
             else:
-                key = self.peer_keys.get(self.recipient)
-                if not key or len(key)!=32:
+                sess = self.peer_sessions.get(self.recipient)
+                if sess is None:
                     messagebox.showerror("Key error", "No key for user")
                     return
-                blob = encrypt_message(key, msg)
+                mid  = self.msg_ids.next(self.recipient).encode()
+                blob = sess.encrypt(msg, mid)
                 frame = (
                     b"CIPH " +
                     self.username.encode() + b" " +
-                    self.recipient.encode() + b" " +
+                    self.recipient.encode() + b" " + mid + b" " +
                     base64.b64encode(blob)
                 )
                 self._send_prefixed(frame)
@@ -709,11 +830,37 @@ class ChatClient:
             self._display(shown)
             self.entry.delete(0, "end")
 
+        except NonceExhausted:
+            logger.error("Key for %s has reached its message limit", self.recipient)
+            messagebox.showerror(
+                "Key limit reached",
+                f"The key shared with {self.recipient} has encrypted its maximum number "
+                "of messages. Restart the client to agree on a new key; message not sent.")
         except Exception as e:
             logger.error("send failed: %s", e)
             messagebox.showerror("Send error", str(e))
             self.master.quit()
 
+    def _is_new(self, peer: str, channel: str, msg_id: bytes) -> bool:
+        """False if this message ID from *peer* was already shown (re-delivery)."""
+        window = self.dedup.get((peer, channel))
+        if window is None:
+            window = self.dedup[(peer, channel)] = DedupWindow()
+        return window.accept(msg_id)
+
+    def _distribute_sender_key(self, peers=None):
+        """Send the current sender key (SKEY) to each peer that does not hold it yet."""
+        if peers is None:
+            peers = [u for u in self.peer_sessions if u != self.username]
+        for peer in self.group.undelivered(peers):
+            sess = self.peer_sessions.get(peer)
+            if sess is None:
+                continue
+            blob = self.group.wrap_for(peer, sess)
+            self._send_prefixed(
+                b"SKEY " + self.username.encode() + b" " +
+                peer.encode() + b" " + base64.b64encode(blob))
+
     def _send_secure(self, target: str, msg: str, key: bytes):
         if target == self.username:
             self._display(f"You (self): {msg}")
@@ -723,9 +870,14 @@ class ChatClient:
             logger.warning("Key for %s not ready - message skipped", target)
             return
 
-        blob  = encrypt_message(key, msg)
+        sess = self.peer_sessions.get(target)      # one session (and nonce budget) per key
+        if sess is None:
+            logger.warning("No session for %s - message skipped", target)
+            return
+        mid   = self.msg_ids.next(target).encode()
+        blob  = sess.encrypt(msg, mid)
         frame = b"CIPH " + self.username.encode() \
-            + b" " + target.encode() \
+            + b" " + target.encode() + b" " + mid \
             + b" " + base64.b64encode(blob)
         self._send_prefixed(frame)
 
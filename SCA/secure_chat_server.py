@@ -6,34 +6,110 @@ Secure-Chat Server
 • Username/password + USB 2-factor
 • 3-strike login throttle (IP-based, RAM-only)
 • Broadcast + private messages
+• Two engines: thread-per-client (default) or a single asyncio loop
+  (`--engine asyncio`) for many thousands of mostly idle sessions
+• Bounded per-client send queues - a slow reader never stalls the others
+• PBKDF2 checks run in a process pool; overload → fast "BUSY" rejection
+• Zero-parse relay: routed frames are forwarded as received, only the
+  header bytes are scanned and payloads never reach the log formatter
+• `--workers N` (POSIX): N processes share the port via SO_REUSEPORT and
+  reach each other's users over a local routing bus (utils/shard_bus.py)
+• Presence as deltas: `USERS <seq> <csv>` once at login (or on `USERS?`),
+  then `JOIN <seq> <user>` / `LEAVE <seq> <user>` per change
+• Store-and-forward: private messages to an offline user are kept (still
+  encrypted, bounded by TTL and quota) and delivered at their next login
+• Acknowledged delivery: a relayed CIPH stays retained until the recipient
+  answers `ACK <sender> <msg_id>`; unacked ones go back to the offline
+  store when the connection drops
+• Fast reconnect: `RESUME <ticket> <pub_b64>` skips password and USB for a
+  few minutes after a full login (utils/session_tickets.py)
+• Write coalescing: frames queued for one client leave in a single TLS
+  write of up to `--cork-bytes`, waiting at most `--cork-ms` for more;
+  a periodic `tx:` log line counts frames against writes and TLS records
+• Metrics: `--metrics-port P` serves Prometheus text format on
+  http://127.0.0.1:P/metrics (utils/metrics.py); shard worker i uses P+i
+• Tracing: a sample of frames is timed through read → route → queue →
+  write (utils/tracing.py); `--trace-rate` or POST /trace?rate=… at runtime
+• Logging only enqueues; a background thread writes the file and console
+  in batches (logging_config.py).  `--log-level` takes per-module levels;
+  `--log-format json` writes one JSON object per line to the log file
 """
 from __future__ import annotations
-import errno, signal, socket, ssl, sys, threading, time, sqlite3 #  errno = OS‐level error codes
-from contextlib import closing
+import argparse, asyncio, errno, logging, multiprocessing, signal, socket, ssl, sys, threading, time #  errno = OS‐level error codes
+from collections import deque
 from typing import Dict, Tuple
 
-import base64, os                                  
+import base64, os, queue, sqlite3
 from security import (                              
     encrypt_message, decrypt_message,
     generate_ecdh_keypair, derive_shared_key
 )
 
-from logging_config import setup_logging
+from logging_config import setup_logging, set_levels, set_format, event
 from utils.tls_setup import ensure_cert_in_cert_dir, configure_tls_context
-from utils.db_setup    import init_user_db, verify_credentials, DB_PATH
+from utils.db_setup    import init_user_db, get_password_hash
+from utils             import db_access
 from utils.db_maintenance import ensure_db_ready, backup_db
+from utils.auth_pool   import AuthExecutor, AuthOverloaded
+from utils             import shard_bus
+from utils.offline_queue import OfflineQueue, OFFLINE_BATCH, key_fingerprint
+from utils.session_tickets import TicketAuthority
+from utils             import metrics, tracing
 
 # ── globals ──────────────────────────────────────────────────────────
 logger = setup_logging()
 init_user_db()                                    # ensure users.db exists
 
-connected_clients: Dict[str, Tuple[socket.socket, Tuple[str, int]]] = {}
+connected_clients: Dict[str, Tuple[socket.socket, Tuple[str, int], str]] = {}
 _clients_lock = threading.RLock()
 
+# presence deltas are numbered so clients can spot a gap and ask for a snapshot
+_presence_seq = 0
+
+# sharded mode (--workers): users on the other worker processes, user → pub_b64
+remote_clients: Dict[str, str] = {}
+_bus = None                        # shard_bus.BusClient when running as a worker
+
+# store-and-forward for offline recipients (started by the engines)
+_offline: OfflineQueue | None = None
+_last_pub: Dict[str, str] = {}     # user → pub_b64 of their last session
+_deliveries: set = set()           # asyncio drains started outside a login handler
+_draining: dict = {}               # conn → another store landed during its drain
+_offline_jobs: queue.SimpleQueue = queue.SimpleQueue()   # writes for the offline-writer thread
+OFFLINE_SWEEP_SECS = 3600          # TTL expiry runs this often
+
+# session tickets for fast reconnects (started by the engines)
+_tickets: TicketAuthority | None = None
+
 PORT_DEFAULT        = 4444
 MAX_MSG_LEN         = 64 * 1024
 SOCKET_TIMEOUT_SECS = 30
 
+# relay fast path: "TYPE sender recipient payload" - only the head is parsed
+_HEAD_SCAN = 256                   # bytes scanned for the routing fields
+_ROUTED    = frozenset({b"CIPH", b"SKEY", b"FILE_OFFER", b"FILE_ACCEPT", b"FILE_CHUNK",
+                        b"FILE_DATA", b"FILE_ACK", b"FILE_RESUME", b"FILE_COMPLETE",
+                        b"FILE_CANCEL"})
+# kept for offline recipients; windowed FILE_* traffic is resumed by the
+# transfer protocol itself (FILE_RESUME), so only what nothing would repeat
+_STORED    = frozenset({b"CIPH", b"FILE_CANCEL"})
+UNACKED_MAX = 1024                 # CIPH frames retained per connection awaiting ACK
+
+# asyncio engine
+_ASYNC_BACKLOG          = 1024
+_ASYNC_HANDSHAKE_SECS   = 10         # TLS handshake must finish within this
+_ASYNC_READ_LIMIT       = 16 * 1024  # StreamReader buffer before pausing the transport
+
+# outbound queues (per connection)
+SEND_QUEUE_HWM      = 1024 * 1024  # bytes queued for one client before it counts as slow
+SLOW_CONSUMER_SECS  = 10           # stay above the HWM this long → disconnected
+
+# write coalescing: queued frames go out together in one TLS write
+CORK_BYTES          = 16 * 1024    # flush at this size (one full TLS record); 0 → a write per frame
+CORK_SECS           = 0.001        # wait this long for more frames; 0 → only what is already queued
+TX_STATS_SECS       = 60           # log frames / writes / records this often
+_TLS_RECORD         = 16 * 1024    # max plaintext per TLS record
+
 # USB 2FA
 _MAX_FAILS_USB      = 3
 _LOCK_SECS_USB      = 240
@@ -43,6 +119,34 @@ _MAX_LOGIN_FAILS    = 3
 _LOCK_SECS_LOGIN    = 300          # 5 minutes
 _login_fails: dict[str, tuple[int, int]] = {}    # ip -> (fails, locked_until)
 _login_lock = threading.RLock()
+
+# password-check process pool (started by the engines, not at import)
+AUTH_WORKERS        = None         # None → one per core
+AUTH_MAX_PENDING    = None         # None → 8 per worker
+AUTH_STATS_SECS     = 60           # log latency percentiles this often
+_AUTH_RETRY_SECS    = 5            # told to clients in "BUSY <secs>"
+_auth: AuthExecutor | None = None
+
+# metrics endpoint (--metrics-port); None → not served, still collected
+METRICS_PORT        = None
+TRACE_RATE          = 0.0          # fraction of frames timed per stage (utils/tracing.py)
+LOG_LEVEL           = ""           # --log-level spec, see logging_config.set_levels
+LOG_FORMAT          = None         # "text" / "json" for the log file; None → env or text
+_FRAME_TYPES = _ROUTED | {b"PING", b"USERS?", b"ACK", b"BCAST"}
+_m_frames   = metrics.REGISTRY.counter(
+    "secure_chat_frames_received_total", "Post-login frames received from clients, by type", ("type",))
+_m_frame_by_type = {t: _m_frames.labels(t.decode()) for t in _FRAME_TYPES}
+_m_frame_other   = _m_frames.labels("other")
+_m_bytes_in = metrics.REGISTRY.counter(
+    "secure_chat_received_bytes_total", "Post-login frame bytes received (headers included)")
+_m_relay    = metrics.REGISTRY.histogram(
+    "secure_chat_relay_seconds", "Time to route one frame to every recipient's queue",
+    ("route",), buckets=(1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 0.01, 0.05))
+_m_relay_direct, _m_relay_bcast = _m_relay.labels("direct"), _m_relay.labels("broadcast")
+_m_auth     = metrics.REGISTRY.histogram(
+    "secure_chat_auth_seconds", "Password check latency, queueing included")
+_m_usb      = metrics.REGISTRY.histogram(
+    "secure_chat_usb_verify_seconds", "USB token check latency (one DB transaction)")
 # ─────────────────────────────────────────────────────────────────────
 
 # ──  helpers ────────────────────────────────────────────────
@@ -69,10 +173,69 @@ def _clear_fail(ip: str) -> None:
     with _login_lock:
         _login_fails.pop(ip, None)
 
+# ── session tickets ─────────────────────────────────────────────────
+def _start_ticket_authority() -> None:
+    global _tickets
+    try:
+        _tickets = TicketAuthority.from_file()
+    except (OSError, sqlite3.Error) as e:  # full logins still work
+        logger.error("Session tickets disabled: %s", e)
+
+def _redeem_ticket(frame: bytes) -> tuple[str, str] | None:
+    """`RESUME <ticket> <pub_b64>` → (username, pub_b64) if the ticket is
+       genuine, unused, unexpired, bound to that key and the account exists."""
+    parts = frame.split(b" ", 2)
+    if _tickets is None or len(parts) != 3:
+        return None
+    claim = _tickets.redeem(parts[1].decode(errors="replace"))
+    pub_b64 = parts[2].decode(errors="replace")
+    if claim is None or claim[1] != key_fingerprint(pub_b64):
+        logger.warning("Rejected session ticket", extra=event("resume_rejected"))
+        return None
+    username = claim[0]
+    if db_access.usb_serial(username) is None:
+        return None                        # account deleted since the ticket was issued
+    logger.info("Session resumed for '%s'", username, extra=event("resume", user=username))
+    return username, pub_b64
+
+# ── password checks ─────────────────────────────────────────────────
+def _start_auth_pool() -> None:
+    """Spin up the PBKDF2 workers before any client thread exists."""
+    global _auth
+    _auth = AuthExecutor(AUTH_WORKERS, AUTH_MAX_PENDING, on_latency=_m_auth.observe)
+    _auth.warm_up()
+    logger.info("Auth pool: %d workers, queue limit %d",
+                _auth.workers, _auth.max_pending)
+    threading.Thread(target=_auth_stats_loop, daemon=True, name="auth-stats").start()
+
+def _auth_stats_loop() -> None:
+    last = 0
+    while True:
+        time.sleep(AUTH_STATS_SECS)
+        st = _auth.stats()
+        if st["accepted"] + st["rejected"] != last:
+            last = st["accepted"] + st["rejected"]
+            logger.info("auth: p50=%.1fms p95=%.1fms p99=%.1fms pending=%d rejected=%d",
+                        st["p50_ms"], st["p95_ms"], st["p99_ms"],
+                        st["pending"], st["rejected"])
+
+def _check_password(username: str, password: str) -> bool:
+    """Thread engine: blocks this client thread only; raises AuthOverloaded."""
+    stored = get_password_hash(username)
+    return stored is not None and _auth.verify(stored, password)
+
 # ── bootstrap ───────────────────────────────────────────────────────
-def start_server(port: int = PORT_DEFAULT) -> None:
-    ensure_db_ready()
-    backup_db()
+def start_server(port: int = PORT_DEFAULT, bus_path: str | None = None) -> None:
+    if bus_path is None:                   # the supervisor did this for shard workers
+        ensure_db_ready()
+        backup_db()
+    else:
+        _attach_bus(bus_path)
+    _start_auth_pool()
+    _start_offline_queue()
+    _start_ticket_authority()
+    _start_tx_stats()
+    _start_metrics()
 
     # keep existing cert; generate only if missing
     cert_path, key_path = ensure_cert_in_cert_dir("server_cert.pem",
@@ -82,6 +245,8 @@ def start_server(port: int = PORT_DEFAULT) -> None:
 
     raw = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     raw.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if _bus is not None:                   # shard worker: kernel spreads accepts
+        raw.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
     raw.bind(("0.0.0.0", port))
     raw.listen(100)
     logger.info("Secure-Chat Server listening on 0.0.0.0:%s", port)
@@ -98,7 +263,7 @@ def start_server(port: int = PORT_DEFAULT) -> None:
             if e.errno == errno.EBADF: break       # listener closed (shutdown()), a socket.timeout will be raised.
             logger.error("Accept failed: %s", e);  continue
 
-        logger.info("Connection from %s", cli_addr)
+        logger.info("Connection from %s", cli_addr, extra=event("connect", addr=cli_addr))
         threading.Thread(target=handle_client,
                          args=(cli_sock, cli_addr),
                          daemon=True).start()
@@ -106,90 +271,77 @@ def start_server(port: int = PORT_DEFAULT) -> None:
 # ── per-client thread ───────────────────────────────────────────────
 def handle_client(sock: ssl.SSLSocket, addr) -> None:
     sock.settimeout(SOCKET_TIMEOUT_SECS) # client is idle for 30 seconds
+    conn = _ClientConn(sock, addr)       # all writes go through its queue
     ip = addr[0] # IP address of the client 
     username = None
     try:
         # 0) lock-out check before reading anything
         wait = _is_locked(ip)
         if wait:
-            _send_prefixed(sock, f"LOCKED {wait}".encode())
+            _send_prefixed(conn, f"LOCKED {wait}".encode())
             return
 
-        # 1) username / password -------------------------------------
+        # 1) session ticket (fast reconnect) or username / password ---
         creds = _recv_prefixed(sock)
-        if not creds or b":" not in creds:
-            _send_prefixed(sock, b"FAIL");  return
-        username, password = creds.decode().split(":", 1)
-        if not verify_credentials(username, password):
-            left = _register_fail(ip)
-            if left:
-                _send_prefixed(sock, f"LOGINFAIL {left}".encode())
-            else:
-                _send_prefixed(sock, f"LOCKED {_LOCK_SECS_LOGIN}".encode())
-            return
-        _clear_fail(ip)                     # good credentials
-
-        # 2) USB 2-factor loop ---------------------------------------
-        _send_prefixed(sock, b"USBREQ")
-        while True:
-            usb = _recv_prefixed(sock)
-            if not usb or b":" not in usb:
-                _send_prefixed(sock, b"FAIL");  return
-            serial, digest = usb.decode().split(":", 1)
-            ok, wait, tries_left = _verify_usb(username, serial, digest) # USB check from DB
-            if ok:
-                break
-            if wait:
-                _send_prefixed(sock, f"LOCKED {wait}".encode())
+        resumed = None
+        if creds.startswith(b"RESUME "):
+            resumed = _redeem_ticket(creds)
+            _send_prefixed(conn, b"SUCCESS" if resumed else b"RESUMEFAIL")
+            if not resumed:
+                creds = _recv_prefixed(sock)        # fall back to a full login
+        if resumed:
+            username, pub_b64 = resumed
+        else:
+            if not creds or b":" not in creds:
+                _send_prefixed(conn, b"FAIL");  return
+            username, password = creds.decode().split(":", 1)
+            try:
+                ok = _check_password(username, password)
+            except AuthOverloaded:
+                _send_prefixed(conn, f"BUSY {_AUTH_RETRY_SECS}".encode());  return
+            if not ok:
+                left = _register_fail(ip)
+                if left:
+                    _send_prefixed(conn, f"LOGINFAIL {left}".encode())
+                else:
+                    _send_prefixed(conn, f"LOCKED {_LOCK_SECS_LOGIN}".encode())
                 return
-            _send_prefixed(sock, f"USBFAIL {tries_left}".encode())
+            _clear_fail(ip)                     # good credentials
+
+            # 2) USB 2-factor loop ---------------------------------------
+            _send_prefixed(conn, b"USBREQ")
+            while True:
+                usb = _recv_prefixed(sock)
+                if not usb or b":" not in usb:
+                    _send_prefixed(conn, b"FAIL");  return
+                serial, digest = usb.decode().split(":", 1)
+                ok, wait, tries_left = _verify_usb(username, serial, digest) # USB check from DB
+                if ok:
+                    break
+                if wait:
+                    _send_prefixed(conn, f"LOCKED {wait}".encode())
+                    return
+                _send_prefixed(conn, f"USBFAIL {tries_left}".encode())
 
-        _send_prefixed(sock, b"SUCCESS")    # USB OK
+            _send_prefixed(conn, b"SUCCESS")    # USB OK
         
-        # 3) expect KEYPUB
-        pubpkt = _recv_prefixed(sock)
-        if not pubpkt.startswith(b"KEYPUB "):
-            logger.error("Keypub missing from %s", username); return
-        pub_b64 = pubpkt.split(b" ",1)[1].decode() # [1] base64-encoded public key 
-      
+            # 3) expect KEYPUB
+            pubpkt = _recv_prefixed(sock)
+            if not pubpkt.startswith(b"KEYPUB "):
+                logger.error("Keypub missing from %s", username); return
+            pub_b64 = pubpkt.split(b" ",1)[1].decode() # [1] base64-encoded public key 
+
         # 3) mark online / notify others -----------------------------
-        with _clients_lock:
-            """
-              Once a user passes both password and USB checks, 
-              add them to the server's active-clients map,
-              tell their client 'you're in,' update everyone's user list, and log it.
-            """
-            connected_clients[username] = (sock, addr, pub_b64)       
-        _send_prefixed(sock, b"SUCCESS")    # full login OK
-        _broadcast_user_list()
-        _send_existing_keypubs(sock)                # give newcomer others
-        _broadcast_keypub(username, pub_b64)        # tell others newcomer
-        logger.info("[%s] logged in as '%s'", addr, username)
-        logger.info("[%s] authenticated as '%s'", addr, username)
+        _register_client(username, conn, addr, pub_b64)
+        threading.Thread(target=_deliver_offline, args=(username, conn, pub_b64),
+                         daemon=True, name=f"offline-{username}").start()
 
         # 4) chat loop -----------------------------------------------
         while True:
-            frame = _recv_prefixed(sock)
-            if not frame: break
-            if frame == b"PING": continue
-            if frame.startswith(b"BCAST "):
-                _route_broadcast(frame); continue
-            if frame.startswith(b"CIPH "):
-                _route_cipher(frame); continue
-            
-            token = frame.split(b" ", 1)[0]
-
-            # If it’s any of our file-transfer types, relay it:
-            if token in (b"FILE_OFFER", b"FILE_CHUNK", b"FILE_COMPLETE", b"FILE_CANCEL"):
-                # parts = [TYPE, sender, recipient, payload]
-                parts     = frame.split(b" ", 3)
-                recipient = parts[2].decode()
-                target    = connected_clients.get(recipient)
-                if target:
-                    _send_prefixed(target[0], frame)
-                # skip further handling
-                continue
-            
+            trace = tracing.sample()
+            wire = _recv_frame(sock, trace)
+            if wire is None: break
+            _dispatch_frame(wire, conn, trace)
 
     except socket.timeout:
         logger.info("%s timed out.", username or addr)
@@ -198,92 +350,429 @@ def handle_client(sock: ssl.SSLSocket, addr) -> None:
     except Exception as e:
         logger.error("Unhandled error with %s: %s", addr, e)
     finally:
-        with _clients_lock:
+        _unregister_client(username, conn)
+        conn.close()                        # writer flushes, then closes the socket
+        logger.info("Client '%s' disconnected.", username or addr,
+                    extra=event("disconnect", user=username, addr=addr))
+
+# ── shared by both engines ──────────────────────────────────────────
+def _register_client(username: str, conn, addr, pub_b64: str) -> None:
+    """
+      Once a user passes both password and USB checks,
+      add them to the server's active-clients map,
+      tell their client 'you're in,' update everyone's user list, and log it.
+    """
+    conn.pub_b64 = pub_b64
+    with _clients_lock:
+        online = _is_online(username)           # re-login replaces the old session
+        connected_clients[username] = (conn, addr, pub_b64)
+        if not online:
+            _publish_presence("JOIN", username, skip=conn)
+        _send_prefixed(conn, b"SUCCESS")    # full login OK
+        _send_user_snapshot(conn)
+    if _tickets is not None:                    # next reconnect can skip password + USB
+        _send_prefixed(conn, f"TICKET {_tickets.issue(username, key_fingerprint(pub_b64))} "
+                             f"{_tickets.lifetime}".encode())
+    if _bus is not None:
+        _bus.join(username, pub_b64)            # other shards: presence + KEYPUB
+    _send_existing_keypubs(conn)                # give newcomer others
+    _broadcast_keypub(username, pub_b64)        # tell others newcomer
+    logger.info("[%s] logged in as '%s'", addr, username,
+                extra=event("login", user=username, addr=addr))
+    logger.info("[%s] authenticated as '%s'", addr, username)
+
+def _unregister_client(username: str | None, conn) -> None:
+    """Drop *username* from the map - but only if *conn* still owns the entry
+       (a newer login under the same name must not be kicked out)."""
+    with _clients_lock:
+        entry = connected_clients.get(username)
+        owner = entry is not None and entry[0] is conn
+        if owner:
             connected_clients.pop(username, None)
-        _broadcast_user_list()
-        try:
-            sock.shutdown(socket.SHUT_RDWR)
-        except Exception:
-            pass
-        sock.close()
-        logger.info("Client '%s' disconnected.", username or addr)
+            _last_pub[username] = entry[2]
+            if not _is_online(username):
+                _publish_presence("LEAVE", username)
+    if username is not None:
+        _requeue_unacked(username, conn)        # replaced sessions keep theirs too
+    if owner and _bus is not None:
+        _bus.leave(username)
+
+def _dispatch_frame(wire: memoryview, conn, trace: tracing.Trace | None = None) -> None:
+    """Route one post-login frame; identical for the thread and asyncio engines.
+       *wire* is the frame exactly as received (4-byte length included).  Only
+       its first _HEAD_SCAN bytes are parsed; the buffer itself is queued to
+       the recipient(s) unchanged."""
+    if trace is None:
+        _route_frame(wire, conn)
+        return
+    token = tracing.activate(trace)              # picked up by _relay / the lock
+    try:
+        _route_frame(wire, conn)
+    finally:
+        tracing.deactivate(token)
+        trace.routed()
 
-def _send_existing_keypubs(sock):
+def _route_frame(wire: memoryview, conn) -> None:
+    t0 = time.perf_counter()
+    head = bytes(wire[4:4 + _HEAD_SCAN])
+    fields = head.split(b" ", 3)      # [TYPE, sender, recipient?, ...]
+    token = fields[0]
+    _m_frame_by_type.get(token, _m_frame_other).inc()
+    _m_bytes_in.inc(len(wire))
+    if head == b"PING": return
+    if head == b"USERS?":                # client saw a gap in the presence deltas
+        with _clients_lock:
+            _send_user_snapshot(conn)
+        return
+    if token == b"ACK":                  # ACK <sender> <msg_id> - recipient has it
+        if len(fields) == 3:
+            conn.unacked.pop((fields[1], fields[2]), None)
+        return
+    if token == b"BCAST":
+        if len(fields) >= 3:
+            _route_broadcast(fields[1], wire)
+            _m_relay_bcast.observe(time.perf_counter() - t0)
+        return
+    # sender-key hand-offs, private messages and every file-transfer type
+    if token in _ROUTED and len(fields) == 4:   # all three separators inside the head
+        _route_direct(token, fields[1], fields[2], wire)
+        _m_relay_direct.observe(time.perf_counter() - t0)
+
+def _snapshot_clients() -> list[tuple[str, object]]:
+    """(username, conn) pairs copied under the lock - fan-out happens outside it."""
+    with tracing.locked(_clients_lock):
+        return [(u, t[0]) for u, t in connected_clients.items()]
+
+def _send_existing_keypubs(conn):
     with _clients_lock:
-        for user, (_,_,pub) in connected_clients.items():
-            _send_prefixed(sock, f"KEYPUB {user} {pub}".encode())
+        pubs = [(user, pub) for user, (_, _, pub) in connected_clients.items()]
+        pubs += [(user, pub) for user, pub in remote_clients.items()
+                 if user not in connected_clients]
+    for user, pub in pubs:
+        _send_prefixed(conn, f"KEYPUB {user} {pub}".encode())
 
 def _broadcast_keypub(user, pub_b64):
     pkt = f"KEYPUB {user} {pub_b64}".encode()
+    for u, c in _snapshot_clients():
+        if u != user: _send_prefixed(c, pkt) # ensures that the public key is not sent back to the user who owns it
+
+def _route_direct(token: bytes, sender_b: bytes, recipient_b: bytes, wire: memoryview):
+    # wire = len + b"<TYPE> <sender> <recipient> <payload>"
+    t0 = time.perf_counter()
+    recipient = recipient_b.decode(errors="replace")
+    if logger.isEnabledFor(logging.DEBUG):       # payload only when tracing
+        logger.debug("relay %s %r → %s: %r…", token.decode(), sender_b, recipient,
+                     bytes(wire[4:4 + 96]))
+    tgt = connected_clients.get(recipient)
+    if tgt:
+        _relay(tgt[0], wire)
+        if token == b"CIPH":
+            _retain(tgt[0], wire)
+    elif _bus is not None and recipient in remote_clients:
+        _bus.route(recipient, wire)             # owned by another shard
+    elif token in _STORED:
+        _store_offline(recipient, sender_b.decode(errors="replace"), wire)
+    if token == b"CIPH" and logger.isEnabledFor(logging.INFO):
+        sender = sender_b.decode(errors="replace")
+        logger.info("Relaying E2E private message from %s to %s (%d bytes)",
+                    sender, recipient, len(wire) - 4,
+                    extra=event("relay", user=sender, to=recipient, frame="CIPH",
+                                size=len(wire) - 4,
+                                ms=round((time.perf_counter() - t0) * 1000, 3)))
+
+# ── acknowledged delivery ──────────────────────────────────────────
+def _retain(conn, wire: memoryview) -> None:
+    """Keep a relayed CIPH until the recipient ACKs it (CIPH s r <msg_id> …)."""
+    fields = bytes(wire[4:4 + _HEAD_SCAN]).split(b" ", 4)
+    if len(fields) < 5 or fields[0] != b"CIPH":
+        return                             # FILE_CANCEL, or a client without msg IDs
+    unacked = conn.unacked
+    unacked[(fields[1], fields[3])] = wire
+    if len(unacked) > UNACKED_MAX:         # client not ACKing - stop tracking the oldest
+        unacked.pop(next(iter(unacked)))
+
+def _requeue_unacked(username: str, conn) -> None:
+    """Connection gone: whatever it did not ACK goes to the user's current
+       session if one holds the same key (a fast reconnect), else to the
+       offline store."""
+    pending, conn.unacked = conn.unacked, {}
+    if not pending or conn.pub_b64 is None:
+        return
+    live = _live_session(username, conn)
+    if live is not None:
+        for wire in pending.values():
+            if _relay(live, wire):
+                _retain(live, wire)
+        logger.info("Handed %d unacknowledged frames to the new session of %s",
+                    len(pending), username)
+        return
+    if _bus is not None and remote_clients.get(username) == conn.pub_b64:
+        for wire in pending.values():
+            _bus.route(username, wire)          # reconnected on another shard
+        return
+    if _offline is None:
+        return
+    # off the loop; the writer redrains if they log in before it is stored
+    _queue_offline(username, key_fingerprint(conn.pub_b64),
+                   [(s.decode(errors="replace"), w) for (s, _), w in pending.items()])
+    logger.info("Kept %d unacknowledged frames for %s", len(pending), username)
+
+def _live_session(username: str, old_conn):
+    """The conn that replaced *old_conn* on this worker, if it uses the same key."""
+    entry = connected_clients.get(username)
+    if entry is None or entry[0] is old_conn or entry[2] != old_conn.pub_b64:
+        return None
+    return entry[0]
+
+# ── store-and-forward ──────────────────────────────────────────────
+def _store_offline(recipient: str, sender: str, wire: memoryview) -> None:
+    pub = _last_pub.get(recipient)
+    if _offline is None or pub is None:
+        return                     # never seen since start-up: no key it could be read with
+    _queue_offline(recipient, key_fingerprint(pub), [(sender, bytes(wire))])   # buffer is reused
+
+def _queue_offline(recipient: str, key_fp: bytes, frames: list) -> None:
+    """Hand (sender, wire) pairs to the offline writer thread, fire-and-forget:
+       the SQLite write never runs on the asyncio loop or a relaying thread.
+       One writer keeps each recipient's frames in order."""
+    try:
+        loop = asyncio.get_running_loop()      # follow-up runs back on the loop
+    except RuntimeError:
+        loop = None
+    _offline_jobs.put((recipient, key_fp, frames, loop))
+
+def _offline_writer_loop() -> None:
+    while True:
+        _write_offline(*_offline_jobs.get())
+
+def _write_offline(recipient: str, key_fp: bytes, frames: list, loop) -> None:
+    try:
+        evicted = _offline.put_many(recipient, key_fp, frames)
+    except Exception as e:
+        logger.warning("Offline store for %s failed: %s", recipient, e)
+        return
+    if evicted:
+        logger.warning("Offline queue for %s over quota - %d oldest frames dropped",
+                       recipient, evicted)
+    if loop is None:                          # logged in (and drained) while we wrote?
+        _deliver_if_online(recipient, key_fp)
+    else:
+        loop.call_soon_threadsafe(_deliver_if_online, recipient, key_fp)
+
+def _deliver_if_online(recipient: str, key_fp: bytes) -> None:
+    entry = connected_clients.get(recipient)
+    if entry is not None and key_fingerprint(entry[2]) == key_fp:
+        _start_delivery(recipient, entry[0], entry[2])
+
+def _offline_keypubs(batch, sent: set) -> list[bytes]:
+    """KEYPUBs of offline senders in *batch*, so the recipient can decrypt them."""
+    out = []
+    with _clients_lock:
+        for _, sender, _ in batch:
+            if sender in sent or _is_online(sender) or sender not in _last_pub:
+                continue
+            sent.add(sender)
+            out.append(f"KEYPUB {sender} {_last_pub[sender]}".encode())
+    return out
+
+def _claim_drain(conn) -> bool:
+    """One drain per session; a second request makes the running one look again."""
+    with _clients_lock:
+        if conn in _draining:
+            _draining[conn] = True
+            return False
+        _draining[conn] = False
+        return True
+
+def _drain_again(conn) -> bool:
     with _clients_lock:
-        for u,(s,_,_) in connected_clients.items(): # u = username, s = socket, _ _ ignore the rest of the tuple
-            if u != user: _send_prefixed(s, pkt) # ensures that the public key is not sent back to the user who owns it
+        again = _draining.get(conn, False)
+        _draining[conn] = False
+        return again
 
-def _route_cipher(frame: bytes):
-        # frame = b"CIPH <sender> <recipient> <base64_blob>"
-    parts = frame.split(b" ", 3) # parts = [b"CIPH", b"sender", b"recipient", b"blob"]
-    if len(parts) != 4:
+def _end_drain(conn) -> None:
+    with _clients_lock:
+        _draining.pop(conn, None)
+
+def _deliver_offline(username: str, conn, pub_b64: str) -> None:
+    """Thread engine: hand the queued frames to *conn* a batch at a time,
+       never filling its send queue past half the high-water mark."""
+    if _offline is None or not _claim_drain(conn):
         return
-    _, sender_b, recipient_b, blob_b64 = parts
-    sender    = sender_b.decode()
-    recipient = recipient_b.decode()
-    # ───────── NEW logging ─────────
-    logger.info(
-        "Relaying E2E private message from %s to %s: %s",
-        sender, recipient, blob_b64.decode()
-    )
-    # ───────── existing relay ─────────
-    tgt = connected_clients.get(recipient)
-    if not tgt:
+    sent_keys, total = set(), 0
+    try:
+        _offline.drop_stale(username, key_fingerprint(pub_b64))
+        while True:
+            batch = _offline.peek(username, OFFLINE_BATCH)
+            if not batch:
+                if _drain_again(conn):
+                    continue
+                break
+            for pkt in _offline_keypubs(batch, sent_keys):
+                _send_prefixed(conn, pkt)
+            last = None
+            for row_id, _, frame in batch:
+                while conn.queued_bytes > SEND_QUEUE_HWM // 2:
+                    time.sleep(0.05)
+                if not conn.send_wire(frame):
+                    break                              # closing - the rest stays queued
+                _retain(conn, memoryview(frame))
+                last = row_id
+            if last is not None:
+                _offline.delete_upto(username, last)
+                total += 1 + [r[0] for r in batch].index(last)
+            if last != batch[-1][0]:
+                break
+    finally:
+        _end_drain(conn)
+    if total:
+        logger.info("Delivered %d stored frames to %s", total, username)
+
+def _start_delivery(username: str, conn, pub_b64: str) -> None:
+    """Drain the offline store to a session that is already logged in."""
+    if isinstance(conn, _AsyncConn):
+        task = asyncio.get_running_loop().create_task(
+            _a_deliver_offline(username, conn, pub_b64))
+        _deliveries.add(task)
+        task.add_done_callback(_deliveries.discard)
+    else:
+        threading.Thread(target=_deliver_offline, args=(username, conn, pub_b64),
+                         daemon=True, name=f"offline-{username}").start()
+
+async def _a_deliver_offline(username: str, conn, pub_b64: str) -> None:
+    """asyncio twin of `_deliver_offline`; SQLite runs in the default executor."""
+    if _offline is None or not _claim_drain(conn):
         return
-    _send_prefixed(tgt[0], frame)
+    loop = asyncio.get_running_loop()
+    sent_keys, total = set(), 0
+    try:
+        await loop.run_in_executor(None, _offline.drop_stale, username, key_fingerprint(pub_b64))
+        while True:
+            batch = await loop.run_in_executor(None, _offline.peek, username, OFFLINE_BATCH)
+            if not batch:
+                if _drain_again(conn):
+                    continue
+                break
+            for pkt in _offline_keypubs(batch, sent_keys):
+                _send_prefixed(conn, pkt)
+            last = None
+            for row_id, _, frame in batch:
+                if conn.queued_bytes > SEND_QUEUE_HWM // 2:
+                    try:
+                        await conn.writer.drain()
+                    except ConnectionError:
+                        break
+                if not conn.send_wire(frame):
+                    break
+                _retain(conn, memoryview(frame))
+                last = row_id
+            if last is not None:
+                await loop.run_in_executor(None, _offline.delete_upto, username, last)
+                total += 1 + [r[0] for r in batch].index(last)
+            if last != batch[-1][0]:
+                break
+    finally:
+        _end_drain(conn)
+    if total:
+        logger.info("Delivered %d stored frames to %s", total, username)
 
-def _route_broadcast(frame: bytes):
-    # frame = b"BCAST sender blob"
-    parts = frame.split(b" ", 2) # parts = [b"BCAST", b"sender", b"blob"]
-    if len(parts) != 3:
+def _start_offline_queue() -> None:
+    global _offline
+    try:
+        _offline = OfflineQueue()
+    except Exception as e:                 # relay still works, just without storage
+        logger.error("Offline queue disabled: %s", e)
         return
-    _, sender_b, blob_b64 = parts
-    sender = sender_b.decode()
+    threading.Thread(target=_offline_writer_loop, daemon=True, name="offline-writer").start()
+    threading.Thread(target=_offline_sweep_loop, daemon=True, name="offline-sweep").start()
+
+def _offline_sweep_loop() -> None:
+    while True:
+        try:
+            n = _offline.expire()
+            if n:
+                logger.info("Expired %d stored frames", n)
+        except Exception as e:
+            logger.warning("Offline sweep failed: %s", e)
+        time.sleep(OFFLINE_SWEEP_SECS)
 
+def _route_broadcast(sender_b: bytes, wire: memoryview, from_bus: bool = False):
+    # wire = len + b"BCAST <sender> <blob>"
+    sender = sender_b.decode(errors="replace")
+    for uname, conn in _snapshot_clients():
+        if uname == sender:
+            continue      # don't send back to the originator
+        _relay(conn, wire)
+    if _bus is not None and not from_bus:
+        _bus.bcast(sender, wire)                # the other shards fan out locally
+
+# ── shard bus callbacks (worker processes only) ─────────────────────
+def _on_remote_join(user: str, pub_b64: str) -> None:
     with _clients_lock:
-        for uname, (sock, _, _) in connected_clients.items():
-            if uname == sender:
-                continue      # don't send back to the originator
-            _send_prefixed(sock, frame)
+        online = _is_online(user)
+        remote_clients[user] = pub_b64
+        if not online:
+            _publish_presence("JOIN", user)
+    _broadcast_keypub(user, pub_b64)
+
+def _on_remote_leave(user: str) -> None:
+    with _clients_lock:
+        pub = remote_clients.pop(user, None)
+        if pub is None:
+            return
+        _last_pub[user] = pub
+        if not _is_online(user):
+            _publish_presence("LEAVE", user)
+
+def _on_remote_route(recipient: str, wire: memoryview) -> None:
+    tgt = connected_clients.get(recipient)
+    if tgt:
+        _relay(tgt[0], wire)
+        _retain(tgt[0], wire)
+        return
+    # gone before the frame got here, or bounced back by the broker: no worker
+    # owns the recipient, so store it as the single-process path would
+    token, sender_b = bytes(wire[4:4 + _HEAD_SCAN]).split(b" ", 2)[:2]
+    if token in _STORED:
+        _store_offline(recipient, sender_b.decode(errors="replace"), wire)
+
+def _on_remote_bcast(sender: str, wire: memoryview) -> None:
+    _route_broadcast(sender.encode(), wire, from_bus=True)
+
+def _attach_bus(path: str, dispatch=None) -> None:
+    global _bus
+    _bus = shard_bus.BusClient(path, on_join=_on_remote_join, on_leave=_on_remote_leave,
+                               on_route=_on_remote_route, on_bcast=_on_remote_bcast,
+                               dispatch=dispatch)
 
 # ── USB verification ────────────────────────────────────────────────
 def _verify_usb(user: str, serial: str, digest: str) -> tuple[bool, int, int]:
     """Return (ok, seconds_left_if_locked, tries_left_if_fail)."""
-    now = int(time.time())
-    with closing(sqlite3.connect(DB_PATH)) as conn, conn:
-        cur = conn.cursor()
-        cur.execute("""SELECT usb_serial, usb_hash,
-                              usb_fail_count, usb_locked_until
-                       FROM users WHERE username=?""", (user,))
-        row = cur.fetchone()
-        if not row or not row[0]:
-            return False, 0, 0
-        exp_serial, exp_hash, fails, locked = row
-        if locked and locked > now:
-            return False, locked - now, 0
-
-        # success?
-        if serial == exp_serial and digest.lower() == exp_hash.lower():
-            cur.execute("""UPDATE users
-                             SET usb_fail_count=0, usb_locked_until=0
-                           WHERE username=?""", (user,))
-            return True, 0, 0
-
-        # failure
-        fails += 1
-        new_lock = now + _LOCK_SECS_USB if fails >= _MAX_FAILS_USB else 0
-        cur.execute("""UPDATE users
-                         SET usb_fail_count=?, usb_locked_until=?
-                       WHERE username=?""",
-                    (fails % _MAX_FAILS_USB, new_lock, user))
-        tries_left = 0 if new_lock else (_MAX_FAILS_USB - fails)
-        return False, new_lock - now if new_lock else 0, tries_left
+    with _m_usb.time():
+        now = int(time.time())
+        # BEGIN IMMEDIATE: read + counter update are one atomic step
+        with db_access.transaction() as conn:
+            cur = conn.cursor()
+            cur.execute(db_access.SQL_USB_STATE, (user,))
+            row = cur.fetchone()
+            if not row or not row[0]:
+                return False, 0, 0
+            exp_serial, exp_hash, fails, locked = row
+            if locked and locked > now:
+                return False, locked - now, 0
+
+            # success?
+            if serial == exp_serial and digest.lower() == exp_hash.lower():
+                cur.execute(db_access.SQL_USB_SET_FAILS, (0, 0, user))
+                return True, 0, 0
+
+            # failure
+            fails += 1
+            new_lock = now + _LOCK_SECS_USB if fails >= _MAX_FAILS_USB else 0
+            cur.execute(db_access.SQL_USB_SET_FAILS,
+                        (fails % _MAX_FAILS_USB, new_lock, user))
+            tries_left = 0 if new_lock else (_MAX_FAILS_USB - fails)
+            return False, new_lock - now if new_lock else 0, tries_left
 
 # ── tiny helpers ----------------------------------------------------
 def _read_exact(sock: socket.socket, n: int) -> bytes:   # n = number of bytes to read.
@@ -317,30 +806,76 @@ def _recv_prefixed(sock: socket.socket) -> bytes:
         return b""
     return _read_exact(sock, length)
 
-def _send_prefixed(sock: socket.socket, payload: bytes) -> None:
+def _recv_frame(sock: socket.socket, trace: tracing.Trace | None = None) -> memoryview | None:
     """
-        Prepend a 4-byte big-endian length header to payload and send it in one sendall() call,
-        ensuring the receiver can parse message boundaries.
+        Relay-path twin of `_recv_prefixed`: the frame is read with recv_into
+        straight into one preallocated buffer that keeps its 4-byte header, so
+        it can be forwarded without re-framing or concatenation.
+        None on EOF or an invalid size.
+    """
+    hdr = _read_exact(sock, 4)
+    if not hdr:
+        return None
+    if trace is not None:
+        trace.header()
+    length = int.from_bytes(hdr, "big")
+    if length <= 0 or length > MAX_MSG_LEN:
+        return None
+    buf = bytearray(4 + length)
+    buf[:4] = hdr
+    view, got = memoryview(buf), 4
+    while got < len(buf):
+        n = sock.recv_into(view[got:])
+        if not n:
+            return None
+        got += n
+    if trace is not None:
+        trace.read_done()
+    return view
 
-        (Sends your data with a 4-byte length header so the receiver knows where the message ends.)
-        Goal: Send a message with a 4-byte length prefix.
+def _relay(conn, wire: memoryview) -> bool:
+    """Queue an already-framed buffer as-is (shared, never copied, across a fan-out)."""
+    try:
+        return conn.send_wire(wire, tracing.current())
+    except Exception as e:
+        logger.debug("relay failed: %s", e)
+        return False
 
-        First attach the message size (4 bytes).
+def _send_prefixed(conn, payload: bytes) -> bool:
+    """
+        Prepend a 4-byte big-endian length header to payload and queue it on
+        the client's outbound queue (see `_ClientConn` / `_AsyncConn`),
+        ensuring the receiver can parse message boundaries.
 
-        Then send both together in one sendall() call.
+        (Sends your data with a 4-byte length header so the receiver knows where the message ends.)
+        Never blocks: returns False if the frame was refused (client closing
+        or over its high-water mark).
     """
     try:
-        sock.sendall(len(payload).to_bytes(4, "big") + payload)
+        return conn.send(payload)
     except Exception as e:
         logger.debug("send failed: %s", e)
+        return False
 
-def _broadcast_user_list() -> None:
-    with _clients_lock:
-        users_csv = ",".join(connected_clients.keys())
-        targets   = [t[0] for t in connected_clients.values()]   # take only the socket
-    msg = f"USERS {users_csv}".encode()
-    for s in targets:
-        _send_prefixed(s, msg)
+# ── presence ───────────────────────────────────────────────────────
+# The helpers below run under _clients_lock: the map change, its sequence
+# number and the queued deltas stay in one order for every client.
+def _is_online(user: str) -> bool:
+    return user in connected_clients or user in remote_clients
+
+def _send_user_snapshot(conn) -> None:
+    """`USERS <seq> <csv>` - the full list, sent at login and on `USERS?`."""
+    users = [*connected_clients, *(u for u in remote_clients if u not in connected_clients)]
+    _send_prefixed(conn, f"USERS {_presence_seq} {','.join(users)}".encode())
+
+def _publish_presence(kind: str, user: str, skip=None) -> None:
+    """One `JOIN`/`LEAVE <seq> <user>` delta to every local client except *skip*."""
+    global _presence_seq
+    _presence_seq += 1
+    msg = f"{kind} {_presence_seq} {user}".encode()
+    for c, *_ in connected_clients.values():
+        if c is not skip:
+            _send_prefixed(c, msg)
 
 def broadcast(msg: str, *, exclude: str | None = None) -> None: # * = no more positional arguments after this, 
     """
@@ -353,12 +888,12 @@ def broadcast(msg: str, *, exclude: str | None = None) -> None: # * = no more po
 
     If any clients are "dead," close their sockets and remove them from the connected users list.
 
-    Then update everyone again with the new user list.
+    Then tell everyone who left.
     """
     dead = []
     with _clients_lock:
         items = list(connected_clients.items())
-    for user, (s, _) in items:
+    for user, (s, *_) in items:
         if user == exclude:
             continue
         try:
@@ -374,18 +909,560 @@ def broadcast(msg: str, *, exclude: str | None = None) -> None: # * = no more po
                 except Exception:
                     pass
                 connected_clients.pop(u, None)
-        _broadcast_user_list()
+                if not _is_online(u):
+                    _publish_presence("LEAVE", u)
+
+# ── outbound queues ────────────────────────────────────────────────
+class _TxStats:
+    """Frames queued against TLS writes issued - what coalescing saves."""
+
+    def __init__(self):
+        self.frames = self.writes = self.records = self.bytes = 0
+        self._lock = threading.Lock()
+
+    def add(self, frames: int, nbytes: int) -> None:
+        """One write of *nbytes* carrying *frames* frames."""
+        with self._lock:
+            self.frames  += frames
+            self.writes  += 1
+            self.records += -(-nbytes // _TLS_RECORD)
+            self.bytes   += nbytes
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"frames": self.frames, "writes": self.writes,
+                    "records": self.records, "bytes": self.bytes}
+
+_tx = _TxStats()
+
+def _start_tx_stats() -> None:
+    threading.Thread(target=_tx_stats_loop, daemon=True, name="tx-stats").start()
+
+def _tx_stats_loop() -> None:
+    last = 0
+    while True:
+        time.sleep(TX_STATS_SECS)
+        if _tx.frames != last:
+            last = _tx.frames
+            _log_tx_stats()
+
+def _log_tx_stats() -> None:
+    st = _tx.stats()
+    if not st["frames"]:
+        return
+    logger.info("tx: %d frames in %d writes / %d TLS records (%.1f frames per write, "
+                "cork %d B / %.1f ms)", st["frames"], st["writes"], st["records"],
+                st["frames"] / max(st["writes"], 1), CORK_BYTES, CORK_SECS * 1000)
+
+# ── metrics endpoint ───────────────────────────────────────────────
+# Values other code already keeps are read at scrape time, not mirrored.
+def _queue_depths() -> list[int]:
+    with _clients_lock:
+        return [c.queued_bytes for c, *_ in connected_clients.values()]
+
+metrics.REGISTRY.gauge("secure_chat_connected_clients", "Users logged in to this process",
+                       fn=lambda: len(connected_clients))
+metrics.REGISTRY.gauge("secure_chat_remote_clients", "Users on the other shard workers",
+                       fn=lambda: len(remote_clients))
+metrics.REGISTRY.gauge("secure_chat_send_queue_bytes", "Bytes queued for all local clients",
+                       fn=lambda: sum(_queue_depths()))
+metrics.REGISTRY.gauge("secure_chat_send_queue_max_bytes", "Deepest single client send queue",
+                       fn=lambda: max(_queue_depths(), default=0))
+metrics.REGISTRY.counter("secure_chat_sent_bytes_total", "Bytes written to client sockets",
+                         fn=lambda: _tx.bytes)
+metrics.REGISTRY.counter("secure_chat_sent_frames_total", "Frames written to client sockets",
+                         fn=lambda: _tx.frames)
+metrics.REGISTRY.counter("secure_chat_tls_writes_total", "Coalesced TLS writes issued",
+                         fn=lambda: _tx.writes)
+metrics.REGISTRY.counter("secure_chat_tls_records_total", "TLS records those writes produced",
+                         fn=lambda: _tx.records)
+metrics.REGISTRY.gauge("secure_chat_auth_pending", "Password checks queued or running",
+                       fn=lambda: _auth.stats()["pending"] if _auth else 0)
+metrics.REGISTRY.counter("secure_chat_auth_rejected_total", "Logins answered with BUSY",
+                         fn=lambda: _auth.rejected if _auth else 0)
+
+def _start_metrics() -> None:
+    tracing.set_rate(TRACE_RATE)
+    if METRICS_PORT is None:
+        return
+    try:
+        metrics.serve(METRICS_PORT)
+    except OSError as e:                   # port taken: chat keeps running
+        logger.error("Metrics endpoint disabled: %s", e)
+
+class _Outbox:
+    """
+    Slow-consumer policy shared by both connection types.
+    A frame that would push a client past SEND_QUEUE_HWM is dropped for that
+    client only; if it stays over the mark for SLOW_CONSUMER_SECS it is
+    disconnected.  Senders therefore pay O(1) per recipient, never a blocked
+    sendall().
+    """
+    addr = None
+    slow_since = 0.0
+    unacked: dict                      # (sender, msg_id) → CIPH wire, set per instance
+    pub_b64 = None                     # the session's KEYPUB, once logged in
+
+    def _admit(self, queued: int, size: int) -> bool:
+        if queued + size <= SEND_QUEUE_HWM:
+            if queued < SEND_QUEUE_HWM // 2:
+                self.slow_since = 0.0          # drained well below the mark
+            return True
+        now = time.monotonic()
+        if not self.slow_since:
+            self.slow_since = now
+            logger.warning("%s is a slow consumer (%d bytes queued)", self.addr, queued)
+        elif now - self.slow_since > SLOW_CONSUMER_SECS:
+            logger.warning("Dropping slow consumer %s", self.addr)
+            self.abort()
+        return False
+
+class _ClientConn(_Outbox):
+    """
+    Thread engine: bounded frame queue drained by one writer thread per
+    socket.  The writer takes every frame queued (up to CORK_BYTES, after
+    waiting at most CORK_SECS for more) and sends them as one buffer.
+    """
+
+    def __init__(self, sock: ssl.SSLSocket, addr):
+        self.sock, self.addr = sock, addr
+        self.unacked = {}
+        self._q: deque[tuple] = deque()                   # one tuple of parts per frame
+        self._queued = 0                                  # bytes waiting in _q
+        self._traced: deque[tuple] = deque()              # (entry, Trace, t_queued), in _q order
+        self._cv = threading.Condition()
+        self._closing = False
+        threading.Thread(target=self._drain, daemon=True,
+                         name=f"tx-{addr[0]}:{addr[1]}").start()
+
+    @property
+    def queued_bytes(self) -> int:
+        return self._queued
+
+    def send(self, payload: bytes) -> bool:
+        return self._push((len(payload).to_bytes(4, "big"), payload), 4 + len(payload))
+
+    def send_wire(self, frame, trace: tracing.Trace | None = None) -> bool:
+        """Queue a complete frame (header included); bytes or a memoryview."""
+        return self._push((frame,), len(frame), trace)
+
+    def _push(self, parts: tuple, size: int, trace: tracing.Trace | None = None) -> bool:
+        with self._cv:
+            if self._closing or not self._admit(self._queued, size):
+                return False
+            self._q.append(parts)
+            if trace is not None:
+                self._traced.append((parts, trace, time.perf_counter()))
+            self._queued += size
+            if self._queued == size or self._queued >= CORK_BYTES:
+                self._cv.notify()                         # writer idle, or its cork is full
+        return True
+
+    def _take(self) -> tuple[list, int, list]:
+        """Pop the next batch: at least one frame, more while under CORK_BYTES.
+           Also returns the traced frames in it."""
+        batch = [self._q.popleft()]
+        size = sum(map(len, batch[0]))
+        while self._q:
+            nxt = sum(map(len, self._q[0]))
+            if size + nxt > CORK_BYTES:
+                break
+            batch.append(self._q.popleft())
+            size += nxt
+        self._queued -= size
+        traced = []
+        if self._traced:
+            ids = {id(e) for e in batch}
+            while self._traced and id(self._traced[0][0]) in ids:
+                traced.append(self._traced.popleft())
+        return [p for e in batch for p in e], len(batch), traced
+
+    def _drain(self) -> None:
+        while True:
+            with self._cv:
+                while not self._q and not self._closing:
+                    self._cv.wait()
+                if not self._q:
+                    break                                 # closing and flushed
+                if CORK_SECS and self._queued < CORK_BYTES:
+                    deadline = time.monotonic() + CORK_SECS
+                    while self._queued < CORK_BYTES and not self._closing:
+                        left = deadline - time.monotonic()
+                        if left <= 0:
+                            break
+                        self._cv.wait(left)
+                    if not self._q:
+                        break                             # aborted while corked
+                parts, frames, traced = self._take()
+            t_taken = time.perf_counter() if traced else 0.0
+            data = parts[0] if len(parts) == 1 else b"".join(parts)
+            try:
+                self.sock.sendall(data)
+                _tx.add(frames, len(data))
+                if traced:
+                    t_done = time.perf_counter()
+                    for _, trace, t_queued in traced:
+                        trace.sent(t_queued, t_taken, t_done)
+            except Exception as e:
+                logger.debug("send to %s failed: %s", self.addr, e)
+                self.abort()
+                break
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except Exception:
+            pass
+        self.sock.close()
+
+    def close(self) -> None:
+        """Graceful: the writer flushes what is queued, then closes the socket."""
+        with self._cv:
+            self._closing = True
+            self._cv.notify()
+
+    def abort(self) -> None:
+        """Drop queued frames and cut the socket so the reader thread exits too."""
+        with self._cv:
+            self._closing = True
+            self._q.clear()
+            self._traced.clear()
+            self._queued = 0
+            self._cv.notify()
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except Exception:
+            pass
+
+# ── asyncio engine ─────────────────────────────────────────────────
+class _AsyncConn(_Outbox):
+    """
+    asyncio counterpart of `_ClientConn`: the transport's write buffer is the
+    queue and the event loop is the writer.  Only ever touched from the
+    event-loop thread, so write() just appends and never blocks.
+
+    Small frames are corked in a buffer first; it is written as one TLS
+    write at CORK_BYTES, or after CORK_SECS (0 → at the end of the current
+    loop iteration, which still gathers a whole fan-out or login burst).
+    """
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.addr = writer.get_extra_info("peername")
+        self.unacked = {}
+        self._loop = asyncio.get_running_loop()
+        self._cork = bytearray()
+        self._corked = 0                                  # frames in _cork
+        self._traced: list[tuple] = []                    # (Trace, t_queued) in _cork
+        self._flush_at: asyncio.Handle | None = None
+
+    @property
+    def queued_bytes(self) -> int:
+        return self.writer.transport.get_write_buffer_size() + len(self._cork)
+
+    def send(self, payload: bytes) -> bool:
+        return self._push(len(payload).to_bytes(4, "big"), payload)
+
+    def send_wire(self, frame, trace: tracing.Trace | None = None) -> bool:
+        return self._push(frame, trace=trace)
+
+    def _push(self, *parts, trace: tracing.Trace | None = None) -> bool:
+        if self.writer.is_closing():
+            return False
+        size = sum(map(len, parts))
+        if not self._admit(self.queued_bytes, size):
+            return False
+        if size >= CORK_BYTES:                            # too big to gain from corking
+            self.flush()
+            t_queued = time.perf_counter() if trace is not None else 0.0
+            data = parts[0] if len(parts) == 1 else b"".join(parts)
+            self.writer.write(data)
+            _tx.add(1, size)
+            if trace is not None:
+                trace.sent(t_queued, t_queued, time.perf_counter())
+            return True
+        for p in parts:
+            self._cork += p
+        self._corked += 1
+        if trace is not None:
+            self._traced.append((trace, time.perf_counter()))
+        if len(self._cork) >= CORK_BYTES:
+            self.flush()
+        elif self._flush_at is None:
+            self._flush_at = (self._loop.call_later(CORK_SECS, self.flush) if CORK_SECS
+                              else self._loop.call_soon(self.flush))
+        return True
+
+    def flush(self) -> None:
+        """Write out the corked frames now."""
+        if self._flush_at is not None:
+            self._flush_at.cancel()
+            self._flush_at = None
+        if not self._cork or self.writer.is_closing():
+            return
+        data, frames, traced = self._cork, self._corked, self._traced
+        self._cork, self._corked = bytearray(), 0         # the transport keeps `data`
+        if traced:
+            self._traced = []
+        t_taken = time.perf_counter() if traced else 0.0
+        self.writer.write(data)
+        _tx.add(frames, len(data))
+        if traced:
+            t_done = time.perf_counter()
+            for trace, t_queued in traced:
+                trace.sent(t_queued, t_taken, t_done)
+
+    def close(self) -> None:
+        self.flush()
+        self.writer.close()
+
+    def abort(self) -> None:
+        if self._flush_at is not None:
+            self._flush_at.cancel()
+            self._flush_at = None
+        self._cork, self._corked, self._traced = bytearray(), 0, []
+        self.writer.transport.abort()
+
+async def _a_recv_prefixed(reader: asyncio.StreamReader) -> bytes:
+    """asyncio twin of `_recv_prefixed` (same 4-byte big-endian framing)."""
+    try:
+        hdr = await asyncio.wait_for(reader.readexactly(4), SOCKET_TIMEOUT_SECS)
+        length = int.from_bytes(hdr, "big")
+        if length <= 0 or length > MAX_MSG_LEN:
+            return b""
+        return await asyncio.wait_for(reader.readexactly(length), SOCKET_TIMEOUT_SECS)
+    except asyncio.IncompleteReadError:
+        return b""
+    except asyncio.TimeoutError:
+        raise socket.timeout() from None
+
+async def _a_recv_frame(reader: asyncio.StreamReader,
+                        trace: tracing.Trace | None = None) -> memoryview | None:
+    """asyncio twin of `_recv_frame`.  StreamReader has no readinto, so the
+       header and body are joined once here - still one copy per frame, not
+       one per recipient."""
+    try:
+        hdr = await asyncio.wait_for(reader.readexactly(4), SOCKET_TIMEOUT_SECS)
+        if trace is not None:
+            trace.header()
+        length = int.from_bytes(hdr, "big")
+        if length <= 0 or length > MAX_MSG_LEN:
+            return None
+        body = await asyncio.wait_for(reader.readexactly(length), SOCKET_TIMEOUT_SECS)
+        if trace is not None:
+            trace.read_done()
+        return memoryview(hdr + body)
+    except asyncio.IncompleteReadError:
+        return None
+    except asyncio.TimeoutError:
+        raise socket.timeout() from None
+
+async def _handle_client_async(reader: asyncio.StreamReader,
+                               writer: asyncio.StreamWriter) -> None:
+    """Same handshake and routing as `handle_client`, one coroutine per user.
+       PBKDF2 goes to the auth pool and SQLite work to the default executor,
+       so a slow login never stalls the loop."""
+    loop = asyncio.get_running_loop()
+    conn = _AsyncConn(writer)
+    addr = conn.addr
+    ip = addr[0]
+    username = None
+    delivery = None                       # background drain of the offline queue
+    logger.info("Connection from %s", addr, extra=event("connect", addr=addr))
+    try:
+        wait = _is_locked(ip)
+        if wait:
+            _send_prefixed(conn, f"LOCKED {wait}".encode())
+            return
+
+        # 1) session ticket or username / password
+        creds = await _a_recv_prefixed(reader)
+        resumed = None
+        if creds.startswith(b"RESUME "):
+            resumed = await loop.run_in_executor(None, _redeem_ticket, creds)
+            _send_prefixed(conn, b"SUCCESS" if resumed else b"RESUMEFAIL")
+            if not resumed:
+                creds = await _a_recv_prefixed(reader)
+        if resumed:
+            username, pub_b64 = resumed
+        else:
+            if not creds or b":" not in creds:
+                _send_prefixed(conn, b"FAIL");  return
+            username, password = creds.decode().split(":", 1)
+            stored = await loop.run_in_executor(None, get_password_hash, username)
+            try:
+                ok = stored is not None and await asyncio.wrap_future(
+                    _auth.submit(stored, password))
+            except AuthOverloaded:
+                _send_prefixed(conn, f"BUSY {_AUTH_RETRY_SECS}".encode());  return
+            if not ok:
+                left = _register_fail(ip)
+                if left:
+                    _send_prefixed(conn, f"LOGINFAIL {left}".encode())
+                else:
+                    _send_prefixed(conn, f"LOCKED {_LOCK_SECS_LOGIN}".encode())
+                return
+            _clear_fail(ip)
+
+            # 2) USB 2-factor loop
+            _send_prefixed(conn, b"USBREQ")
+            while True:
+                usb = await _a_recv_prefixed(reader)
+                if not usb or b":" not in usb:
+                    _send_prefixed(conn, b"FAIL");  return
+                serial, digest = usb.decode().split(":", 1)
+                ok, wait, tries_left = await loop.run_in_executor(
+                    None, _verify_usb, username, serial, digest)
+                if ok:
+                    break
+                if wait:
+                    _send_prefixed(conn, f"LOCKED {wait}".encode())
+                    return
+                _send_prefixed(conn, f"USBFAIL {tries_left}".encode())
+
+            _send_prefixed(conn, b"SUCCESS")
+
+            # 3) expect KEYPUB
+            pubpkt = await _a_recv_prefixed(reader)
+            if not pubpkt.startswith(b"KEYPUB "):
+                logger.error("Keypub missing from %s", username); return
+            pub_b64 = pubpkt.split(b" ", 1)[1].decode()
+        _register_client(username, conn, addr, pub_b64)
+        delivery = asyncio.create_task(_a_deliver_offline(username, conn, pub_b64))
+
+        # 4) chat loop
+        while True:
+            trace = tracing.sample()
+            wire = await _a_recv_frame(reader, trace)
+            if wire is None: break
+            _dispatch_frame(wire, conn, trace)
+            await writer.drain()          # back-pressure on a flooding sender
+
+    except socket.timeout:
+        logger.info("%s timed out.", username or addr)
+    except (ConnectionResetError, BrokenPipeError, ssl.SSLError):
+        logger.info("%s disconnected abruptly.", username or addr)
+    except Exception as e:
+        logger.error("Unhandled error with %s: %s", addr, e)
+    finally:
+        if delivery is not None:
+            delivery.cancel()
+        _unregister_client(username, conn)
+        conn.close()
+        logger.info("Client '%s' disconnected.", username or addr,
+                    extra=event("disconnect", user=username, addr=addr))
+
+def _raise_nofile_limit() -> None:
+    """Lift the soft fd limit to the hard one (POSIX) - 10k sockets need it."""
+    try:
+        import resource
+    except ImportError:                    # Windows: no per-process fd cap
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or soft < hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        except (ValueError, OSError) as e:
+            logger.warning("Could not raise fd limit (%s): %s", soft, e)
+
+async def _serve_async(port: int, bus_path: str | None = None) -> None:
+    if bus_path is None:
+        ensure_db_ready()
+        backup_db()
+    else:                                  # shard worker: bus callbacks run on the loop
+        _attach_bus(bus_path, asyncio.get_running_loop().call_soon_threadsafe)
+    _start_auth_pool()
+    _start_offline_queue()
+    _start_ticket_authority()
+    _start_tx_stats()
+    _start_metrics()
+    _raise_nofile_limit()
+
+    cert_path, key_path = ensure_cert_in_cert_dir("server_cert.pem",
+                                                  "server_key.pem")
+    tls_ctx = configure_tls_context(certfile=cert_path, keyfile=key_path,
+                                    purpose=ssl.Purpose.CLIENT_AUTH)
+    server = await asyncio.start_server(
+        _handle_client_async, "0.0.0.0", port,
+        ssl=tls_ctx, ssl_handshake_timeout=_ASYNC_HANDSHAKE_SECS,
+        backlog=_ASYNC_BACKLOG, limit=_ASYNC_READ_LIMIT, reuse_address=True,
+        reuse_port=_bus is not None)
+    logger.info("Secure-Chat Server (asyncio) listening on 0.0.0.0:%s", port)
+    async with server:
+        await server.serve_forever()
+
+def start_server_async(port: int = PORT_DEFAULT, bus_path: str | None = None) -> None:
+    try:
+        asyncio.run(_serve_async(port, bus_path))
+    except KeyboardInterrupt:
+        logger.info("Shutting down server …")
+        _log_tx_stats()
+
+# ── sharded mode (--workers N) ─────────────────────────────────────
+def _shard_main(port: int, bus_path: str, engine: str, settings: dict) -> None:
+    """Entry point of one worker process (spawned, so settings are passed in)."""
+    globals().update(settings)
+    set_levels(LOG_LEVEL)
+    if LOG_FORMAT:
+        set_format(LOG_FORMAT)
+    signal.signal(signal.SIGINT, signal.default_int_handler)   # may be inherited as ignored
+    try:
+        if engine == "asyncio":
+            start_server_async(port, bus_path)
+        else:
+            start_server(port, bus_path)
+    finally:
+        if _auth is not None:          # multiprocessing joins the pool before its atexit runs
+            _auth.shutdown(wait=True)
+
+def start_sharded(port: int, workers: int, engine: str) -> None:
+    """Supervisor: prepare the DB once, run the bus broker, spawn the workers."""
+    if not hasattr(socket, "SO_REUSEPORT") or not hasattr(socket, "AF_UNIX"):
+        sys.exit("--workers needs SO_REUSEPORT and Unix sockets (Linux/BSD/macOS)")
+    ensure_db_ready()
+    backup_db()
+    ensure_cert_in_cert_dir("server_cert.pem", "server_key.pem")
+    TicketAuthority.from_file()            # one signing key for every worker
+    broker = shard_bus.ShardBroker(shard_bus.default_path(port)).start()
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+
+    cores = multiprocessing.cpu_count()
+    settings = {"SEND_QUEUE_HWM": SEND_QUEUE_HWM, "AUTH_MAX_PENDING": AUTH_MAX_PENDING,
+                "CORK_BYTES": CORK_BYTES, "CORK_SECS": CORK_SECS, "TRACE_RATE": TRACE_RATE,
+                "LOG_LEVEL": LOG_LEVEL, "LOG_FORMAT": LOG_FORMAT,
+                "AUTH_WORKERS": AUTH_WORKERS or max(1, cores // workers)}
+    ctx = multiprocessing.get_context("spawn")
+    procs = [ctx.Process(target=_shard_main, name=f"shard-{i}",
+                         args=(port, broker.path, engine,
+                               {**settings, "METRICS_PORT": METRICS_PORT and METRICS_PORT + i}))
+             for i in range(workers)]
+    for p in procs:
+        p.start()
+    logger.info("Secure-Chat Server: %d %s workers sharing port %s", workers, engine, port)
+    try:
+        for p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        logger.info("Shutting down server …")
+        for p in procs:                    # each worker runs its own graceful shutdown
+            if p.is_alive():
+                os.kill(p.pid, signal.SIGINT)
+        for p in procs:
+            p.join(timeout=5)
+            if p.is_alive():
+                p.terminate()
+    finally:
+        broker.close()
 
 # ── graceful shutdown ----------------------------------------------
 def shutdown(server_sock: ssl.SSLSocket) -> None:
     logger.info("Shutting down server …")
+    _log_tx_stats()
     try:
         server_sock.shutdown(socket.SHUT_RDWR)
     except Exception:
         pass
     server_sock.close()
     with _clients_lock:
-        for s, _ in connected_clients.values():
+        for s, *_ in connected_clients.values():
             try:
                 s.close()
             except Exception:
@@ -395,5 +1472,51 @@ def shutdown(server_sock: ssl.SSLSocket) -> None:
 
 # ── entrypoint ------------------------------------------------------
 if __name__ == "__main__":
-    port = int(sys.argv[1]) if len(sys.argv) == 2 else PORT_DEFAULT
-    start_server(port)
+    ap = argparse.ArgumentParser(description="Secure-Chat server")
+    ap.add_argument("port", nargs="?", type=int, default=PORT_DEFAULT)
+    ap.add_argument("--engine", choices=("threads", "asyncio"), default="threads",
+                    help="thread-per-client (default) or one asyncio event loop")
+    ap.add_argument("--send-hwm", type=int, default=SEND_QUEUE_HWM, metavar="BYTES",
+                    help="per-client outbound queue high-water mark")
+    ap.add_argument("--auth-workers", type=int, default=None, metavar="N",
+                    help="PBKDF2 worker processes (default: one per core)")
+    ap.add_argument("--auth-queue", type=int, default=None, metavar="N",
+                    help="pending password checks before logins get BUSY")
+    ap.add_argument("--workers", type=int, default=1, metavar="N",
+                    help="server processes sharing the port (POSIX; default 1)")
+    ap.add_argument("--cork-bytes", type=int, default=CORK_BYTES, metavar="BYTES",
+                    help="coalesce queued frames into writes up to this size (0 = off)")
+    ap.add_argument("--cork-ms", type=float, default=CORK_SECS * 1000, metavar="MS",
+                    help="wait this long for more frames before a short write")
+    ap.add_argument("--metrics-port", type=int, default=None, metavar="PORT",
+                    help="serve /metrics on 127.0.0.1:PORT (shard worker i: PORT+i)")
+    ap.add_argument("--trace-rate", type=float, default=TRACE_RATE, metavar="FRACTION",
+                    help="time this fraction of frames per stage (0 = off; POST /trace?rate= to change)")
+    ap.add_argument("--log-level", default=LOG_LEVEL, metavar="SPEC",
+                    help='e.g. INFO or "DEBUG,secure_chat.file_wire=WARNING"')
+    ap.add_argument("--log-format", choices=("text", "json"), default=LOG_FORMAT,
+                    help="log file format (default: $SECURE_CHAT_LOG_FORMAT or text)")
+    args = ap.parse_args()
+    if not 0 <= args.trace_rate <= 1:
+        ap.error("--trace-rate must be between 0 and 1")
+    SEND_QUEUE_HWM   = args.send_hwm
+    CORK_BYTES       = args.cork_bytes
+    CORK_SECS        = args.cork_ms / 1000
+    METRICS_PORT     = args.metrics_port
+    TRACE_RATE       = args.trace_rate
+    LOG_LEVEL        = args.log_level
+    LOG_FORMAT       = args.log_format
+    if LOG_FORMAT:
+        set_format(LOG_FORMAT)
+    try:
+        set_levels(LOG_LEVEL)
+    except ValueError as e:
+        ap.error(f"--log-level: {e}")
+    AUTH_WORKERS     = args.auth_workers
+    AUTH_MAX_PENDING = args.auth_queue
+    if args.workers > 1:
+        start_sharded(args.port, args.workers, args.engine)
+    elif args.engine == "asyncio":
+        start_server_async(args.port)
+    else:
+        start_server(args.port)
@@ -1,5 +1,7 @@
 # python/security/__init__.py
-from .encryption import encrypt_message, decrypt_message
+from .encryption import encrypt_message, decrypt_message, AEADSession, NonceExhausted
 from .key_management import generate_ecdh_keypair, derive_shared_key
-__all__ = ["encrypt_message", "decrypt_message",
-           "generate_ecdh_keypair", "derive_shared_key"]
+from .group_session import GroupSession
+from .delivery import MessageIds, DedupWindow
+__all__ = ["encrypt_message", "decrypt_message", "AEADSession", "NonceExhausted", "GroupSession",
+           "MessageIds", "DedupWindow", "generate_ecdh_keypair", "derive_shared_key"]
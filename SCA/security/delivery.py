@@ -0,0 +1,82 @@
+# security/delivery.py
+"""
+Message IDs and duplicate suppression for CIPH / BCAST frames.
+
+A message ID is `<epoch>.<seq>`: *epoch* is 8 hex digits drawn once per
+client process, *seq* counts up per conversation (one counter per peer,
+one for "Everyone").  It travels in clear for the server's ACK bookkeeping
+and is bound to the ciphertext as AAD, so it cannot be altered in transit.
+
+The server keeps a private message until the recipient ACKs it and hands
+it back after a reconnect, so the same ID can arrive twice; DedupWindow
+drops the repeat.
+"""
+import itertools
+import secrets
+import threading
+from typing import Dict, Optional, Tuple
+
+DEDUP_WINDOW = 256                 # seqs remembered behind the highest seen, per epoch
+DEDUP_EPOCHS = 4                   # sender restarts remembered per peer
+
+
+def parse_msg_id(msg_id: bytes | str) -> Optional[Tuple[int, int]]:
+    """(epoch, seq) or None if *msg_id* is malformed."""
+    if isinstance(msg_id, bytes):
+        msg_id = msg_id.decode(errors="replace")
+    epoch, _, seq = msg_id.partition(".")
+    try:
+        parsed = int(epoch, 16), int(seq)
+    except ValueError:
+        return None
+    return parsed if parsed[0] >= 0 and parsed[1] >= 0 else None
+
+
+class MessageIds:
+    """Outgoing IDs: monotonic per conversation within this process."""
+
+    def __init__(self):
+        self.epoch = f"{secrets.randbits(32):08x}"
+        self._counters: Dict[str, itertools.count] = {}
+        self._lock = threading.Lock()
+
+    def next(self, conversation: str) -> str:
+        with self._lock:
+            counter = self._counters.setdefault(conversation, itertools.count(1))
+            return f"{self.epoch}.{next(counter)}"
+
+
+class DedupWindow:
+    """
+    Sliding anti-replay window for one peer: the highest seq seen per epoch
+    plus a bitmask of the DEDUP_WINDOW seqs below it.  Anything older than
+    the window counts as already seen.
+    """
+    __slots__ = ("_epochs",)
+
+    def __init__(self):
+        self._epochs: Dict[int, list] = {}          # epoch → [highest, mask]
+
+    def accept(self, msg_id: bytes | str) -> bool:
+        """True the first time *msg_id* is offered, False for repeats and junk."""
+        parsed = parse_msg_id(msg_id)
+        if parsed is None:
+            return False
+        epoch, seq = parsed
+        state = self._epochs.pop(epoch, None)
+        if state is None:
+            state = [0, 0]
+            while len(self._epochs) >= DEDUP_EPOCHS:  # forget the least recently used
+                self._epochs.pop(next(iter(self._epochs)))
+        self._epochs[epoch] = state                   # re-insert → most recent
+        highest, mask = state
+        if seq > highest:
+            shift = seq - highest
+            state[0] = seq
+            state[1] = ((mask << shift) | 1) & ((1 << DEDUP_WINDOW) - 1)
+            return True
+        offset = highest - seq
+        if offset >= DEDUP_WINDOW or mask >> offset & 1:
+            return False
+        state[1] = mask | 1 << offset
+        return True
@@ -1,38 +1,137 @@
 # security/encryption.py
 
 import os
-import threading
+import hashlib
+import itertools
 import logging
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-from cryptography.hazmat.backends import default_backend
+import threading
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.exceptions import InvalidTag
 
 # Configure logger for this module
 logger = logging.getLogger('secure_chat.encryption')
 
-# Global variables for IV generation to ensure uniqueness
-_iv_counter = int.from_bytes(os.urandom(4), 'big')
-_iv_lock = threading.Lock()
+# Nonce layout (12 bytes): random prefix | big-endian counter
+NONCE_PREFIX_LEN  = 6
+NONCE_COUNTER_LEN = 12 - NONCE_PREFIX_LEN
+NONCE_BUDGET      = 2 ** 32       # encryptions per key context (NIST SP 800-38D)
 
-def _get_unique_iv() -> bytes:
+class NonceExhausted(Exception):
+    """This key has used its whole nonce budget - re-key before sending more."""
+
+class NonceSequence:
     """
-    Generates a unique 12-byte Initialization Vector (IV) for AES-GCM encryption.
-    
+    Generates unique 12-byte Initialization Vectors (IVs) for one AES-GCM key.
+
     The IV consists of:
-    - 4 bytes from an incrementing counter to ensure uniqueness across sessions.
-    - 8 bytes of random data to add unpredictability.
-    
-    Returns:
-        bytes: A unique 12-byte IV.
+    - 6 random bytes drawn once per sequence, so the two ends of a shared
+      key (each with its own sequence) never walk the same nonce space.
+    - a 6-byte counter, so IVs never repeat within the sequence.
+
+    `itertools.count` advances atomically under the GIL, so parallel
+    encryption threads get distinct IVs with no lock and no os.urandom()
+    per message.  Past `limit` IVs it raises NonceExhausted instead of
+    wrapping.
     """
-    global _iv_counter
-    with _iv_lock:
-        _iv_counter += 1
-        counter_bytes = _iv_counter.to_bytes(4, 'big')  # 4-byte counter in big-endian
-    random_bytes = os.urandom(8)  # 8 bytes of random data
-    return counter_bytes + random_bytes  # Total IV length: 12 bytes
-
-def encrypt_message(key: bytes, plaintext: str) -> bytes:
+    __slots__ = ("_prefix", "_counter", "limit")
+
+    def __init__(self, limit: int = NONCE_BUDGET):
+        self._prefix  = os.urandom(NONCE_PREFIX_LEN)
+        self._counter = itertools.count()
+        self.limit    = limit
+
+    def next(self) -> bytes:
+        n = next(self._counter)
+        if n >= self.limit:
+            raise NonceExhausted(f"nonce budget of {self.limit} messages used up")
+        return self._prefix + n.to_bytes(NONCE_COUNTER_LEN, 'big')
+
+# One sequence per key for the life of the process, keyed by a hash of the
+# key (no raw key material kept here).  Every AEADSession on the same key
+# draws from it, so a dropped cache entry or a second session object can
+# neither reset the budget nor start a new random prefix.
+_nonce_lock = threading.Lock()
+_nonce_state: dict[bytes, NonceSequence] = {}
+
+def nonce_sequence_for(key: bytes, limit: int = NONCE_BUDGET) -> NonceSequence:
+    """The key's NonceSequence; *limit* only applies when it is first created."""
+    kid = hashlib.sha256(key).digest()[:16]
+    seq = _nonce_state.get(kid)
+    if seq is None:
+        with _nonce_lock:
+            seq = _nonce_state.setdefault(kid, NonceSequence(limit))
+    return seq
+
+class AEADSession:
+    """
+    AES-256-GCM context bound to one 32-byte key.
+
+    The key schedule is built once (cryptography's AESGCM) and reused for
+    every message, instead of a fresh Cipher object per call.  Wire layout
+    is unchanged:  IV (12) | tag (16) | ciphertext.
+
+    Keep one per peer (ChatClient.peer_sessions) and call encrypt/decrypt
+    as often as needed; instances are safe to share between threads.
+    Nonces come from the key's shared NonceSequence (nonce_sequence_for);
+    once that budget is spent every session on the key raises
+    NonceExhausted.
+    """
+    __slots__ = ("key", "_aead", "_nonces")
+
+    def __init__(self, key: bytes, nonce_limit: int = NONCE_BUDGET):
+        if len(key) != 32:
+            raise ValueError("AEADSession needs a 32-byte key")
+        self.key = bytes(key)
+        self._aead = AESGCM(self.key)
+        self._nonces = nonce_sequence_for(self.key, nonce_limit)
+
+    def encrypt(self, plaintext: str | bytes, aad: bytes | None = None) -> bytes:
+        """Encrypt str (UTF-8) or bytes; returns IV + tag + ciphertext."""
+        if isinstance(plaintext, str):
+            plaintext = plaintext.encode('utf-8')
+        iv = self._nonces.next()
+        sealed = self._aead.encrypt(iv, plaintext, aad)   # ciphertext || tag
+        return iv + sealed[-16:] + sealed[:-16]
+
+    def decrypt(self, encrypted_message: bytes, aad: bytes | None = None) -> bytes | None:
+        """Return the plaintext bytes, or None if the blob is short/tampered."""
+        if len(encrypted_message) < 28:
+            logger.error("Encrypted message is too short to contain IV and Tag.")
+            return None
+        iv  = encrypted_message[:12]
+        tag = encrypted_message[12:28]
+        try:
+            return self._aead.decrypt(iv, encrypted_message[28:] + tag, aad)
+        except InvalidTag:
+            # The authentication tag does not match; the message has been tampered with or corrupted
+            logger.error("Invalid authentication tag. Decryption failed.")
+            logger.debug("Invalid authentication tag (expected if non-ciphertext frame)")
+            return None
+
+    def decrypt_text(self, encrypted_message: bytes, aad: bytes | None = None) -> str | None:
+        pt = self.decrypt(encrypted_message, aad)
+        if pt is None:
+            return None
+        try:
+            return pt.decode('utf-8')
+        except UnicodeDecodeError as e:
+            logger.error(f"Decryption failed: {e}")
+            return None
+
+
+# One-shot API below reuses sessions too, keyed by the raw key bytes.
+_SESSION_CACHE_MAX = 256
+_sessions: dict[bytes, AEADSession] = {}
+
+def _session_for(key: bytes) -> AEADSession:
+    sess = _sessions.get(key)
+    if sess is None:
+        if len(_sessions) >= _SESSION_CACHE_MAX:
+            _sessions.clear()                    # keys churn rarely; nonce state survives this
+        sess = _sessions.setdefault(bytes(key), AEADSession(key))
+    return sess
+
+def encrypt_message(key: bytes, plaintext: str | bytes) -> bytes:
     """
     Encrypts a plaintext message using AES-256 in Galois/Counter Mode (GCM).
     
@@ -40,7 +139,7 @@ def encrypt_message(key: bytes, plaintext: str) -> bytes:
     
     Args:
         key (bytes): A 32-byte (256-bit) symmetric encryption key.
-        plaintext (str): The message to be encrypted.
+        plaintext (str | bytes): The message to be encrypted.
     
     Returns:
         bytes: The encrypted message containing IV, authentication tag, and ciphertext.                #jamal >>   12(4,8)+16+axv32     
@@ -49,24 +148,7 @@ def encrypt_message(key: bytes, plaintext: str) -> bytes:
         Exception: If encryption fails for any reason.
     """
     try:
-        # Generate a unique IV for this encryption operation
-        iv = _get_unique_iv()
-        
-        # Initialize the AES-GCM cipher
-        encryptor = Cipher(
-            algorithms.AES(key),
-            modes.GCM(iv),
-            backend=default_backend()
-        ).encryptor()
-        
-        # Encrypt the plaintext
-        ciphertext = encryptor.update(plaintext.encode('utf-8')) + encryptor.finalize()
-        
-        # Concatenate IV, Tag, and Ciphertext for transmission/storage
-        encrypted_message = iv + encryptor.tag + ciphertext  # Total length: 12 + 16 + len(ciphertext)
-        
-        #logger.debug(f"Encryption successful. IV: {iv.hex()}, Tag: {encryptor.tag.hex()}, Ciphertext: {ciphertext.hex()}")
-        return encrypted_message
+        return _session_for(key).encrypt(plaintext)
     except Exception as e:
         logger.error(f"Encryption failed: {e}")
         raise
@@ -99,36 +181,8 @@ def decrypt_message(key: bytes, encrypted_message: bytes) -> str:
 
     """
     try:
-        # Ensure the encrypted message is long enough to contain IV and Tag
-        if len(encrypted_message) < 28:
-            logger.error("Encrypted message is too short to contain IV and Tag.")
-            return None
-
-        # Extract IV (12 bytes), Tag (16 bytes), and Ciphertext
-        iv = encrypted_message[:12]
-        tag = encrypted_message[12:28]
-        ciphertext = encrypted_message[28:]              #      abcdefghijklmnopqrstuvwxyz1234
-
-        # Initialize the AES-GCM cipher for decryption with the extracted IV and Tag
-        decryptor = Cipher(
-            algorithms.AES(key),
-            modes.GCM(iv, tag),
-            backend=default_backend()
-        ).decryptor()
-
-        # Decrypt the ciphertext
-        decrypted_padded = decryptor.update(ciphertext) + decryptor.finalize()
-        
-        # Decode the decrypted bytes to a UTF-8 string
-        decrypted_message = decrypted_padded.decode('utf-8')
-        
-        
-        return decrypted_message
-    except InvalidTag:
-        # The authentication tag does not match; the message has been tampered with or corrupted
-        logger.error("Invalid authentication tag. Decryption failed.")
-        logger.debug("Invalid authentication tag (expected if non-ciphertext frame)") 
-        return None
+        # IV (12) | Tag (16) | Ciphertext - split and tag check done by the session
+        return _session_for(key).decrypt_text(encrypted_message)
     except Exception as e:
         # Catch-all for any other exceptions during decryption
         logger.error(f"Decryption failed: {e}")
@@ -137,7 +191,7 @@ def decrypt_message(key: bytes, encrypted_message: bytes) -> str:
 
 """
 1. AES-GCM Encryption: Provides both confidentiality (hides the data) and integrity (ensures the data hasn’t been altered).
-2. Thread Safety: Ensures the IV is unique even when multiple threads are running.
+2. Thread Safety: Per-key nonce counters keep IVs unique across threads without a lock.
 3. Error Logging: Logs detailed errors for debugging if encryption or decryption fails.
 4. Secure Key Handling: Requires a 32-byte key, ensuring strong encryption.
 
@@ -0,0 +1,176 @@
+# security/file_pipeline.py
+"""
+Staged pipeline for outgoing file chunks.
+
+  reader   one thread: large sequential reads (READ_BLOCK) sliced into
+           chunks, hashing as it goes; seeks only when resuming
+  encrypt  ThreadPoolExecutor - AES-GCM in `cryptography` releases the GIL,
+           so chunks are sealed on several cores at once
+  sender   the caller, iterating the pipeline: frames come out in file order
+
+Stages are linked by a bounded queue of futures (PIPELINE_DEPTH), so at most
+that many chunks are read ahead of the socket.  Each stage records bytes and
+busy time; report() gives per-stage MB/s.  With workers=0 (the default on a
+single core, where thread hand-offs only cost time) the same stages run
+inline in the caller's thread.
+"""
+import hashlib
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, Optional
+
+logger = logging.getLogger('secure_chat.file_pipeline')
+
+READ_BLOCK      = 4 * 1024 * 1024
+ENCRYPT_WORKERS = min(4, (os.cpu_count() or 1) - 1)   # 0 → inline
+PIPELINE_DEPTH  = 32             # chunks read/encrypted ahead of the sender
+
+
+class _Stage:
+    """Bytes and busy seconds of one stage (shared by the encryption workers)."""
+    __slots__ = ("bytes", "busy", "_lock")
+
+    def __init__(self):
+        self.bytes, self.busy = 0, 0.0
+        self._lock = threading.Lock()
+
+    def add(self, n: int, secs: float) -> None:
+        with self._lock:
+            self.bytes += n
+            self.busy  += secs
+
+    def rate(self) -> float:
+        return self.bytes / 1e6 / self.busy if self.busy else 0.0
+
+
+class ChunkPipeline:
+    """
+    Iterate `(index, payload, plain_len)` in order for the chunks of *path*.
+
+    `encode(index, chunk)` turns a plaintext chunk into the frame payload.
+    *indices* limits the run to those chunks (resume); None reads the whole
+    file and makes its SHA-256 available as `sha256` afterwards.
+    Use as a context manager so the threads are stopped on early exit.
+    """
+
+    def __init__(self, path: str, chunk_size: int,
+                 encode: Callable[[int, memoryview], bytes],
+                 indices: Optional[list[int]] = None,
+                 workers: int = ENCRYPT_WORKERS, depth: int = PIPELINE_DEPTH):
+        self.path, self.chunk_size, self.indices = path, chunk_size, indices
+        self._encode  = encode
+        self._hasher  = hashlib.sha256() if indices is None else None
+        self._queue   = queue.Queue(maxsize=depth)
+        self._stop    = threading.Event()
+        self._workers = workers
+        self._pool    = ThreadPoolExecutor(workers, thread_name_prefix="ft_enc") if workers else None
+        self._reader  = threading.Thread(target=self._read_loop, daemon=True, name="ft_read")
+        self.read, self.encrypt, self.send = _Stage(), _Stage(), _Stage()
+        self.sha256: Optional[str] = None
+
+    def __enter__(self) -> "ChunkPipeline":
+        self._t0 = time.perf_counter()
+        if self._pool is not None:
+            self._reader.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # ── reader stage ──────────────────────────────────────────────────
+    def _chunks(self, f) -> Iterator[tuple[int, memoryview]]:
+        size = self.chunk_size
+        if self.indices is not None:
+            for idx in self.indices:
+                f.seek(idx * size)
+                t0 = time.perf_counter()
+                data = f.read(size)
+                self.read.add(len(data), time.perf_counter() - t0)
+                if data:
+                    yield idx, memoryview(data)
+            return
+        block, idx = max(size, READ_BLOCK // size * size), 0
+        while True:
+            t0 = time.perf_counter()
+            data = f.read(block)
+            if data:
+                self._hasher.update(data)
+            self.read.add(len(data), time.perf_counter() - t0)
+            if not data:
+                self.sha256 = self._hasher.hexdigest()
+                return
+            view = memoryview(data)
+            for off in range(0, len(data), size):
+                yield idx, view[off:off + size]
+                idx += 1
+
+    def _read_loop(self) -> None:
+        try:
+            with open(self.path, "rb") as f:
+                for idx, chunk in self._chunks(f):
+                    if not self._put(self._pool.submit(self._seal, idx, chunk)):
+                        return
+            self._put(None)                          # end of file
+        except Exception as e:                       # surfaces in the sender
+            self._put(e)
+
+    def _put(self, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    # ── encrypt stage ─────────────────────────────────────────────────
+    def _seal(self, idx: int, chunk: memoryview) -> tuple[int, bytes, int]:
+        t0 = time.perf_counter()
+        payload = self._encode(idx, chunk)
+        self.encrypt.add(len(chunk), time.perf_counter() - t0)
+        return idx, payload, len(chunk)
+
+    # ── sender side ───────────────────────────────────────────────────
+    def __iter__(self) -> Iterator[tuple[int, bytes, int]]:
+        if self._pool is None:                       # inline: read → seal → yield
+            with open(self.path, "rb") as f:
+                for idx, chunk in self._chunks(f):
+                    yield self._seal(idx, chunk)
+            return
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item.result()
+
+    def sent(self, n: int, secs: float) -> None:
+        """Sender reports each chunk it wrote (n plaintext bytes, secs in send)."""
+        self.send.add(n, secs)
+
+    def close(self) -> None:
+        self._stop.set()
+        while True:                                  # unblock the reader, drop read-ahead
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if hasattr(item, "cancel"):
+                item.cancel()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._reader.join(timeout=1.0)
+
+    def report(self) -> str:
+        wall = time.perf_counter() - self._t0
+        return (f"{self.send.bytes / 1e6:.1f} MB in {wall:.2f}s "
+                f"({self.send.bytes / 1e6 / max(wall, 1e-6):.1f} MB/s) - "
+                f"read {self.read.rate():.0f} MB/s, "
+                f"encrypt {self.encrypt.rate() * max(self._workers, 1):.0f} MB/s "
+                f"({f'{self._workers} workers' if self._workers else 'inline'}), "
+                f"send {self.send.rate():.0f} MB/s")
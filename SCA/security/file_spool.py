@@ -0,0 +1,195 @@
+# security/file_spool.py
+"""
+On-disk spool for incoming file transfers.
+
+Chunks are written straight into a preallocated (sparse) `<file_id>.part`
+file at offset `index * chunk_size` as they arrive; a bitmap with one bit
+per chunk records which ones are in.  Client memory stays constant no
+matter how large the file is, and saving it is a rename (or a streamed
+copy across volumes) instead of re-assembling chunks from RAM.
+
+Each unfinished transfer also has a small JSON journal next to it (the
+sender keeps one in OUTGOING_DIR) so it can be resumed after a reconnect
+or a restart: file_id, chunk bitmap and, once known, the SHA-256.
+"""
+import base64
+import hashlib
+import json
+import logging
+import math
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger('secure_chat.file_spool')
+
+SPOOL_DIR     = os.path.join(tempfile.gettempdir(), "secure_chat", "incoming")
+OUTGOING_DIR  = os.path.join(tempfile.gettempdir(), "secure_chat", "outgoing")
+JOURNAL_EVERY = 32                   # chunks between journal checkpoints
+JOURNAL_TTL   = 7 * 24 * 3600        # unfinished transfers older than this are dropped
+
+
+# ── journals ──────────────────────────────────────────────────────────────
+def write_journal(path: str, state: dict) -> None:
+    """Atomically replace the journal at *path*."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+def drop_journal(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def read_journals(directory: str) -> list[dict]:
+    """All readable, unexpired journals in *directory*; stale ones are deleted."""
+    states = []
+    if not os.path.isdir(directory):
+        return states
+    now = time.time()
+    for name in os.listdir(directory):
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            if now - os.path.getmtime(path) > JOURNAL_TTL:
+                drop_journal(path)
+                part = path[:-len(".json")] + ".part"
+                if os.path.exists(part):
+                    drop_journal(part)
+                continue
+            with open(path, encoding="utf-8") as f:
+                states.append(json.load(f))
+        except (OSError, ValueError) as e:
+            logger.warning("Skipping unreadable journal %s: %s", name, e)
+    return states
+
+
+def file_sha256(path: str, block: int = 1024 * 1024) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for buf in iter(lambda: f.read(block), b""):
+            h.update(buf)
+    return h.hexdigest()
+
+
+class IncomingSpool:
+    """One incoming file: sparse .part file + chunk bitmap."""
+
+    def __init__(self, file_id: str, size: int, chunk_size: int, spool_dir: str = SPOOL_DIR,
+                 bitmap: bytes | None = None):
+        os.makedirs(spool_dir, exist_ok=True)
+        self.file_id    = file_id
+        self.size       = size
+        self.chunk_size = chunk_size
+        self.total      = math.ceil(size / chunk_size)
+        self.bitmap     = bytearray((self.total + 7) // 8)
+        self.have       = 0
+        self.path       = os.path.join(spool_dir, f"{file_id}.part")
+        self.journal    = os.path.join(spool_dir, f"{file_id}.json")
+        self.saved      = False
+        self._lock      = threading.Lock()
+        if bitmap is not None:           # resuming - keep what is already on disk
+            self.bitmap[:] = bitmap[:len(self.bitmap)]
+            self.have = int.from_bytes(self.bitmap, "little").bit_count()
+            self._fh = open(self.path, "r+b")
+        else:
+            self._fh = open(self.path, "w+b")
+            self._fh.truncate(size)      # reserve the size; sparse where the FS allows
+
+    @classmethod
+    def restore(cls, state: dict, spool_dir: str = SPOOL_DIR) -> "IncomingSpool":
+        """Reopen a spool from its journal (FileNotFoundError if the .part is gone)."""
+        return cls(state["file_id"], state["size"], state["chunk_size"], spool_dir,
+                   bitmap=base64.b64decode(state["bitmap"]))
+
+    # ── bitmap ──────────────────────────────────────────────────────────
+    def has(self, idx: int) -> bool:
+        return bool(self.bitmap[idx >> 3] & (1 << (idx & 7)))
+
+    def missing(self) -> list[int]:
+        return [i for i in range(self.total) if not self.has(i)]
+
+    @property
+    def complete(self) -> bool:
+        return self.have == self.total
+
+    # ── data ────────────────────────────────────────────────────────────
+    def expected_len(self, idx: int) -> int:
+        if idx == self.total - 1:
+            return self.size - idx * self.chunk_size
+        return self.chunk_size
+
+    def write(self, idx: int, data: bytes) -> bool:
+        """Store chunk *idx*; False for duplicates and out-of-range or wrong-sized chunks."""
+        if not 0 <= idx < self.total or len(data) != self.expected_len(idx):
+            logger.warning("Dropped bad chunk %s for %s", idx, self.file_id)
+            return False
+        with self._lock:
+            if self.has(idx) or self._fh is None:
+                return False
+            self._fh.seek(idx * self.chunk_size)
+            self._fh.write(data)
+            self.bitmap[idx >> 3] |= 1 << (idx & 7)
+            self.have += 1
+            if self.complete:
+                self._fh.flush()
+        return True
+
+    def bitmap_b64(self) -> str:
+        with self._lock:
+            return base64.b64encode(bytes(self.bitmap)).decode()
+
+    def checkpoint(self, extra: dict) -> None:
+        """Flush data, then journal the bitmap (plus *extra*) - never ahead of the disk."""
+        with self._lock:
+            if self._fh is not None:
+                self._fh.flush()
+            state = {**extra, "file_id": self.file_id, "size": self.size,
+                     "chunk_size": self.chunk_size,
+                     "bitmap": base64.b64encode(bytes(self.bitmap)).decode()}
+        write_journal(self.journal, state)
+
+    def sha256(self) -> str:
+        with self._lock:
+            if self._fh is not None:
+                self._fh.flush()
+        return file_sha256(self.path)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+
+    def finish(self) -> None:
+        """Transfer verified - the journal is no longer needed."""
+        self.close()
+        drop_journal(self.journal)
+
+    def save_as(self, target: str) -> None:
+        """Move the finished file to *target* (rename if same volume, else streamed
+           copy); saving it again later copies from the first location."""
+        self.close()
+        if self.saved:
+            shutil.copyfile(self.path, target)
+            return
+        shutil.move(self.path, target)
+        self.path, self.saved = target, True
+
+    def discard(self) -> None:
+        self.close()
+        drop_journal(self.journal)
+        if self.saved:
+            return                       # the user's copy, not ours to delete
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
@@ -1,27 +1,193 @@
 import os
 import threading
+import time
 import base64
-import math
-import json
+import logging
 import tkinter.filedialog as fd
 import tkinter.messagebox as mb
-from uuid import uuid4
-import customtkinter as ctk
+from uuid import uuid4, UUID
 from tkinter import messagebox
-from security import encrypt_message, decrypt_message
+from .file_wire import (
+    WIRE_V1, WIRE_V2, SUPPORTED_VERSIONS, V1_CHUNK_SIZE, V2_CHUNK_SIZE,
+    seal_json, open_json, encode_v1, encode_v2, decode_v2
+)
+from .file_pipeline import ChunkPipeline
+from .file_spool import (
+    IncomingSpool, OUTGOING_DIR, SPOOL_DIR, JOURNAL_EVERY,
+    write_journal, drop_journal, read_journals, file_sha256
+)
+
+logger = logging.getLogger('secure_chat.file_transfer')
+
+CHUNK_SIZE = V1_CHUNK_SIZE  # 16 KB per chunk (v1 wire format)
+ACCEPT_TIMEOUT = 30.0       # seconds to wait for FILE_ACCEPT before cancelling the send
+
+# flow control
+FILE_WINDOW  = 8            # initial chunks in flight
+MIN_WINDOW   = 2
+MAX_WINDOW   = 64           # most chunks we let a sender have in flight to us
+RELAY_QUEUE  = 1024 * 1024  # server SEND_QUEUE_HWM: past it the relay drops our frames
+WINDOW_BYTES = RELAY_QUEUE // 4   # one transfer's share, so a few senders still fit
+ACK_TIMEOUT  = 30.0         # no FILE_ACK at all for this long → pause the transfer
+RTO_INITIAL  = 3.0          # resend a chunk not ACKed this long after it went out …
+RTO_MIN      = 1.0          # … or 4 × srtt once RTTs are known, at least this
+MAX_RESENDS  = 5            # a chunk lost this often pauses the transfer
+RTT_SLACK    = 0.02         # queueing tolerated above the best RTT before backing off
+
+
+def window_for(version: int, chunk_size: int) -> int:
+    """Most chunks in flight that keep one transfer within WINDOW_BYTES on the
+       relay.  v1 frames are about twice the chunk (base64 → JSON → base64)."""
+    wire = chunk_size if version == WIRE_V2 else 2 * chunk_size
+    return max(MIN_WINDOW, min(MAX_WINDOW, WINDOW_BYTES // wire))
+
+
+class TransferPaused(Exception):
+    """Link or receiver went away mid-transfer; keep the journal and wait for FILE_RESUME."""
+
+class TransferRefused(Exception):
+    """No usable FILE_ACCEPT: the two sides did not agree on wire format and flow control."""
+
+
+class FlowWindow:
+    """
+    Sender-side window for one transfer.  At most `cwnd` chunks are in flight
+    (sent, not yet FILE_ACKed by the receiver).  Each ACK gives an RTT sample:
+    while the smoothed RTT stays near the best one seen the window grows by
+    about one chunk per round trip; once it climbs past that (data queueing at
+    the relay or the receiver) the window is cut by a quarter, at most once
+    per RTT.  Sends are paced srtt/cwnd apart so a window never leaves as one
+    burst in front of chat frames on the same socket.
+
+    The relay drops frames for a recipient whose queue is full, so a chunk
+    not ACKed within the retransmission timeout counts as lost: `acquire` and
+    `drain` hand it back to be sent again (with a doubled timeout) and the
+    window is halved.  Resent chunks give no RTT samples.
+    """
+    def __init__(self, window: int, max_window: int = MAX_WINDOW):
+        self.cwnd     = float(max(MIN_WINDOW, min(window, max_window)))
+        self.max      = max(MIN_WINDOW, max_window)
+        self.sent     = {}          # index -> (monotonic send time, times resent)
+        self.srtt     = None
+        self.min_rtt  = None
+        self.resent   = 0           # chunks sent again after a timeout
+        self._next    = 0.0         # earliest time the next chunk may go out
+        self._backoff = 0.0
+        self._heard   = time.monotonic()   # last ACK (or start)
+        self._aborted = False
+        self._cond    = threading.Condition()
+
+    def abort(self) -> None:
+        """A FILE_RESUME superseded this send - wake it up so it can stop."""
+        with self._cond:
+            self._aborted = True
+            self._cond.notify_all()
+
+    def _rto(self, resends: int) -> float:
+        base = RTO_INITIAL if self.srtt is None else max(RTO_MIN, 4 * self.srtt)
+        return base * 2 ** resends
+
+    def _lost(self, now: float) -> list[int]:
+        """Chunks past their timeout, restamped as resent; cuts the window."""
+        lost = [i for i, (t, n) in self.sent.items() if now - t >= self._rto(n)]
+        for i in lost:
+            n = self.sent[i][1] + 1
+            if n > MAX_RESENDS:
+                raise TransferPaused(f"chunk {i} lost {MAX_RESENDS} times")
+            self.sent[i] = (now, n)
+        if lost:
+            self.resent += len(lost)
+            if now >= self._backoff:
+                self.cwnd = max(MIN_WINDOW, self.cwnd / 2)
+                self._backoff = now + (self.srtt or RTO_MIN)
+        return lost
+
+    def _wait(self, timeout: float) -> None:
+        """Sleep until an ACK, an abort or the next chunk timeout."""
+        if self._aborted:
+            raise TransferPaused("superseded by a resumed transfer")
+        now = time.monotonic()
+        if now - self._heard >= timeout:
+            raise TransferPaused("receiver stopped acknowledging chunks")
+        wake = self._heard + timeout
+        for t, n in self.sent.values():
+            wake = min(wake, t + self._rto(n))
+        self._cond.wait(max(0.0, wake - now))
+
+    def acquire(self, idx: int, timeout: float = ACK_TIMEOUT) -> list[int]:
+        """Block until chunk *idx* may be sent, or chunks in flight were lost.
+           Returns the lost indices for the caller to send again (then call
+           again for *idx*); [] once *idx* holds a slot.  Raises
+           TransferPaused if ACKs stop altogether."""
+        with self._cond:
+            while True:
+                if self._aborted:
+                    self._wait(timeout)
+                lost = self._lost(time.monotonic())
+                if lost:
+                    return lost
+                if len(self.sent) < int(self.cwnd):
+                    break
+                self._wait(timeout)
+            delay = self._next - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        with self._cond:
+            now = time.monotonic()
+            self.sent[idx] = (now, 0)
+            if self.srtt is not None:
+                self._next = now + self.srtt / self.cwnd
+        return []
+
+    def ack(self, idx: int) -> None:
+        with self._cond:
+            sent = self.sent.pop(idx, None)
+            if sent is None:
+                return
+            now = time.monotonic()
+            self._heard = now
+            self._cond.notify_all()
+            if sent[1]:
+                return                      # resent: which copy was ACKed is unknown
+            rtt = now - sent[0]
+            self.srtt    = rtt if self.srtt is None else 0.875 * self.srtt + 0.125 * rtt
+            self.min_rtt = rtt if self.min_rtt is None else min(self.min_rtt, rtt)
+            if self.srtt > max(2 * self.min_rtt, self.min_rtt + RTT_SLACK):
+                if now >= self._backoff:
+                    self.cwnd = max(MIN_WINDOW, self.cwnd * 0.75)
+                    self._backoff = now + self.srtt
+            else:
+                self.cwnd = min(self.max, self.cwnd + 1 / self.cwnd)
+
+    def drain(self, timeout: float = ACK_TIMEOUT) -> list[int]:
+        """Wait until every chunk sent so far has been acknowledged; returns
+           lost indices to send again first (then call again), [] when done."""
+        with self._cond:
+            while self.sent or self._aborted:
+                if self._aborted:
+                    self._wait(timeout)
+                lost = self._lost(time.monotonic())
+                if lost:
+                    return lost
+                self._wait(timeout)
+        return []
 
-CHUNK_SIZE = 16 * 1024  # 16 KB per chunk
 
 class FileTransferManager:
     """
     Manages end-to-end encrypted file transfers over the existing TLS channel.
     Attach to ChatClient and GUI to handle sending and receiving files.
     """
-    def __init__(self, chat_client, gui):
+    def __init__(self, chat_client, gui, window: int = FILE_WINDOW):
         self.chat_client = chat_client  # instance of ChatClient
         self.gui = gui                  # reference to GUI controller (e.g., root window)
-        self.incoming = {}              # file_id -> metadata + chunks
-        self.pending = {}               # file_id -> list of chunk JSON strings
+        self.window = window            # initial chunks in flight for our sends
+        self.flows = {}                 # file_id -> FlowWindow for each send in progress
+        self.incoming = {}              # file_id -> metadata + on-disk spool
+        self.pending = {}               # file_id -> list of (sender, index, chunk bytes, wire version)
+        self.accepts = {}               # file_id -> (Event, FILE_ACCEPT reply) for our offers
+        self.outgoing = {}              # file_id -> journal of our resumable sends
+        self._restored = False          # journals from disk loaded (needs the username)
 
     def send_file(self, file_path: str, recipient: str):
         """
@@ -48,19 +214,14 @@ class FileTransferManager:
             "type":      "FILE_OFFER",
             "file_id":   file_id,
             "file_name": file_name,
-            "file_size": file_size
+            "file_size": file_size,
+            "versions":  list(SUPPORTED_VERSIONS),   # wire formats we can send
+            "chunk_size": V2_CHUNK_SIZE              # chunk size if v2 is picked
         }
 
         # --- 2) Encrypt & send FILE_OFFER ---
-        payload = json.dumps(offer)
-        blob    = encrypt_message(key, payload) 
-        frame   = (
-            b"FILE_OFFER " +
-            self.chat_client.username.encode() + b" " +
-            recipient.encode() + b" " +
-            base64.b64encode(blob)
-        ) 
-        self.chat_client._send_prefixed(frame)
+        self.accepts[file_id] = (threading.Event(), {})
+        self._send_control("FILE_OFFER", recipient, offer)
 
         # --- 3) Show in sender GUI ---
         self.gui.add_sent_file_message(file_id, file_name, file_size)
@@ -73,80 +234,231 @@ class FileTransferManager:
             name=f"ft_send_{file_id[:8]}"
         ).start()
 
-    def _send_chunks(self, file_path: str, file_id: str, recipient: str):
-            """
-            Read the file in CHUNK_SIZE slices, encrypt each chunk as a JSON string,
-            and send it over the existing TLS socket.  On error, send a FILE_CANCEL.
-            Base64-encodes chunk → JSON → encrypt → send.
-            Each chunk is:
+    def _send_control(self, frame_type: str, peer: str, msg: dict):
+        """Encrypt a JSON control message for *peer* and send it as <TYPE> me peer blob."""
+        sess  = self.chat_client.get_session(peer)
+        frame = (
+            frame_type.encode() + b" " +
+            self.chat_client.username.encode() + b" " +
+            peer.encode() + b" " +
+            seal_json(sess, msg)
+        )
+        self.chat_client._send_prefixed(frame)
 
-            individually encrypted
+    def _negotiate(self, file_id: str) -> tuple[int, int, int]:
+        """Wait for the receiver's FILE_ACCEPT; (version, chunk_size, window).
+           The receiver builds its spool from the offer as soon as it answers,
+           so there is no silent fallback: no reply, or one without a wire
+           version we send and a FILE_ACK window, raises TransferRefused."""
+        event, reply = self.accepts.get(file_id, (None, {}))
+        if event is None or not event.wait(ACCEPT_TIMEOUT):
+            raise TransferRefused(f"no answer from the receiver within {ACCEPT_TIMEOUT:.0f}s")
+        version, window = reply.get("version"), reply.get("window")
+        if version not in SUPPORTED_VERSIONS:
+            raise TransferRefused(f"receiver picked unsupported wire version {version!r}")
+        if not isinstance(window, int) or window <= 0:
+            raise TransferRefused(f"receiver did not agree to FILE_ACK flow control "
+                                  f"(window {window!r})")
+        if version == WIRE_V2:
+            return (WIRE_V2,
+                    min(int(reply.get("chunk_size", V2_CHUNK_SIZE)), V2_CHUNK_SIZE),
+                    window)
+        return WIRE_V1, V1_CHUNK_SIZE, window
 
-            encoded safely for JSON and base64
+    def _send_chunks(self, file_path: str, file_id: str, recipient: str):
+            """
+            Wait for FILE_ACCEPT, then send the file in the agreed format.  The
+            receiver ACKs every chunk, so a FlowWindow always bounds and paces
+            the chunks in flight, and the transfer is journaled so it can be
+            resumed (FILE_RESUME) after either side reconnects.  On error, send
+            a FILE_CANCEL.
+
+            v2: FILE_DATA frames, fixed header + raw AES-GCM.
+            v1: FILE_CHUNK frames, base64 chunk → JSON → encrypt → base64
+                (only if the receiver picks it).
             """
-            key = self.chat_client.get_shared_key(recipient)
             try:
-                with open(file_path, "rb") as f:
-                    index = 0
-                    while True:
-                        chunk = f.read(CHUNK_SIZE)
-                        if not chunk:
-                            break
-
-                        # Build the chunk payload
-                        msg = {
-                            "type":    "FILE_CHUNK",
-                            "file_id": file_id,
-                            "index":   index,
-                            # base64-encode to JSON-safe text
-                            "data":    base64.b64encode(chunk).decode()
-                        }
-
-                        # **Pass a str** to encrypt_message
-                        payload = json.dumps(msg)
-                        blob    = encrypt_message(key, payload)
-
-                        # Frame = TYPE sender recipient base64(blob)
-                        frame = (
-                            b"FILE_CHUNK " +
-                            self.chat_client.username.encode() + b" " +
-                            recipient.encode() + b" " +
-                            base64.b64encode(blob)
-                        )
-                        self.chat_client._send_prefixed(frame)
-                        index += 1
-
-                        complete = {"type":"FILE_COMPLETE", "file_id":file_id}
-                        payload  = json.dumps(complete)
-                        blob     = encrypt_message(key, payload)
-                        frame    = (
-                            b"FILE_COMPLETE " +
-                            self.chat_client.username.encode() + b" " +
-                            recipient.encode() + b" " +
-                            base64.b64encode(blob)
-                        )
-                        self.chat_client._send_prefixed(frame)
-
-
+                version, chunk_size, window = self._negotiate(file_id)
+            except TransferRefused as e:
+                logger.error("File %s to %s not sent: %s", file_id, recipient, e)
+                try:
+                    self._send_control("FILE_CANCEL", recipient, {
+                        "type": "FILE_CANCEL", "file_id": file_id, "reason": str(e)})
+                except Exception:
+                    pass
+                self.gui.remove_file_message(file_id)
+                mb.showerror("File not sent", f"{os.path.basename(file_path)}: {e}")
+                return
+            finally:
+                self.accepts.pop(file_id, None)
+            job = {
+                "file_id": file_id, "owner": self.chat_client.username,
+                "recipient": recipient, "path": file_path,
+                "size": os.path.getsize(file_path), "mtime": os.path.getmtime(file_path),
+                "version": version, "chunk_size": chunk_size, "window": window,
+                "sha256": None
+            }
+            self.outgoing[file_id] = job
+            write_journal(self._out_journal(file_id), job)
+            self._pump(job, None)
+
+    def _pump(self, job: dict, indices: list[int] | None):
+            """Send chunks *indices* (None = whole file, hashing as it goes), then FILE_COMPLETE."""
+            file_id, recipient = job["file_id"], job["recipient"]
+            sess = self.chat_client.get_session(recipient)   # one AES key schedule for the whole file
+            me   = self.chat_client.username.encode()
+            chunk_size = job["chunk_size"]
+            flow = self.flows[file_id] = FlowWindow(
+                self.window, max_window=min(job["window"],
+                                            window_for(job["version"], chunk_size)))
+            try:
+                if job["version"] == WIRE_V2:
+                    prefix, encode = b"FILE_DATA " + me + b" " + recipient.encode() + b" ", encode_v2
+                else:
+                    prefix, encode = b"FILE_CHUNK " + me + b" " + recipient.encode() + b" ", encode_v1
+                inflight = {}                # index -> frame, kept until ACKed to resend it
+                def resend(lost):
+                    for i in lost:
+                        self._xmit(inflight[i])
+                # reader → encryption workers → this thread, in file order
+                with ChunkPipeline(job["path"], chunk_size,
+                                   lambda i, c: encode(sess, file_id, i, c),
+                                   indices) as pipe:
+                    for index, payload, n in pipe:
+                        while lost := flow.acquire(index):
+                            resend(lost)
+                        for i in [i for i in inflight if i not in flow.sent]:
+                            del inflight[i]      # ACKed
+                        t1 = time.perf_counter()
+                        # Frame = TYPE sender recipient payload
+                        inflight[index] = prefix + payload
+                        self._xmit(inflight[index])
+                        pipe.sent(n, time.perf_counter() - t1)
+                    while lost := flow.drain():
+                        resend(lost)
+                logger.info("Sent %s to %s: %s", file_id, recipient, pipe.report())
+                logger.debug("%s window %.1f, srtt %.1f ms, %d chunks resent",
+                             file_id, flow.cwnd, (flow.srtt or 0) * 1000, flow.resent)
+                if pipe.sha256 is not None:
+                    job["sha256"] = pipe.sha256
+                elif job["sha256"] is None:
+                    job["sha256"] = file_sha256(job["path"])
+                if file_id in self.outgoing:
+                    write_journal(self._out_journal(file_id), job)
+                self._xmit_control("FILE_COMPLETE", recipient, {
+                    "type": "FILE_COMPLETE", "file_id": file_id, "sha256": job["sha256"],
+                    "version": job["version"], "chunk_size": chunk_size})
+
+            except TransferPaused as e:
+                if file_id in self.outgoing:
+                    logger.info("Transfer %s to %s paused (%s) - waiting for FILE_RESUME",
+                                file_id, recipient, e)
+                else:
+                    logger.warning("Transfer %s to %s lost: %s", file_id, recipient, e)
             except Exception as e:
                 # On any error, notify the recipient that this transfer was canceled
-                cancel = {
-                    "type":    "FILE_CANCEL",
-                    "file_id": file_id,
-                    "reason":  str(e)
-                }
-
-                # Again, pass str into encrypt_message—no .encode() here
-                payload = json.dumps(cancel)
-                blob    = encrypt_message(key, payload)
-
-                frame = (
-                    b"FILE_CANCEL " +
-                    self.chat_client.username.encode() + b" " +
-                    recipient.encode() + b" " +
-                    base64.b64encode(blob)
-                )
-                self.chat_client._send_prefixed(frame)
+                self._forget_outgoing(file_id)
+                try:
+                    self._send_control("FILE_CANCEL", recipient, {
+                        "type":    "FILE_CANCEL",
+                        "file_id": file_id,
+                        "reason":  str(e)
+                    })
+                except Exception:
+                    pass
+            finally:
+                if self.flows.get(file_id) is flow:
+                    self.flows.pop(file_id, None)
+
+    def _xmit(self, frame: bytes):
+        try:
+            self.chat_client._send_prefixed(frame)
+        except (OSError, AttributeError) as e:        # socket gone / being replaced
+            raise TransferPaused(f"connection lost: {e}") from e
+
+    def _xmit_control(self, frame_type: str, peer: str, msg: dict):
+        sess = self.chat_client.get_session(peer)
+        if sess is None:
+            raise TransferPaused(f"no session with {peer}")
+        self._xmit(frame_type.encode() + b" " + self.chat_client.username.encode() + b" " +
+                   peer.encode() + b" " + seal_json(sess, msg))
+
+    @staticmethod
+    def _out_journal(file_id: str) -> str:
+        return os.path.join(OUTGOING_DIR, f"{file_id}.json")
+
+    def _forget_outgoing(self, file_id: str):
+        if self.outgoing.pop(file_id, None) is not None:
+            drop_journal(self._out_journal(file_id))
+
+    # ── resume after re-key ─────────────────────────────────────────────
+    def _restore_journals(self):
+        """Load our unfinished transfers from disk once the username is known."""
+        if self._restored:
+            return
+        self._restored = True
+        me = self.chat_client.username
+        for job in read_journals(OUTGOING_DIR):
+            if job.get("owner") == me and job.get("file_id") not in self.outgoing:
+                self.outgoing[job["file_id"]] = job
+        for state in read_journals(SPOOL_DIR):
+            fid = state.get("file_id")
+            if state.get("owner") != me or fid in self.incoming:
+                continue
+            try:
+                spool = IncomingSpool.restore(state)
+            except (OSError, KeyError, ValueError) as e:
+                logger.warning("Cannot resume %s: %s", fid, e)
+                drop_journal(os.path.join(SPOOL_DIR, f"{fid}.json"))
+                continue
+            self.incoming[fid] = {
+                "name": state["name"], "size": state["size"], "spool": spool,
+                "sender": state["sender"], "ack": True, "complete": False,
+                "sha256": state.get("sha256"), "shown": False,
+                "version": state.get("version")
+            }
+        logger.debug("Restored %d outgoing / %d incoming transfers",
+                     len(self.outgoing), len(self.incoming))
+
+    def on_peer_rekeyed(self, peer: str):
+        """
+        Called after a fresh KEYPUB from *peer* (either side reconnected).
+        For every unfinished transfer *peer* was sending us, ask for just the
+        chunks we are missing.
+        """
+        self._restore_journals()
+        for fid, entry in list(self.incoming.items()):
+            if entry["sender"] != peer or not entry["ack"] or entry["complete"]:
+                continue
+            if not entry.get("shown", True):
+                self.gui.add_incoming_file_message(fid, entry["name"], entry["size"])
+                entry["shown"] = True
+            self._send_control("FILE_RESUME", peer, {
+                "type": "FILE_RESUME", "file_id": fid,
+                "have": entry["spool"].bitmap_b64()
+            })
+
+    def _on_resume(self, sender, data):
+        fid = data.get("file_id")
+        job = self.outgoing.get(fid)
+        path = job and job["path"]
+        if (job is None or job["recipient"] != sender or not os.path.exists(path)
+                or os.path.getsize(path) != job["size"]
+                or os.path.getmtime(path) != job["mtime"]):
+            self._send_control("FILE_CANCEL", sender, {
+                "type": "FILE_CANCEL", "file_id": fid, "reason": "transfer cannot be resumed"})
+            self._forget_outgoing(fid)
+            return
+        old = self.flows.get(fid)
+        if old is not None:
+            old.abort()                      # previous attempt is stuck waiting for ACKs
+        have = base64.b64decode(data.get("have", ""))
+        total = -(-job["size"] // job["chunk_size"])
+        missing = [i for i in range(total)
+                   if i >> 3 >= len(have) or not have[i >> 3] & (1 << (i & 7))]
+        logger.info("Resuming %s to %s: %d of %d chunks missing", fid, sender, len(missing), total)
+        threading.Thread(target=self._pump, args=(job, missing), daemon=True,
+                         name=f"ft_resume_{fid[:8]}").start()
 
     def download_file(self, file_id: str):
         entry = self.incoming.get(file_id)
@@ -164,25 +476,13 @@ class FileTransferManager:
 
         # disable the button immediately
         self.chat_client.master.after(0,
-            lambda: self.chat_client.set_download_state(file_id, text="0%", state="disabled")
+            lambda: self.chat_client.set_download_state(file_id, text="Saving…", state="disabled")
         )
 
         def _worker():
-            total_chunks = math.ceil(entry["size"] / CHUNK_SIZE)
             try:
-                with open(path, "wb") as out:
-                    for idx in range(total_chunks):
-                        out.write(entry["chunks"][idx])
-                        # compute percent
-                        pct = int((idx+1) * 100 / total_chunks)
-                        # schedule UI update
-                        self.chat_client.master.after(0,
-                            lambda p=pct: self.chat_client.set_download_state(
-                                file_id,
-                                text=f"{p}%",
-                                state="disabled"
-                            )
-                        )
+                # rename out of the spool (streamed copy across volumes) - constant memory
+                entry["spool"].save_as(path)
                 # open file automatically if desired
                 if os.name == "nt":
                     os.startfile(path)
@@ -191,8 +491,10 @@ class FileTransferManager:
                     call(["xdg-open", path])
             except Exception as e:
                 mb.showerror("Error Saving File", str(e))
+            else:
+                mb.showinfo("Download Complete", f"Saved to {path}")
             finally:
-                # always re-enable the button at 100%
+                # always re-enable the button
                 self.chat_client.master.after(0,
                     lambda: self.chat_client.set_download_state(
                         file_id,
@@ -200,105 +502,226 @@ class FileTransferManager:
                         state="normal"
                     )
                 )
-                mb.showinfo("Download Complete", f"Saved to {path}")
 
         threading.Thread(target=_worker, daemon=True).start()
 
-    def download_file(self, file_id: str):
-        entry = self.incoming.get(file_id)
-        if not entry or not entry["complete"]:
-            mb.showinfo("Download", "File not fully received yet.")
-            return
-
-        # ask user where to save
-        path = fd.asksaveasfilename(
-            title="Save file as…",
-            initialfile=entry["name"]
-        )
-        if not path:
-            return
-
-        try:
-            total_chunks = math.ceil(entry["size"] / CHUNK_SIZE)
-            with open(path, "wb") as out:
-                for idx in range(total_chunks):
-                    out.write(entry["chunks"][idx])
-            # optionally open it:
-            if os.name == "nt":
-                os.startfile(path)
-            else:
-                from subprocess import call
-                call(["xdg-open", path])
-        except Exception as e:
-            mb.showerror("Error Saving File", str(e))
-        else:
-            mb.showinfo("Download Complete", f"Saved to {path}")
     def handle_frame(self, frame_type, sender, blob_b64):
         # Called from ChatClient._recv_loop for file-related frames
-        key = self.chat_client.get_shared_key(sender)
-        try:
-            raw = base64.b64decode(blob_b64)
-            plaintext = decrypt_message(key, raw)
-            data = json.loads(plaintext)
-        except Exception:
+        sess = self.chat_client.get_session(sender)
+        if sess is None:
+            return  # no key exchange with this sender yet
+
+        if frame_type == "FILE_DATA":          # v2: binary payload, not base64
+            decoded = decode_v2(sess, blob_b64)
+            if decoded is not None:
+                self._on_data(sender, *decoded, WIRE_V2)
+            return
+
+        data = open_json(sess, blob_b64)
+        if data is None:
             return  # decryption/parsing failed
 
         typ = data.get("type")
         if typ == "FILE_OFFER":
-            self._on_offer(data)
+            self._on_offer(sender, data)
+        elif typ == "FILE_ACCEPT":
+            self._on_accept(data)
+        elif typ == "FILE_ACK":
+            self._on_ack(sender, data)
         elif typ == "FILE_CHUNK":
-            self._on_chunk(data)
+            self._on_chunk(sender, data)
+        elif typ == "FILE_COMPLETE":
+            self._on_complete(sender, data)
+        elif typ == "FILE_RESUME":
+            self._on_resume(sender, data)
         elif typ == "FILE_CANCEL":
-            self._on_cancel(data)
+            self._on_cancel(sender, data)
 
-    def _on_offer(self, offer):
+    def _on_offer(self, sender, offer):
         fid = offer["file_id"]
+        try:
+            fid = str(UUID(fid))         # also names the spool file - never trust it raw
+        except (ValueError, TypeError, AttributeError):
+            return
+        # pick the newest wire format both sides speak
+        common = set(offer.get("versions", [WIRE_V1])) & set(SUPPORTED_VERSIONS)
+        version = max(common) if common else WIRE_V1
+        chunk_size = V1_CHUNK_SIZE
+        if version == WIRE_V2:
+            chunk_size = min(int(offer.get("chunk_size", V2_CHUNK_SIZE)), V2_CHUNK_SIZE)
         self.incoming[fid] = {
             "name": offer["file_name"],
             "size": offer["file_size"],
-            "chunks": {},
-            "received": 0,
-            "complete": False
+            "spool": IncomingSpool(fid, offer["file_size"], chunk_size),  # chunks go to disk
+            "sender": sender,
+            "ack": "versions" in offer,      # negotiating senders get FILE_ACKs, can resume
+            "complete": False,
+            "sha256": None,
+            "shown": True,
+            "version": version if "versions" in offer else None   # None: old sender, any frame
         }
+        if "versions" in offer:              # sender negotiates - tell it what we want
+            self._checkpoint(fid)
+            self._send_control("FILE_ACCEPT", sender, {
+                "type": "FILE_ACCEPT", "file_id": fid,
+                "version": version, "chunk_size": chunk_size,
+                "window": window_for(version, chunk_size)   # we ACK every chunk; at
+                                                            # most this many in flight
+            })
         # process any chunks that arrived early
-        for chunk in self.pending.get(fid, []):
-            self._store_chunk(fid, chunk)
-        self.pending.pop(fid, None)
+        for who, idx, data, wire in self.pending.pop(fid, []):
+            if who == sender and fid in self.incoming:
+                self._on_data(who, fid, idx, data, wire)
+        if fid not in self.incoming:
+            return                           # rejected while replaying early chunks
         # update GUI: show incoming file placeholder
         self.gui.add_incoming_file_message(
             fid,
             self.incoming[fid]["name"],
             self.incoming[fid]["size"]
         )
+        if self.incoming[fid]["spool"].complete and not self.incoming[fid]["ack"]:
+            self._mark_complete(fid)         # empty file from an old client - nothing to wait for
+
+    def _on_accept(self, accept):
+        waiter = self.accepts.get(accept.get("file_id"))
+        if waiter:
+            event, reply = waiter
+            reply.update(accept)
+            event.set()
+
+    def _on_ack(self, sender, ack):
+        fid = ack.get("file_id")
+        if "ok" in ack:                      # receiver verified (or rejected) the whole file
+            job = self.outgoing.get(fid)
+            if job is not None and job["recipient"] == sender:
+                if not ack["ok"]:
+                    logger.error("%s rejected %s: content hash mismatch", sender, fid)
+                self._forget_outgoing(fid)
+            return
+        flow = self.flows.get(fid)
+        if flow is not None:
+            flow.ack(ack.get("index"))
 
-    def _on_chunk(self, chunk):
+    def _on_chunk(self, sender, chunk):
         fid = chunk["file_id"]
-        if fid not in self.incoming:
+        self._on_data(sender, fid, chunk["index"], base64.b64decode(chunk["data"].encode()),
+                      WIRE_V1)
+
+    def _on_data(self, sender, fid, idx, data, wire):
+        entry = self.incoming.get(fid)
+        if entry is None:
             # buffer until offer arrives
-            self.pending.setdefault(fid, []).append(chunk)
+            self.pending.setdefault(fid, []).append((sender, idx, data, wire))
             return
-        self._store_chunk(fid, chunk)
+        if entry["sender"] != sender:
+            return  # not this peer's transfer
+        if entry.get("version") not in (None, wire):
+            self._reject(fid, f"sender uses wire v{wire}, v{entry['version']} was agreed")
+            return
+        spool = entry["spool"]
+        if 0 <= idx < spool.total and len(data) != spool.expected_len(idx):
+            self._reject(fid, f"chunk {idx} is {len(data)} B, expected {spool.expected_len(idx)} B")
+            return
+        self._store_chunk(fid, idx, data)
+
+    def _reject(self, fid, reason):
+        """The sender is not doing what we agreed on: stop loudly on both ends."""
+        entry = self.incoming.pop(fid)
+        logger.error("Transfer %s from %s cancelled: %s", fid, entry["sender"], reason)
+        try:
+            self._send_control("FILE_CANCEL", entry["sender"], {
+                "type": "FILE_CANCEL", "file_id": fid, "reason": reason})
+        except Exception:
+            pass
+        entry["spool"].discard()
+        self.gui.remove_file_message(fid)
 
-    def _store_chunk(self, fid, chunk):
+    def _store_chunk(self, fid, idx, data):
         """ Store a chunk of data in the incoming file entry.
             If the file is complete, notify the GUI.
         """
         entry = self.incoming[fid]
-        idx = chunk["index"]
-        data = base64.b64decode(chunk["data"].encode())
-        if idx in entry["chunks"]:
-            return  # duplicate
-        entry["chunks"][idx] = data
-        entry["received"] += len(data)
-        # if complete, notify GUI
-        if entry["received"] >= entry["size"]:
-            entry["complete"] = True
-            self.gui.enable_download(fid)
-
-    def _on_cancel(self, cancel):
+        stored = entry["spool"].write(idx, data)
+        if entry["ack"] and entry["spool"].has(idx):   # ACK duplicates too
+            self._send_control("FILE_ACK", entry["sender"],
+                               {"type": "FILE_ACK", "file_id": fid, "index": idx})
+        if not stored:
+            return  # duplicate or malformed
+        if not entry["ack"]:
+            if entry["spool"].complete:      # old sender: no hash, no journal
+                self._mark_complete(fid)
+            return
+        if entry["spool"].have % JOURNAL_EVERY == 0:
+            self._checkpoint(fid)
+        if entry["spool"].complete and entry["sha256"]:
+            self._verify(fid)
+
+    def _checkpoint(self, fid):
+        entry = self.incoming[fid]
+        entry["spool"].checkpoint({
+            "owner": self.chat_client.username, "sender": entry["sender"],
+            "name": entry["name"], "sha256": entry["sha256"], "version": entry.get("version")
+        })
+
+    def _on_complete(self, sender, data):
+        entry = self.incoming.get(data.get("file_id"))
+        if entry is None or entry["sender"] != sender or not entry["ack"]:
+            return  # old clients send FILE_COMPLETE without a hash - completion is the bitmap
+        fid = data["file_id"]
+        if (entry.get("version") is not None and
+                (data.get("version"), data.get("chunk_size")) !=
+                (entry["version"], entry["spool"].chunk_size)):
+            self._reject(fid, f"sender finished with wire v{data.get('version')} / "
+                              f"{data.get('chunk_size')} B chunks, agreed "
+                              f"v{entry['version']} / {entry['spool'].chunk_size} B")
+            return
+        entry["sha256"] = data.get("sha256")
+        if entry["spool"].complete and not entry["complete"]:
+            self._verify(data["file_id"])
+
+    def _verify(self, fid):
+        """Hash the spooled file off the receive thread; enable Download only if it matches."""
+        entry = self.incoming[fid]
+        if entry.get("verifying"):
+            return
+        entry["verifying"] = True
+
+        def _worker():
+            ok = entry["spool"].sha256() == entry["sha256"]
+            try:
+                self._send_control("FILE_ACK", entry["sender"],
+                                   {"type": "FILE_ACK", "file_id": fid, "ok": ok})
+            except Exception as e:
+                logger.warning("Could not confirm %s to %s: %s", fid, entry["sender"], e)
+            if ok:
+                entry["spool"].finish()
+                self._mark_complete(fid)
+            else:
+                logger.error("Content hash mismatch for %s from %s", fid, entry["sender"])
+                self.incoming.pop(fid, None)
+                entry["spool"].discard()
+                self.gui.remove_file_message(fid)
+
+        threading.Thread(target=_worker, daemon=True, name=f"ft_verify_{fid[:8]}").start()
+
+    def _mark_complete(self, fid):
+        entry = self.incoming[fid]
+        entry["spool"].close()
+        entry["complete"] = True
+        self.gui.enable_download(fid)
+
+    def _on_cancel(self, sender, cancel):
         fid = cancel.get("file_id")
+        job = self.outgoing.get(fid)
+        if job is not None and job["recipient"] == sender:   # receiver gave up on our send
+            logger.error("%s cancelled %s: %s", sender, fid, cancel.get("reason", "no reason"))
+            self._forget_outgoing(fid)
+            flow = self.flows.get(fid)
+            if flow is not None:
+                flow.abort()
+        entry = self.incoming.get(fid)
         # clean up stored data
-        if fid in self.incoming:
-            del self.incoming[fid]
+        if entry is not None and entry["sender"] == sender:
+            self.incoming.pop(fid)["spool"].discard()
             self.gui.remove_file_message(fid)
-
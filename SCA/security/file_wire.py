@@ -0,0 +1,75 @@
+# security/file_wire.py
+"""
+Payload codecs for the FILE_* frames (no GUI imports - usable from bench/).
+
+v1  FILE_CHUNK  base64( AEAD( json{type, file_id, index, data: base64(chunk)} ) )
+v2  FILE_DATA   header | AEAD(chunk, aad=header)          - raw bytes, no base64/JSON
+
+The v2 header is fixed-size: version (1) | file_id uuid (16) | index (4) |
+plaintext length (4).  Authenticating it as AAD stops chunks being swapped
+between files or positions.  The version is negotiated per transfer:
+FILE_OFFER lists the sender's versions, the receiver answers FILE_ACCEPT
+with its pick; a sender that hears nothing cancels rather than guess.
+"""
+import base64
+import json
+import logging
+import struct
+import uuid
+from typing import Optional, Tuple
+
+from .encryption import AEADSession
+
+logger = logging.getLogger('secure_chat.file_wire')
+
+WIRE_V1, WIRE_V2 = 1, 2
+SUPPORTED_VERSIONS = (WIRE_V1, WIRE_V2)
+V1_CHUNK_SIZE = 16 * 1024
+V2_CHUNK_SIZE = 60 * 1024        # header + AEAD + names stay under the 64 KB frame cap
+
+V2_HEADER = struct.Struct(">B16sII")
+
+
+# ── JSON control messages (OFFER / ACCEPT / CHUNK v1 / COMPLETE / CANCEL) ──
+def seal_json(sess: AEADSession, msg: dict) -> bytes:
+    """Encrypt a control message; returns the base64 blob that ends the frame."""
+    return base64.b64encode(sess.encrypt(json.dumps(msg)))
+
+
+def open_json(sess: AEADSession, blob_b64: bytes) -> Optional[dict]:
+    """Inverse of seal_json; None if it does not decrypt or parse."""
+    try:
+        plaintext = sess.decrypt(base64.b64decode(blob_b64))
+        return json.loads(plaintext) if plaintext is not None else None
+    except (ValueError, TypeError):
+        return None
+
+
+def encode_v1(sess: AEADSession, file_id: str, index: int, chunk: bytes) -> bytes:
+    return seal_json(sess, {
+        "type":    "FILE_CHUNK",
+        "file_id": file_id,
+        "index":   index,
+        "data":    base64.b64encode(chunk).decode(),
+    })
+
+
+# ── v2 binary chunks ──────────────────────────────────────────────────
+def encode_v2(sess: AEADSession, file_id: str, index: int, chunk: bytes) -> bytes:
+    header = V2_HEADER.pack(WIRE_V2, uuid.UUID(file_id).bytes, index, len(chunk))
+    return header + sess.encrypt(chunk, header)
+
+
+def decode_v2(sess: AEADSession, payload: bytes) -> Optional[Tuple[str, int, bytes]]:
+    """(file_id, index, chunk) from a FILE_DATA payload; None if it is malformed or forged."""
+    if len(payload) < V2_HEADER.size:
+        return None
+    header = payload[:V2_HEADER.size]
+    version, fid, index, length = V2_HEADER.unpack(header)
+    if version != WIRE_V2:
+        logger.warning("FILE_DATA with unknown wire version %s", version)
+        return None
+    chunk = sess.decrypt(payload[V2_HEADER.size:], header)
+    if chunk is None or len(chunk) != length:
+        return None
+    return str(uuid.UUID(bytes=fid)), index, chunk
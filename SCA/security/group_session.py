@@ -0,0 +1,130 @@
+# security/group_session.py
+
+import os
+import logging
+import threading
+from typing import Dict, Iterable, Optional, Tuple
+
+from .encryption import AEADSession
+
+# Configure logger for this module
+logger = logging.getLogger('secure_chat.group_session')
+
+KEY_ID_LEN      = 4
+SENDER_KEY_LEN  = 32
+KEEP_OLD_KEYS   = 2               # per sender - covers BCASTs in flight across a rotation
+SKEY_AAD        = b"SecureChat SKEY"
+
+
+class GroupSession:
+    """
+    Sender-key state for "Everyone" messages.
+
+    Each client owns one random AES-256 sender key.  It is handed to every
+    peer once, wrapped in that peer's pairwise ECDH session (an SKEY frame),
+    after which a broadcast is encrypted a single time and sent as one
+    BCAST frame the server fans out.
+
+    Wire layouts:
+    - SKEY plaintext : key_id (4) | sender key (32)   (pairwise AEAD, SKEY_AAD)
+    - BCAST payload  : key_id (4) | iv | tag | ciphertext   (AAD = key_id | aad)
+
+    The own key rotates whenever room membership changes, so a departed user
+    cannot read later broadcasts and a newcomer cannot read earlier ones.
+    Note every holder of a sender key could forge messages under it; sender
+    keys provide confidentiality towards the server, not per-sender signing.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._members: frozenset[str] = frozenset()
+        self._peer_keys: Dict[str, Dict[bytes, AEADSession]] = {}
+        self._delivered: set[str] = set()
+        self._key_id = b""
+        self._own: Optional[AEADSession] = None
+        self.rotate()
+
+    # ── own sender key ────────────────────────────────────────────────
+    def rotate(self) -> bytes:
+        """Start a fresh sender key; every peer needs it re-sent.  Returns the key_id."""
+        with self._lock:
+            self._key_id = os.urandom(KEY_ID_LEN)
+            self._own = AEADSession(os.urandom(SENDER_KEY_LEN))
+            self._delivered.clear()
+            logger.debug("Sender key rotated (id %s)", self._key_id.hex())
+            return self._key_id
+
+    def update_members(self, users: Iterable[str]) -> bool:
+        """
+        Record the latest USERS list.  Rotates the own key (and forgets the
+        keys of users who left) when membership changed; returns True then.
+        """
+        users = frozenset(u for u in users if u)
+        with self._lock:
+            if users == self._members:
+                return False
+            first = not self._members
+            for gone in self._members - users:
+                self._peer_keys.pop(gone, None)
+            self._members = users
+        if first:                      # room was empty - nobody holds the current key
+            return False
+        self.rotate()
+        return True
+
+    def undelivered(self, peers: Iterable[str]) -> list[str]:
+        """Peers from *peers* that do not yet hold the current sender key."""
+        with self._lock:
+            return [p for p in peers if p not in self._delivered]
+
+    def wrap_for(self, peer: str, pairwise: AEADSession) -> bytes:
+        """SKEY blob carrying the current sender key to *peer*; marks it delivered."""
+        with self._lock:
+            blob = pairwise.encrypt(self._key_id + self._own.key, SKEY_AAD)
+            self._delivered.add(peer)
+        return blob
+
+    def forget_delivery(self, peer: str) -> None:
+        """Peer re-keyed (new KEYPUB) - it must be sent the sender key again."""
+        with self._lock:
+            self._delivered.discard(peer)
+            self._peer_keys.pop(peer, None)
+
+    def seal(self, plaintext: str | bytes, aad: bytes = b"") -> bytes:
+        """Encrypt once for the whole room: key_id | iv | tag | ciphertext.
+           *aad* (e.g. the message ID) is authenticated along with the key_id."""
+        with self._lock:
+            key_id, own = self._key_id, self._own
+        return key_id + own.encrypt(plaintext, key_id + aad)
+
+    # ── peers' sender keys ────────────────────────────────────────────
+    def install(self, sender: str, blob: bytes, pairwise: AEADSession) -> bool:
+        """Unwrap an SKEY blob from *sender*; returns False if it does not verify."""
+        raw = pairwise.decrypt(blob, SKEY_AAD)
+        if raw is None or len(raw) != KEY_ID_LEN + SENDER_KEY_LEN:
+            logger.warning("Rejected sender key from %s", sender)
+            return False
+        key_id, key = raw[:KEY_ID_LEN], raw[KEY_ID_LEN:]
+        with self._lock:
+            keys = self._peer_keys.setdefault(sender, {})
+            keys[key_id] = AEADSession(key)
+            while len(keys) > KEEP_OLD_KEYS:            # dicts keep insertion order
+                keys.pop(next(iter(keys)))
+        logger.debug("Installed sender key %s from %s", key_id.hex(), sender)
+        return True
+
+    def open(self, sender: str, payload: bytes, aad: bytes = b"") -> Optional[str]:
+        """Decrypt a BCAST payload from *sender*; None if its key is unknown or it fails."""
+        key_id = payload[:KEY_ID_LEN]
+        with self._lock:
+            sess = self._peer_keys.get(sender, {}).get(key_id)
+        if sess is None:
+            logger.debug("No sender key %s from %s - broadcast dropped",
+                         key_id.hex(), sender)
+            return None
+        return sess.decrypt_text(payload[KEY_ID_LEN:], key_id + aad)
+
+    def current(self) -> Tuple[bytes, bytes]:
+        """(key_id, key) of the own sender key - for wiping on exit."""
+        with self._lock:
+            return self._key_id, self._own.key
@@ -0,0 +1,46 @@
+# security/test_delivery.py
+import pytest
+
+from security.delivery import (DEDUP_EPOCHS, DEDUP_WINDOW, DedupWindow, MessageIds,
+                               parse_msg_id)
+
+
+def test_message_ids_count_per_conversation():
+    ids = MessageIds()
+    assert [ids.next("bob"), ids.next("bob"), ids.next("carol")] == \
+        [f"{ids.epoch}.1", f"{ids.epoch}.2", f"{ids.epoch}.1"]
+    assert parse_msg_id(ids.next("bob").encode()) == (int(ids.epoch, 16), 3)
+
+
+@pytest.mark.parametrize("msg_id", ["zz", "0a", "0a.", "0a.x", "0a.-1", "-1.5", b"\xff.1"])
+def test_malformed_ids(msg_id):
+    assert parse_msg_id(msg_id) is None
+    assert not DedupWindow().accept(msg_id)
+
+
+def test_repeats_are_dropped_in_any_order():
+    w = DedupWindow()
+    assert [w.accept(m) for m in ("0a.1", "0a.2", "0a.2", "0a.5", "0a.3", "0a.1")] == \
+        [True, True, False, True, True, False]
+
+
+def test_negative_seq_never_accepted():
+    w = DedupWindow()
+    w.accept("0a.1")
+    assert not w.accept("0a.-1")
+    assert not w.accept(b"0a.-300")
+
+
+def test_older_than_window_counts_as_seen():
+    w = DedupWindow()
+    assert w.accept(f"0a.{DEDUP_WINDOW + 10}")
+    assert not w.accept("0a.10")
+    assert w.accept("0a.11")
+
+
+def test_epochs_are_separate_and_bounded():
+    w = DedupWindow()
+    assert w.accept("0a.1") and w.accept("0b.1")
+    for epoch in range(0x10, 0x10 + DEDUP_EPOCHS):      # push 0a and 0b out
+        w.accept(f"{epoch:x}.1")
+    assert w.accept("0a.1")                             # forgotten restart, seen as new
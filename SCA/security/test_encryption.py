@@ -0,0 +1,89 @@
+# security/test_encryption.py
+import os
+
+import pytest
+
+from security.encryption import (AEADSession, NonceExhausted, NonceSequence,
+                                 decrypt_message, encrypt_message, nonce_sequence_for,
+                                 _session_for, _sessions)
+
+
+def test_round_trip_text_and_bytes():
+    sess = AEADSession(os.urandom(32))
+    assert sess.decrypt_text(sess.encrypt("héllo")) == "héllo"
+    assert sess.decrypt(sess.encrypt(b"\x00\xff")) == b"\x00\xff"
+
+
+def test_wire_layout_is_iv_tag_ciphertext():
+    blob = AEADSession(os.urandom(32)).encrypt(b"abc")
+    assert len(blob) == 12 + 16 + 3
+
+
+def test_aad_must_match():
+    sess = AEADSession(os.urandom(32))
+    blob = sess.encrypt("hi", b"id-1")
+    assert sess.decrypt_text(blob, b"id-1") == "hi"
+    assert sess.decrypt_text(blob, b"id-2") is None
+
+
+def test_tampered_or_short_blob_rejected():
+    sess = AEADSession(os.urandom(32))
+    blob = bytearray(sess.encrypt("hi"))
+    blob[-1] ^= 1
+    assert sess.decrypt(bytes(blob)) is None
+    assert sess.decrypt(b"short") is None
+
+
+def test_other_key_cannot_decrypt():
+    blob = AEADSession(os.urandom(32)).encrypt("hi")
+    assert AEADSession(os.urandom(32)).decrypt(blob) is None
+
+
+def test_one_shot_api_interoperates_with_sessions():
+    key = os.urandom(32)
+    assert decrypt_message(key, AEADSession(key).encrypt("x")) == "x"
+    assert AEADSession(key).decrypt_text(encrypt_message(key, "y")) == "y"
+
+
+def test_key_length_checked():
+    with pytest.raises(ValueError):
+        AEADSession(b"short")
+
+
+# ── nonce budget (one sequence per key) ─────────────────────────────
+
+def test_nonce_sequence_counts_under_one_prefix():
+    seq = NonceSequence()
+    a, b = seq.next(), seq.next()
+    assert len(a) == 12 and a[:6] == b[:6]
+    assert int.from_bytes(b[6:], "big") == int.from_bytes(a[6:], "big") + 1
+
+
+def test_nonce_sequence_refuses_past_limit():
+    seq = NonceSequence(limit=2)
+    seq.next(); seq.next()
+    with pytest.raises(NonceExhausted):
+        seq.next()
+
+
+def test_sessions_on_one_key_share_the_budget():
+    key = os.urandom(32)
+    first = AEADSession(key, nonce_limit=3)
+    second = AEADSession(key)                    # same key: same sequence, same limit
+    ivs = {first.encrypt("a")[:12], second.encrypt("b")[:12], first.encrypt("c")[:12]}
+    assert len(ivs) == 3
+    with pytest.raises(NonceExhausted):
+        second.encrypt("d")
+
+
+def test_dropping_the_session_cache_does_not_reset_the_budget():
+    key = os.urandom(32)
+    nonce_sequence_for(key, limit=1)
+    _session_for(key).encrypt("a")
+    _sessions.clear()
+    with pytest.raises(NonceExhausted):
+        _session_for(key).encrypt("b")
+
+
+def test_distinct_keys_have_distinct_sequences():
+    assert nonce_sequence_for(os.urandom(32)) is not nonce_sequence_for(os.urandom(32))
@@ -0,0 +1,101 @@
+# security/test_file_spool.py
+import hashlib
+import json
+import os
+import time
+
+import pytest
+
+from security import file_spool
+from security.file_spool import IncomingSpool, read_journals, write_journal
+
+
+@pytest.fixture
+def spool(tmp_path):
+    s = IncomingSpool("f", 10, 4, spool_dir=str(tmp_path))    # chunks of 4, 4, 2
+    yield s
+    s.close()
+
+
+def test_bitmap_tracks_chunks(spool):
+    assert (spool.total, spool.have, spool.missing()) == (3, 0, [0, 1, 2])
+    assert spool.write(1, b"efgh")
+    assert spool.has(1) and not spool.has(0)
+    assert spool.missing() == [0, 2] and not spool.complete
+
+
+def test_chunks_land_at_their_offset(spool, tmp_path):
+    for idx, data in ((2, b"ij"), (0, b"abcd"), (1, b"efgh")):
+        assert spool.write(idx, data)
+    assert spool.complete
+    assert spool.sha256() == hashlib.sha256(b"abcdefghij").hexdigest()
+    target = tmp_path / "out.bin"
+    spool.save_as(str(target))
+    assert target.read_bytes() == b"abcdefghij"
+
+
+@pytest.mark.parametrize("idx, data", [
+    (-1, b"abcd"), (3, b"ab"),               # out of range
+    (0, b"abc"), (2, b"ijk"),                # wrong size (last chunk is short)
+])
+def test_bad_chunks_are_dropped(spool, idx, data):
+    assert not spool.write(idx, data)
+    assert spool.have == 0
+
+
+def test_duplicates_are_not_counted(spool):
+    assert spool.write(0, b"abcd")
+    assert not spool.write(0, b"abcd")
+    assert spool.have == 1
+
+
+def test_bitmap_beyond_eight_chunks(tmp_path):
+    s = IncomingSpool("g", 20, 1, spool_dir=str(tmp_path))
+    for idx in (0, 7, 8, 19):
+        s.write(idx, b"x")
+    assert len(s.bitmap) == 3
+    assert [i for i in range(20) if s.has(i)] == [0, 7, 8, 19]
+    s.discard()
+
+
+def test_discard_removes_part_and_journal(spool, tmp_path):
+    spool.checkpoint({})
+    spool.discard()
+    assert list(tmp_path.iterdir()) == []
+
+
+# ── resume ──────────────────────────────────────────────────────────
+def test_restore_keeps_chunks_already_on_disk(spool, tmp_path):
+    spool.write(0, b"abcd")
+    spool.write(2, b"ij")
+    spool.checkpoint({"sender": "alice"})
+    spool.close()
+    state = json.loads((tmp_path / "f.json").read_text())
+    assert state["sender"] == "alice" and state["bitmap"] == spool.bitmap_b64()
+
+    resumed = IncomingSpool.restore(state, spool_dir=str(tmp_path))
+    assert resumed.missing() == [1] and resumed.have == 2
+    assert not resumed.write(0, b"abcd")
+    assert resumed.write(1, b"efgh") and resumed.complete
+    assert resumed.sha256() == hashlib.sha256(b"abcdefghij").hexdigest()
+    resumed.finish()
+    assert not (tmp_path / "f.json").exists()
+
+
+def test_restore_without_part_file(spool, tmp_path):
+    spool.checkpoint({})
+    state = json.loads((tmp_path / "f.json").read_text())
+    spool.discard()
+    with pytest.raises(FileNotFoundError):
+        IncomingSpool.restore(state, spool_dir=str(tmp_path))
+
+
+def test_journals_expire(tmp_path):
+    write_journal(str(tmp_path / "new.json"), {"file_id": "new"})
+    write_journal(str(tmp_path / "old.json"), {"file_id": "old"})
+    (tmp_path / "old.part").write_bytes(b"")
+    (tmp_path / "junk.json").write_text("{")
+    stale = time.time() - file_spool.JOURNAL_TTL - 60
+    os.utime(tmp_path / "old.json", (stale, stale))
+    assert [s["file_id"] for s in read_journals(str(tmp_path))] == ["new"]
+    assert not (tmp_path / "old.json").exists() and not (tmp_path / "old.part").exists()
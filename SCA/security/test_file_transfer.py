@@ -0,0 +1,255 @@
+# security/test_file_transfer.py
+import hashlib
+import threading
+import time
+import uuid
+
+import pytest
+
+from security import file_transfer
+from security.encryption import AEADSession
+from security.file_transfer import (FileTransferManager, FlowWindow, TransferPaused,
+                                    TransferRefused, MIN_WINDOW, RELAY_QUEUE, window_for)
+from security.file_wire import (WIRE_V1, WIRE_V2, V2_CHUNK_SIZE, open_json,
+                                decode_v2, encode_v1, encode_v2)
+
+
+class _Client:
+    """The slice of ChatClient a FileTransferManager talks to."""
+    def __init__(self, username, key):
+        self.username, self.sess, self.frames = username, AEADSession(key), []
+
+    def get_session(self, peer):
+        return self.sess
+
+    def _send_prefixed(self, frame):
+        self.frames.append(frame)
+
+    def sent(self, frame_type):
+        out = []
+        for f in self.frames:
+            kind, _, _, blob = f.split(b" ", 3)
+            if kind.decode() == frame_type:
+                out.append(open_json(self.sess, blob))
+        return out
+
+
+class _Gui:
+    def __init__(self):
+        self.removed = []
+
+    def add_incoming_file_message(self, *a): pass
+    def add_sent_file_message(self, *a): pass
+    def enable_download(self, fid): pass
+    def remove_file_message(self, fid): self.removed.append(fid)
+
+
+@pytest.fixture
+def receiver():
+    gui = _Gui()
+    client = _Client("bob", b"k" * 32)
+    return FileTransferManager(client, gui), client, gui
+
+
+def _offer(fid, size, versions=(WIRE_V1, WIRE_V2)):
+    return {"type": "FILE_OFFER", "file_id": fid, "file_name": "f.bin", "file_size": size,
+            "versions": list(versions), "chunk_size": V2_CHUNK_SIZE}
+
+
+# ── negotiation ─────────────────────────────────────────────────────
+def _negotiate(reply, timeout=1.0):
+    ftm = FileTransferManager(_Client("alice", b"k" * 32), _Gui())
+    event = threading.Event()
+    ftm.accepts["f"] = (event, dict(reply or {}))
+    if reply is not None:
+        event.set()
+    file_transfer.ACCEPT_TIMEOUT, saved = timeout, file_transfer.ACCEPT_TIMEOUT
+    try:
+        return ftm._negotiate("f")
+    finally:
+        file_transfer.ACCEPT_TIMEOUT = saved
+
+
+def test_negotiate_v2_with_window():
+    assert _negotiate({"version": WIRE_V2, "chunk_size": 1000, "window": 64}) == (WIRE_V2, 1000, 64)
+
+
+def test_negotiate_never_falls_back_silently():
+    with pytest.raises(TransferRefused):
+        _negotiate(None, timeout=0.01)
+
+
+@pytest.mark.parametrize("reply", [
+    {"version": 3, "window": 64},
+    {"version": WIRE_V2},                    # no flow-control agreement
+    {"version": WIRE_V2, "window": 0},
+])
+def test_negotiate_refuses_a_mismatch(reply):
+    with pytest.raises(TransferRefused):
+        _negotiate(reply)
+
+
+def test_unanswered_offer_is_cancelled(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_transfer, "ACCEPT_TIMEOUT", 0.01)
+    monkeypatch.setattr(file_transfer.mb, "showerror", lambda *a: None)
+    client, gui = _Client("alice", b"k" * 32), _Gui()
+    ftm = FileTransferManager(client, gui)
+    src = tmp_path / "f.bin"
+    src.write_bytes(b"x" * 10)
+    ftm.accepts["f"] = (threading.Event(), {})
+    ftm._send_chunks(str(src), "f", "bob")
+    assert client.sent("FILE_CANCEL")[0]["file_id"] == "f"
+    assert gui.removed == ["f"]
+    assert not any(f.startswith((b"FILE_DATA", b"FILE_CHUNK")) for f in client.frames)
+
+
+# ── receiver holds the sender to the agreement ──────────────────────
+def test_receiver_accepts_agreed_chunks(receiver):
+    ftm, client, gui = receiver
+    fid = str(uuid.uuid4())
+    ftm._on_offer("alice", _offer(fid, 5))
+    accept = client.sent("FILE_ACCEPT")[0]
+    assert (accept["version"], accept["window"]) == (WIRE_V2, window_for(WIRE_V2, V2_CHUNK_SIZE))
+    ftm.handle_frame("FILE_DATA", "alice", encode_v2(client.sess, fid, 0, b"hello"))
+    assert ftm.incoming[fid]["spool"].complete
+    assert client.sent("FILE_ACK")[0]["index"] == 0
+    ftm.incoming.pop(fid)["spool"].discard()
+
+
+def test_receiver_rejects_v1_chunks_after_agreeing_v2(receiver):
+    ftm, client, gui = receiver
+    fid = str(uuid.uuid4())
+    ftm._on_offer("alice", _offer(fid, 5))
+    ftm.handle_frame("FILE_CHUNK", "alice", encode_v1(client.sess, fid, 0, b"hello"))
+    assert fid not in ftm.incoming and gui.removed == [fid]
+    assert "wire" in client.sent("FILE_CANCEL")[0]["reason"]
+
+
+def test_receiver_rejects_wrong_sized_chunks(receiver):
+    ftm, client, gui = receiver
+    fid = str(uuid.uuid4())
+    ftm._on_offer("alice", _offer(fid, 100_000))
+    ftm.handle_frame("FILE_DATA", "alice", encode_v2(client.sess, fid, 0, b"x" * 16384))
+    assert fid not in ftm.incoming
+    assert client.sent("FILE_CANCEL")
+
+
+def test_receiver_rejects_mismatched_complete(receiver):
+    ftm, client, gui = receiver
+    fid = str(uuid.uuid4())
+    ftm._on_offer("alice", _offer(fid, 5))
+    ftm._on_complete("alice", {"type": "FILE_COMPLETE", "file_id": fid, "sha256": "0",
+                               "version": WIRE_V1, "chunk_size": 16384})
+    assert fid not in ftm.incoming
+
+
+# ── flow window ─────────────────────────────────────────────────────
+def test_flow_window_bounds_chunks_in_flight():
+    flow = FlowWindow(2)
+    flow.acquire(0); flow.acquire(1)
+    with pytest.raises(TransferPaused):
+        flow.acquire(2, timeout=0.05)
+    flow.ack(0)
+    flow.acquire(2, timeout=0.05)
+    assert set(flow.sent) == {1, 2}
+
+
+def test_flow_window_limits():
+    assert FlowWindow(0).cwnd == MIN_WINDOW
+    assert FlowWindow(1000, max_window=16).cwnd == 16
+
+
+def test_flow_window_grows_on_steady_rtt():
+    flow = FlowWindow(4)
+    for i in range(20):
+        flow.acquire(i)
+        flow.ack(i)
+    assert flow.cwnd > 4 and flow.srtt is not None and not flow.sent
+
+
+def test_flow_window_ignores_unknown_acks():
+    flow = FlowWindow(4)
+    flow.ack(7)
+    assert flow.srtt is None
+
+
+def test_flow_window_abort_wakes_the_sender():
+    flow = FlowWindow(2)
+    flow.acquire(0); flow.acquire(1)
+    threading.Timer(0.02, flow.abort).start()
+    with pytest.raises(TransferPaused):
+        flow.acquire(2, timeout=5)
+
+
+def test_flow_window_drain_waits_for_acks():
+    flow = FlowWindow(4)
+    flow.acquire(0)
+    threading.Timer(0.02, flow.ack, args=(0,)).start()
+    flow.drain(timeout=5)
+    assert not flow.sent
+
+
+def test_advertised_window_fits_the_relay_queue():
+    for version, chunk in ((WIRE_V2, V2_CHUNK_SIZE), (WIRE_V1, 16 * 1024)):
+        assert 3 * window_for(version, chunk) * chunk * (1 if version == WIRE_V2 else 2) \
+            < RELAY_QUEUE
+
+
+def test_flow_window_resends_lost_chunks(monkeypatch):
+    monkeypatch.setattr(file_transfer, "RTO_MIN", 0.05)
+    flow = FlowWindow(2)
+    assert flow.acquire(0) == [] and flow.acquire(1) == []
+    flow.ack(0)
+    assert flow.acquire(2) == []
+    flow.ack(2)
+    time.sleep(0.03)                                  # 3 times out well after 1
+    assert flow.acquire(3) == []
+    assert flow.acquire(4, timeout=5) == [1]          # 1 was never ACKed: resend it
+    assert flow.cwnd == MIN_WINDOW and flow.resent == 1
+    flow.ack(1)
+    assert flow.acquire(4) == [] and set(flow.sent) == {3, 4}
+
+
+def test_flow_window_drain_reports_losses(monkeypatch):
+    monkeypatch.setattr(file_transfer, "RTO_INITIAL", 0.02)
+    flow = FlowWindow(4)
+    flow.acquire(0)
+    assert flow.drain(timeout=5) == [0]
+    flow.ack(0)
+    assert flow.drain(timeout=5) == [] and flow.srtt is None   # resent: no RTT sample
+
+
+def test_flow_window_gives_up_on_a_chunk(monkeypatch):
+    monkeypatch.setattr(file_transfer, "RTO_INITIAL", 0.001)
+    monkeypatch.setattr(file_transfer, "MAX_RESENDS", 2)
+    flow = FlowWindow(4)
+    flow.acquire(0)
+    with pytest.raises(TransferPaused):
+        while True:
+            flow.drain(timeout=5)
+
+
+def test_lost_chunks_are_resent_by_the_sender(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_transfer, "RTO_INITIAL", 0.05)
+    monkeypatch.setattr(file_transfer, "OUTGOING_DIR", str(tmp_path))
+    client = _Client("alice", b"k" * 32)
+    ftm = FileTransferManager(client, _Gui())
+    src = tmp_path / "f.bin"
+    src.write_bytes(bytes(range(256)) * 1000)         # 5 v2 chunks
+    job = {"file_id": str(uuid.uuid4()), "recipient": "bob", "path": str(src),
+           "size": 256000, "version": WIRE_V2, "chunk_size": V2_CHUNK_SIZE,
+           "window": 64, "sha256": None}
+    dropped = set()
+    def relay(frame):                                 # drop each chunk once, ACK the rest
+        client.frames.append(frame)
+        if not frame.startswith(b"FILE_DATA"):
+            return
+        idx = decode_v2(client.sess, frame.split(b" ", 3)[3])[1]
+        if idx not in dropped:
+            dropped.add(idx)
+            return
+        threading.Thread(target=lambda: ftm.flows[job["file_id"]].ack(idx)).start()
+    client._send_prefixed = relay
+    ftm._pump(job, None)
+    assert dropped == set(range(5))
+    assert client.sent("FILE_COMPLETE")[0]["sha256"] == hashlib.sha256(src.read_bytes()).hexdigest()
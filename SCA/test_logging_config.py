@@ -0,0 +1,82 @@
+# test_logging_config.py
+import logging
+
+import pytest
+
+import logging_config
+from logging_config import ROOT_LOGGER, set_levels
+
+
+@pytest.fixture(autouse=True)
+def _restore_levels():
+    names = (ROOT_LOGGER, "secure_chat.auth", "secure_chat.file_wire")
+    saved = {n: logging.getLogger(n).level for n in names}
+    yield
+    for n, level in saved.items():
+        logging.getLogger(n).setLevel(level)
+
+
+def _level(name=ROOT_LOGGER):
+    return logging.getLogger(name).level
+
+
+def test_bare_level_applies_to_the_tree():
+    set_levels("warning")
+    assert _level() == logging.WARNING
+
+
+def test_per_module_levels():
+    set_levels(" DEBUG , secure_chat.auth=ERROR,secure_chat.file_wire = info,")
+    assert (_level(), _level("secure_chat.auth"), _level("secure_chat.file_wire")) == \
+        (logging.DEBUG, logging.ERROR, logging.INFO)
+
+
+def test_empty_spec_changes_nothing():
+    set_levels("CRITICAL")
+    set_levels("")
+    assert _level() == logging.CRITICAL
+
+
+@pytest.mark.parametrize("spec", ["LOUD", "INFO,secure_chat.auth=LOUD", "secure_chat.auth="])
+def test_unknown_level_applies_nothing(spec):
+    set_levels("CRITICAL")
+    with pytest.raises(ValueError):
+        set_levels(spec)
+    assert _level() == logging.CRITICAL and _level("secure_chat.auth") == logging.NOTSET
+
+
+def test_bad_environment_level_falls_back_to_info(monkeypatch):
+    started = []
+    monkeypatch.setattr(logging_config, "_listener", None)
+    monkeypatch.setattr(logging_config, "_start_listener", lambda *a: started.append(a))
+    monkeypatch.setattr(logging_config, "set_format", lambda fmt: None)
+    monkeypatch.setenv(logging_config.LEVEL_ENV, "LOUD")
+    logger = logging.getLogger(ROOT_LOGGER)
+    handlers = list(logger.handlers)
+    try:
+        assert logging_config.setup_logging() is logger
+    finally:
+        for a in started:
+            for h in a[1:]:
+                h.close()
+        logger.handlers = handlers
+    assert started and _level() == logging.INFO
+
+
+def test_bad_environment_format_falls_back_to_text(monkeypatch, caplog):
+    started = []
+    monkeypatch.setattr(logging_config, "_listener", None)
+    monkeypatch.setattr(logging_config, "_start_listener", lambda *a: started.append(a))
+    monkeypatch.setenv(logging_config.FORMAT_ENV, "xml")
+    logger = logging.getLogger(ROOT_LOGGER)
+    handlers = list(logger.handlers)
+    try:
+        with caplog.at_level(logging.INFO, ROOT_LOGGER):
+            assert logging_config.setup_logging() is logger
+    finally:
+        for a in started:
+            for h in a[1:]:
+                h.close()
+        logger.handlers = handlers
+    assert "SECURE_CHAT_LOG_FORMAT='xml'" in caplog.text
+    assert not isinstance(started[0][1].formatter, logging_config.JsonFormatter)
@@ -0,0 +1,128 @@
+# test_secure_chat_server.py
+import queue
+
+import pytest
+
+import secure_chat_server as server
+from logging_config import stop_logging
+from utils.offline_queue import OfflineQueue
+
+
+@pytest.fixture(scope="module", autouse=True)
+def _log_listener():
+    yield
+    stop_logging()                     # before pytest closes the captured stderr
+
+
+class _Conn:
+    """Records what the server queues for one client session."""
+    queued_bytes = 0
+
+    def __init__(self):
+        self.unacked, self.pub_b64, self.frames = {}, None, []
+
+    def send(self, payload):
+        self.frames.append(bytes(payload))
+        return True
+
+    def send_wire(self, frame, trace=None):
+        self.frames.append(bytes(frame[4:]))
+        return True
+
+    def ciph(self):
+        return [f for f in self.frames if f.startswith(b"CIPH ")]
+
+
+def _wire(payload: bytes) -> memoryview:
+    return memoryview(len(payload).to_bytes(4, "big") + payload)
+
+
+@pytest.fixture
+def relay(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "connected_clients", {})
+    monkeypatch.setattr(server, "_last_pub", {})
+    monkeypatch.setattr(server, "_tickets", None)
+    monkeypatch.setattr(server, "_bus", None)
+    monkeypatch.setattr(server, "_offline_jobs", queue.SimpleQueue())
+    monkeypatch.setattr(server, "_draining", {})
+    store = OfflineQueue(tmp_path / "offline.db")
+    monkeypatch.setattr(server, "_offline", store)
+    yield server
+    store.close()
+
+
+def _login(srv, user, pub="PUB"):
+    conn = _Conn()
+    srv._register_client(user, conn, ("127.0.0.1", 0), pub)
+    return conn
+
+
+def _write_pending(srv):
+    """Run the offline-writer jobs queued so far, as its thread would."""
+    while not srv._offline_jobs.empty():
+        srv._write_offline(*srv._offline_jobs.get())
+
+
+def _deliver(srv, old, n=3):
+    for i in range(1, n + 1):
+        srv._route_direct(b"CIPH", b"alice", b"bob",
+                          _wire(b"CIPH alice bob e1.%d blob%d" % (i, i)))
+    old.unacked.pop((b"alice", b"e1.1"))           # bob ACKed the first one only
+
+
+def test_fast_reconnect_hands_unacked_frames_to_new_session(relay):
+    old = _login(relay, "bob")
+    _deliver(relay, old)
+    new = _login(relay, "bob")                      # old socket not closed yet
+    relay._unregister_client("bob", old)
+    assert new.ciph() == [b"CIPH alice bob e1.2 blob2", b"CIPH alice bob e1.3 blob3"]
+    assert set(new.unacked) == {(b"alice", b"e1.2"), (b"alice", b"e1.3")}
+    assert relay._offline.peek("bob") == []
+
+
+def test_slow_reconnect_gets_unacked_frames_from_the_store(relay):
+    old = _login(relay, "bob")
+    _deliver(relay, old)
+    relay._unregister_client("bob", old)
+    _write_pending(relay)
+    new = _login(relay, "bob")
+    relay._deliver_offline("bob", new, "PUB")
+    assert new.ciph() == [b"CIPH alice bob e1.2 blob2", b"CIPH alice bob e1.3 blob3"]
+    assert relay._offline.peek("bob") == []
+
+
+def test_new_key_does_not_inherit_frames(relay):
+    old = _login(relay, "bob", "OLD")
+    _deliver(relay, old)
+    new = _login(relay, "bob", "NEW")
+    relay._unregister_client("bob", old)
+    _write_pending(relay)
+    assert new.ciph() == []
+    relay._deliver_offline("bob", new, "NEW")       # sealed for the old key: dropped
+    assert new.ciph() == []
+
+
+def test_offline_store_is_written_off_the_caller(relay, monkeypatch):
+    monkeypatch.setattr(relay, "_start_delivery",
+                        lambda user, conn, pub: relay._deliver_offline(user, conn, pub))
+    relay._unregister_client("bob", _login(relay, "bob"))
+    relay._route_direct(b"CIPH", b"alice", b"bob", _wire(b"CIPH alice bob e1.1 blob1"))
+    assert relay._offline.peek("bob") == []         # only queued for the writer
+    new = _login(relay, "bob")
+    relay._deliver_offline("bob", new, "PUB")       # login drain ran before the write
+    _write_pending(relay)                           # the writer catches the late frame
+    assert new.ciph() == [b"CIPH alice bob e1.1 blob1"]
+    assert relay._offline.peek("bob") == []
+
+
+def test_requeue_reaches_a_session_that_logged_in_during_the_write(relay, monkeypatch):
+    monkeypatch.setattr(relay, "_start_delivery",
+                        lambda user, conn, pub: relay._deliver_offline(user, conn, pub))
+    old = _login(relay, "bob")
+    _deliver(relay, old)
+    relay._unregister_client("bob", old)            # unacked frames queued for the writer
+    new = _login(relay, "bob")
+    relay._deliver_offline("bob", new, "PUB")       # nothing stored yet
+    assert new.ciph() == []
+    _write_pending(relay)
+    assert new.ciph() == [b"CIPH alice bob e1.2 blob2", b"CIPH alice bob e1.3 blob3"]
@@ -0,0 +1,102 @@
+# utils/auth_pool.py
+"""
+utils/auth_pool.py
+==================
+Dedicated process pool for the PBKDF2 password check.
+
+• `_verify_password` (100 000 rounds) runs in worker processes, so a login
+  storm never holds the server's GIL or delays chat traffic.
+• Queue-depth limit: once `max_pending` checks are in flight, `submit()`
+  raises `AuthOverloaded` at once instead of queueing without bound.
+• Keeps the last N submit→result latencies for p50 / p95 / p99 reporting,
+  and hands each one to `on_latency` (e.g. a metrics histogram).
+"""
+from __future__ import annotations
+import os, signal, threading, time, logging
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable
+
+from utils.db_setup import _verify_password
+
+logger = logging.getLogger("secure_chat.auth")
+
+
+def _worker_init() -> None:
+    """Ctrl-C is the server's to handle; workers just die with the pool."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+class AuthOverloaded(Exception):
+    """Too many password checks already queued - reject the login fast."""
+
+
+class AuthExecutor:
+    def __init__(self, workers: int | None = None, max_pending: int | None = None,
+                 samples: int = 2048, on_latency: Callable[[float], None] | None = None):
+        self.workers     = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * 8
+        self._pool       = ProcessPoolExecutor(max_workers=self.workers,
+                                               initializer=_worker_init)
+        self._lock       = threading.Lock()
+        self._pending    = 0
+        self._latencies: deque[float] = deque(maxlen=samples)   # seconds
+        self.accepted = self.rejected = 0
+        self._on_latency = on_latency
+
+    def warm_up(self) -> None:
+        """Start every worker now - before the server spawns its own threads."""
+        dummy = b"\0" * 16
+        for f in [self._pool.submit(_verify_password, dummy + dummy, "")
+                  for _ in range(self.workers)]:
+            f.result()
+
+    def submit(self, stored: bytes, password: str) -> Future:
+        """Queue one check; the Future resolves to True/False."""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise AuthOverloaded(f"{self._pending} password checks pending")
+            self._pending += 1
+            self.accepted += 1
+        t0 = time.perf_counter()
+        try:
+            fut = self._pool.submit(_verify_password, stored, password)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+        fut.add_done_callback(lambda _f: self._done(t0))
+        return fut
+
+    def verify(self, stored: bytes, password: str) -> bool:
+        """Blocking helper for the thread engine."""
+        return self.submit(stored, password).result()
+
+    def _done(self, t0: float) -> None:
+        secs = time.perf_counter() - t0
+        with self._lock:
+            self._pending -= 1
+            self._latencies.append(secs)
+        if self._on_latency is not None:
+            self._on_latency(secs)
+
+    # ── metrics ────────────────────────────────────────────────────
+    def percentiles(self, qs=(50, 95, 99)) -> dict[int, float]:
+        """Latency percentiles in milliseconds over the recent samples."""
+        with self._lock:
+            data = sorted(self._latencies)
+        if not data:
+            return {q: 0.0 for q in qs}
+        return {q: data[min(len(data) - 1, int(len(data) * q / 100))] * 1000
+                for q in qs}
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = {"pending": self._pending, "accepted": self.accepted,
+                   "rejected": self.rejected}
+        out.update({f"p{q}_ms": round(v, 1) for q, v in self.percentiles().items()})
+        return out
+
+    def shutdown(self, wait: bool = False) -> None:
+        self._pool.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,158 @@
+# utils/db_access.py
+"""
+utils/db_access.py
+==================
+Shared data-access layer for users.db (server, admin GUI, manage_users).
+
+• A small thread-safe pool of long-lived connections - no connect() per query.
+• WAL journaling + busy_timeout: readers never wait for writers, and
+  concurrent USB-fail updates queue up instead of failing with
+  "database is locked".
+• Every statement is a module constant, so each pooled connection's
+  statement cache keeps them prepared.
+• Writes use BEGIN IMMEDIATE, so a read-then-update never has to upgrade
+  its lock halfway through (that upgrade is what deadlocks under load).
+"""
+from __future__ import annotations
+import queue, sqlite3, threading
+from contextlib import contextmanager
+from typing import Iterator
+
+from utils.db_setup import DB_PATH
+
+POOL_SIZE       = 8
+BUSY_TIMEOUT_MS = 5000
+
+# ── statements ──────────────────────────────────────────────────────
+SQL_PASSWORD        = "SELECT password FROM users WHERE username=?"
+SQL_PASSWORD_ROLE   = "SELECT password, role FROM users WHERE username=?"
+SQL_USB_STATE       = ("SELECT usb_serial, usb_hash, usb_fail_count, usb_locked_until "
+                       "FROM users WHERE username=?")
+SQL_USB_SERIAL      = "SELECT usb_serial FROM users WHERE username=?"
+SQL_USB_SET_FAILS   = "UPDATE users SET usb_fail_count=?, usb_locked_until=? WHERE username=?"
+SQL_SERIAL_OWNER    = "SELECT username FROM users WHERE usb_serial=?"
+SQL_USERNAMES       = "SELECT username FROM users ORDER BY username"
+SQL_LOCKED          = "SELECT username, usb_locked_until FROM users WHERE usb_locked_until > ?"
+SQL_INSERT_USER     = "INSERT INTO users (username,password) VALUES (?,?)"
+SQL_SET_PASSWORD    = "UPDATE users SET password=? WHERE username=?"
+SQL_SET_USB         = "UPDATE users SET usb_serial=?, usb_hash=? WHERE username=?"
+SQL_DELETE_USER     = "DELETE FROM users WHERE username=?"
+
+
+class ConnectionPool:
+    """Fixed-size pool; connections are created lazily and reused forever."""
+
+    def __init__(self, path=DB_PATH, size: int = POOL_SIZE):
+        self.path = str(path)
+        self._idle: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000,
+                               isolation_level=None,          # we issue BEGIN ourselves
+                               check_same_thread=False,
+                               cached_statements=64)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        return conn
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a connection (autocommit mode) for one or more reads."""
+        self._slots.acquire()
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+            try:
+                yield conn
+            finally:
+                if conn.in_transaction:              # block raised mid-transaction
+                    conn.rollback()
+                self._idle.put(conn)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """BEGIN IMMEDIATE … COMMIT, rolled back if the block raises."""
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            yield conn
+            conn.execute("COMMIT")
+
+    def close_all(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+_pool: ConnectionPool | None = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
+
+def connection():
+    return get_pool().connection()
+
+def transaction():
+    return get_pool().transaction()
+
+
+# ── queries ─────────────────────────────────────────────────────────
+def password_hash(username: str) -> bytes | None:
+    with connection() as conn:
+        row = conn.execute(SQL_PASSWORD, (username,)).fetchone()
+    return row[0] if row else None
+
+def password_and_role(username: str) -> tuple[bytes, str] | None:
+    with connection() as conn:
+        return conn.execute(SQL_PASSWORD_ROLE, (username,)).fetchone()
+
+def usb_serial(username: str) -> tuple[str | None] | None:
+    """(usb_serial,) for an existing user, None if the user is unknown."""
+    with connection() as conn:
+        return conn.execute(SQL_USB_SERIAL, (username,)).fetchone()
+
+def serial_owner(serial: str) -> str | None:
+    with connection() as conn:
+        row = conn.execute(SQL_SERIAL_OWNER, (serial,)).fetchone()
+    return row[0] if row else None
+
+def usernames() -> list[str]:
+    with connection() as conn:
+        return [u for (u,) in conn.execute(SQL_USERNAMES)]
+
+def locked_users(now: int) -> list[tuple[str, int]]:
+    with connection() as conn:
+        return conn.execute(SQL_LOCKED, (now,)).fetchall()
+
+def unlock_user(username: str) -> int:
+    with transaction() as conn:
+        return conn.execute(SQL_USB_SET_FAILS, (0, 0, username)).rowcount
+
+def insert_user(username: str, pw_blob: bytes) -> None:
+    with transaction() as conn:
+        conn.execute(SQL_INSERT_USER, (username, pw_blob))
+
+def set_password(username: str, pw_blob: bytes) -> int:
+    with transaction() as conn:
+        return conn.execute(SQL_SET_PASSWORD, (pw_blob, username)).rowcount
+
+def set_usb(username: str, serial: str, digest: str) -> int:
+    with transaction() as conn:
+        return conn.execute(SQL_SET_USB, (serial, digest, username)).rowcount
+
+def delete_user(username: str) -> int:
+    with transaction() as conn:
+        return conn.execute(SQL_DELETE_USER, (username,)).rowcount
@@ -46,6 +46,9 @@ def ensure_db_ready():
         print("users.db missing or corrupted.")
         bk = _latest_backup()
         if bk:
+            for side in ("-wal", "-shm"):          # stale WAL pages would corrupt the restore
+                try: os.remove(f"{DB_PATH}{side}")
+                except FileNotFoundError: pass
             shutil.copy2(bk, DB_PATH)
             print(f" Restored latest backup → {bk}")
         else:
@@ -76,11 +79,17 @@ def backup_db() -> None:
     """
     Copy users.db into utils/backup/ with a timestamped filename.
     Afterward, prune old backups so only the newest MAX_BACKUPS remain.
+    Uses SQLite's online-backup API: in WAL mode recent commits may still
+    live in users.db-wal, so a plain file copy could miss them.
     """
     # ── 1. create fresh backup 
     ts  = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
     dst = os.path.join(BACKUP_DIR, f"users_{ts}.sqlite")
-    shutil.copy2(DB_PATH, dst)
+    src = sqlite3.connect(DB_PATH); out = sqlite3.connect(dst)
+    try:
+        src.backup(out)
+    finally:
+        out.close(); src.close()
     print(f"Database backed up → {dst}")
 
     # ── 2. prune anything beyond MAX_BACKUPS 
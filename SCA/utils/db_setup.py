@@ -7,6 +7,7 @@ SQLite-based user store for the Secure Chat App.
 • Automatically creates users.db on first run.
 • Stores salted / PBKDF2-HMAC-SHA-256 password hashes.
 • Provides `verify_credentials()` for the server.
+• Runtime lookups go through the pooled WAL layer in utils/db_access.py.
 """
 import sqlite3
 import os
@@ -80,11 +81,14 @@ def init_user_db() -> None:
     conn.close()
 
 
+def get_password_hash(username: str) -> bytes | None:
+    """Return the stored salt+hash blob for *username* (None if unknown).
+       Lets the server run the expensive `_verify_password` elsewhere."""
+    from utils import db_access          # late import: db_access needs DB_PATH from here
+    return db_access.password_hash(username)
+
+
 def verify_credentials(username: str, password: str) -> bool:
     """Return True if username/password are correct."""
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("SELECT password FROM users WHERE username=?", (username,))
-    row = cur.fetchone()
-    conn.close()
-    return bool(row) and _verify_password(row[0], password) #_verify_password(row[0], password)  //  user exists and the password hash matches → returns True
+    stored = get_password_hash(username)
+    return stored is not None and _verify_password(stored, password) #  user exists and the password hash matches → returns True
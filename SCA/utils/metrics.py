@@ -0,0 +1,242 @@
+# utils/metrics.py
+"""
+utils/metrics.py
+================
+In-process metrics registry with a Prometheus text-format endpoint.
+
+• Counter, Gauge and Histogram, optionally with labels:
+      FRAMES = REGISTRY.counter("x_frames_total", "Frames seen", ("type",))
+      FRAMES.labels("CIPH").inc()
+• A metric built with `fn=` is read at scrape time instead of being
+  updated on the hot path - e.g. connected clients, bytes already counted
+  elsewhere.
+• `serve(port)` answers GET /metrics on 127.0.0.1 only, from a daemon
+  thread (exposition format 0.0.4).  Extra paths can be routed to a
+  handler with `route()`.
+• Updates take one small lock per metric; label children are cached, so
+  `labels()` on a known value is a dict lookup.
+"""
+from __future__ import annotations
+import bisect, logging, math, threading, time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, Optional, Sequence, Tuple
+
+logger = logging.getLogger("secure_chat.metrics")
+
+CONTENT_TYPE    = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _fmt(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+def _label_str(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value) -> str:
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r'\"')
+
+
+# ── metric types ────────────────────────────────────────────────────
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 fn: Optional[Callable[[], float]] = None):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._fn = fn
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], "_Metric"] = {}
+
+    def labels(self, *values) -> "_Metric":
+        """The child for these label values (created on first use)."""
+        key = tuple(_escape(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._child())
+        return child
+
+    def _child(self) -> "_Metric":
+        return type(self)(self.name, self.help)
+
+    def _samples(self) -> Iterator[Tuple[str, str, float]]:
+        """(suffix, label string, value) for every series."""
+        if self._fn is not None:
+            yield "", "", self._fn()
+        elif self.labelnames:
+            for values, child in list(self._children.items()):
+                for suffix, extra, v in child._own(values, self.labelnames):
+                    yield suffix, extra, v
+        else:
+            yield from self._own((), ())
+
+    def _own(self, values, names) -> Iterator[Tuple[str, str, float]]:
+        yield "", _label_str(names, values), self._value
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines += [f"{self.name}{suffix}{labels} {_fmt(v)}"
+                  for suffix, labels, v in self._samples()]
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *a, **kw):
+        super().__init__(*a, **kw)
+        self._value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self._value += amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, *a, **kw):
+        super().__init__(*a, **kw)
+        self._value = 0.0
+
+    def set(self, value: float) -> None:
+        self._value = value
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.inc(-amount)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)   # last slot: above every bound
+        self._sum = 0.0
+
+    def _child(self) -> "Histogram":
+        return Histogram(self.name, self.help, buckets=self.buckets)
+
+    def observe(self, value: float) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+
+    @contextmanager
+    def time(self):
+        """Observe the duration of a `with` block, in seconds."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0)
+
+    def _own(self, values, names):
+        with self._lock:
+            counts, total = list(self._counts), self._sum
+        cum = 0
+        for bound, n in zip((*self.buckets, math.inf), counts):
+            cum += n
+            yield "_bucket", _label_str(names, values, f'le="{_fmt(bound)}"'), cum
+        yield "_sum", _label_str(names, values), total
+        yield "_count", _label_str(names, values), cum
+
+
+# ── registry ────────────────────────────────────────────────────────
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"metric {metric.name} already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labelnames=(), fn=None) -> Counter:
+        return self.register(Counter(name, help, labelnames, fn))
+
+    def gauge(self, name, help, labelnames=(), fn=None) -> Gauge:
+        return self.register(Gauge(name, help, labelnames, fn))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        out = []
+        for m in metrics:
+            try:
+                out.append(m.render())
+            except Exception as e:               # one broken callback must not hide the rest
+                logger.warning("metric %s failed: %s", m.name, e)
+        return "\n".join(out) + "\n"
+
+REGISTRY = Registry()
+
+
+# ── HTTP endpoint ───────────────────────────────────────────────────
+_routes: Dict[str, Callable[[str, dict], Tuple[int, str]]] = {}
+
+def route(path: str, handler: Callable[[str, dict], Tuple[int, str]]) -> None:
+    """Serve *path* with handler(method, query) → (status, text body)."""
+    _routes[path] = handler
+
+
+class _Handler(BaseHTTPRequestHandler):
+    registry: Registry = REGISTRY
+
+    def _reply(self, status: int, body: str, ctype: str = "text/plain; charset=utf-8"):
+        data = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _dispatch(self, method: str) -> None:
+        path, _, query = self.path.partition("?")
+        params = dict(p.partition("=")[::2] for p in query.split("&") if p)
+        if path == "/metrics" and method == "GET":
+            self._reply(200, self.registry.render(), CONTENT_TYPE)
+        elif path in _routes:
+            self._reply(*_routes[path](method, params))
+        else:
+            self._reply(404, "not found\n")
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def log_message(self, fmt, *args):              # scrapes are not worth a log line
+        logger.debug("metrics %s - " + fmt, self.address_string(), *args)
+
+
+def serve(port: int, host: str = "127.0.0.1", registry: Registry = REGISTRY) -> ThreadingHTTPServer:
+    """Start the endpoint on a daemon thread; local-only unless *host* says otherwise."""
+    handler = type("MetricsHandler", (_Handler,), {"registry": registry})
+    httpd = ThreadingHTTPServer((host, port), handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True, name="metrics-http").start()
+    logger.info("Metrics on http://%s:%d/metrics", host, port)
+    return httpd
@@ -0,0 +1,113 @@
+# utils/offline_queue.py
+"""
+utils/offline_queue.py
+======================
+Store-and-forward queue for frames addressed to users who are offline.
+
+• Frames are kept exactly as relayed - still end-to-end encrypted, 4-byte
+  length included - in offline.db next to users.db.  WAL mode, so every
+  `--workers` process can share the file.
+• Each row carries a fingerprint of the recipient's public key at the time.
+  Only a session that logs in with that same key gets the frame back;
+  for any other key it would not decrypt, so it is dropped.
+• Bounded: rows older than OFFLINE_TTL expire, and a recipient over
+  OFFLINE_QUOTA bytes or OFFLINE_MAX_FRAMES frames loses its oldest first.
+• Read back at login in batches of OFFLINE_BATCH (peek → send → delete_upto).
+"""
+from __future__ import annotations
+import hashlib, time
+
+from utils.db_access import ConnectionPool
+from utils.db_setup import DB_PATH
+
+OFFLINE_DB         = DB_PATH.with_name("offline.db")
+OFFLINE_TTL        = 7 * 24 * 3600      # seconds a frame waits before it is dropped
+OFFLINE_QUOTA      = 8 * 1024 * 1024    # bytes kept per recipient
+OFFLINE_MAX_FRAMES = 5000               # frames kept per recipient
+OFFLINE_BATCH      = 256                # frames read per drain step
+
+# ── statements ──────────────────────────────────────────────────────
+SQL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS offline (
+    id        INTEGER PRIMARY KEY AUTOINCREMENT,
+    recipient TEXT    NOT NULL,
+    sender    TEXT    NOT NULL,
+    key_fp    BLOB    NOT NULL,
+    created   INTEGER NOT NULL,
+    size      INTEGER NOT NULL,
+    frame     BLOB    NOT NULL
+);
+CREATE INDEX IF NOT EXISTS offline_by_recipient ON offline (recipient, id);
+CREATE INDEX IF NOT EXISTS offline_by_age       ON offline (created);
+"""
+SQL_INSERT     = ("INSERT INTO offline (recipient, sender, key_fp, created, size, frame) "
+                  "VALUES (?,?,?,?,?,?)")
+SQL_USAGE      = "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM offline WHERE recipient=?"
+SQL_EVICT      = """
+DELETE FROM offline WHERE recipient=? AND id <= (
+    SELECT id FROM (
+        SELECT id,
+               SUM(size)    OVER (ORDER BY id DESC) AS kept_bytes,
+               ROW_NUMBER() OVER (ORDER BY id DESC) AS kept_rows
+        FROM offline WHERE recipient=?)
+    WHERE kept_bytes > ? OR kept_rows > ?
+    ORDER BY id DESC LIMIT 1)
+"""
+SQL_DROP_STALE = "DELETE FROM offline WHERE recipient=? AND key_fp<>?"
+SQL_PEEK       = ("SELECT id, sender, frame FROM offline WHERE recipient=? "
+                  "ORDER BY id LIMIT ?")
+SQL_DELETE_UPTO = "DELETE FROM offline WHERE recipient=? AND id<=?"
+SQL_EXPIRE     = "DELETE FROM offline WHERE created<?"
+
+
+def key_fingerprint(pub_b64: str) -> bytes:
+    """Short, stable tag for a KEYPUB value."""
+    return hashlib.sha256(pub_b64.encode()).digest()[:8]
+
+
+class OfflineQueue:
+    """Per-recipient, size-bounded queue of encrypted frames."""
+
+    def __init__(self, path=OFFLINE_DB, quota: int = OFFLINE_QUOTA,
+                 max_frames: int = OFFLINE_MAX_FRAMES, ttl: int = OFFLINE_TTL):
+        self.quota, self.max_frames, self.ttl = quota, max_frames, ttl
+        self._pool = ConnectionPool(path, size=4)
+        with self._pool.connection() as conn:
+            conn.executescript(SQL_SCHEMA)
+
+    def put(self, recipient: str, sender: str, key_fp: bytes, frame) -> int:
+        """Queue one frame; returns how many older frames were evicted for it."""
+        return self.put_many(recipient, key_fp, [(sender, frame)])
+
+    def put_many(self, recipient: str, key_fp: bytes, frames) -> int:
+        """Queue (sender, frame) pairs in one transaction, oldest first."""
+        now = int(time.time())
+        with self._pool.transaction() as conn:
+            conn.executemany(SQL_INSERT, [(recipient, sender, key_fp, now, len(f), bytes(f))
+                                          for sender, f in frames])
+            rows, size = conn.execute(SQL_USAGE, (recipient,)).fetchone()
+            if rows <= self.max_frames and size <= self.quota:
+                return 0
+            return conn.execute(SQL_EVICT, (recipient, recipient,
+                                            self.quota, self.max_frames)).rowcount
+
+    def drop_stale(self, recipient: str, key_fp: bytes) -> int:
+        """Forget frames sealed for an older key of *recipient*."""
+        with self._pool.transaction() as conn:
+            return conn.execute(SQL_DROP_STALE, (recipient, key_fp)).rowcount
+
+    def peek(self, recipient: str, limit: int = OFFLINE_BATCH) -> list[tuple[int, str, bytes]]:
+        """Oldest (id, sender, frame) rows; they stay queued until delete_upto()."""
+        with self._pool.connection() as conn:
+            return conn.execute(SQL_PEEK, (recipient, limit)).fetchall()
+
+    def delete_upto(self, recipient: str, last_id: int) -> None:
+        with self._pool.transaction() as conn:
+            conn.execute(SQL_DELETE_UPTO, (recipient, last_id))
+
+    def expire(self) -> int:
+        with self._pool.transaction() as conn:
+            return conn.execute(SQL_EXPIRE, (int(time.time()) - self.ttl,)).rowcount
+
+    def close(self) -> None:
+        self._pool.close_all()
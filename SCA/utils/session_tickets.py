@@ -0,0 +1,127 @@
+# utils/session_tickets.py
+"""
+utils/session_tickets.py
+========================
+Short-lived, server-signed session tickets for fast reconnects.
+
+After a full login (password + USB) the server hands the client
+`TICKET <ticket> <lifetime>`.  Within that lifetime a reconnecting client
+sends `RESUME <ticket> <pub_b64>` as its first frame and is back in after
+one round trip: no PBKDF2, no USB scan, no new ECDH key.
+
+• The ticket is HMAC-SHA256 signed with a key kept in utils/cert/, so
+  tickets survive a server restart and every `--workers` process accepts
+  them.
+• It is bound to the session's public key: whoever redeems it must present
+  the same KEYPUB.  A thief cannot read the messages sealed to that key.
+• Single use.  Every resume gets a fresh ticket.  Spent ticket nonces go
+  to tickets.db next to users.db (WAL, shared by every `--workers` process
+  and kept across restarts) until they would have expired anyway.
+"""
+from __future__ import annotations
+import base64, hashlib, hmac, json, logging, os, secrets, sqlite3, threading, time
+
+from utils.db_access import ConnectionPool
+from utils.db_setup import DB_PATH
+from utils.tls_setup import CERT_DIR
+
+logger = logging.getLogger("secure_chat.session_tickets")
+
+TICKET_LIFETIME = 10 * 60                   # seconds a ticket can be redeemed
+TICKET_KEY_PATH = os.path.join(CERT_DIR, "ticket_key.bin")
+SPENT_DB        = DB_PATH.with_name("tickets.db")
+PURGE_SECS      = 60                        # expired nonces are deleted this often
+_MAC_LEN        = 16
+
+# ── statements ──────────────────────────────────────────────────────
+SQL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS spent_tickets (
+    nonce   TEXT    PRIMARY KEY,
+    expires INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS spent_by_expiry ON spent_tickets (expires);
+"""
+SQL_SPEND = "INSERT OR IGNORE INTO spent_tickets (nonce, expires) VALUES (?,?)"
+SQL_PURGE = "DELETE FROM spent_tickets WHERE expires<?"
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+def _unb64(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+class TicketAuthority:
+    """Issues and redeems tickets of the form `<claims>.<mac>` (base64url)."""
+
+    def __init__(self, key: bytes, lifetime: int = TICKET_LIFETIME, spent_db=SPENT_DB):
+        self.lifetime = lifetime
+        self._key = key
+        self._pool = ConnectionPool(spent_db, size=2)
+        with self._pool.connection() as conn:
+            conn.executescript(SQL_SCHEMA)
+        self._next_purge = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path: str = TICKET_KEY_PATH, **kw) -> "TicketAuthority":
+        """Load the signing key, creating it (owner-only) on first use."""
+        try:
+            with open(path, "rb") as f:
+                key = f.read()
+        except FileNotFoundError:
+            key = secrets.token_bytes(32)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            except FileExistsError:            # another worker got there first
+                time.sleep(0.1)
+                return cls.from_file(path, **kw)
+            with os.fdopen(fd, "wb") as f:
+                f.write(key)
+        return cls(key, **kw)
+
+    def _mac(self, claims: bytes) -> bytes:
+        return hmac.new(self._key, claims, hashlib.sha256).digest()[:_MAC_LEN]
+
+    def issue(self, username: str, key_fp: bytes) -> str:
+        claims = json.dumps([username, int(time.time()) + self.lifetime,
+                             key_fp.hex(), secrets.token_hex(8)]).encode()
+        return f"{_b64(claims)}.{_b64(self._mac(claims))}"
+
+    def redeem(self, ticket: str) -> tuple[str, bytes] | None:
+        """(username, key_fp) for a genuine, unexpired, unused ticket - else None."""
+        try:
+            claims_b64, mac_b64 = ticket.split(".")
+            claims = _unb64(claims_b64)
+            if not hmac.compare_digest(self._mac(claims), _unb64(mac_b64)):
+                return None
+            username, expires, key_fp, nonce = json.loads(claims)
+        except (ValueError, TypeError):
+            return None
+        now = int(time.time())
+        if expires < now:
+            return None
+        if not self._spend(str(nonce), int(expires), now):
+            return None
+        return username, bytes.fromhex(key_fp)
+
+    def _spend(self, nonce: str, expires: int, now: int) -> bool:
+        """Record *nonce* as used; False if any process already did (or the
+           store is unreachable - the client then does a full login)."""
+        with self._lock:
+            purge = now >= self._next_purge
+            if purge:
+                self._next_purge = now + PURGE_SECS
+        try:
+            with self._pool.transaction() as conn:
+                if purge:
+                    conn.execute(SQL_PURGE, (now,))
+                return conn.execute(SQL_SPEND, (nonce, expires)).rowcount == 1
+        except sqlite3.Error as e:
+            logger.error("Spent-ticket store unavailable: %s", e)
+            return False
+
+    def close(self) -> None:
+        self._pool.close_all()
@@ -0,0 +1,241 @@
+# utils/shard_bus.py
+"""
+utils/shard_bus.py
+==================
+Local routing bus for `secure_chat_server.py --workers N`.
+
+The server processes share one port (SO_REUSEPORT), so each user lands on
+one of them.  A broker in the supervising process links the workers over a
+Unix domain socket and keeps the global presence map (user → worker,
+public key):
+
+  worker → broker                    broker → worker
+  JOIN  <user> <pub_b64>             JOIN  <user> <pub_b64>   (to the others)
+  LEAVE <user>                       LEAVE <user>             (to the others)
+  ROUTE <recipient> <wire>           ROUTE <recipient> <wire> (owner only;
+                                       back to the sender if no worker
+                                       owns the recipient, which stores it)
+  BCAST <sender> <wire>              BCAST <sender> <wire>    (to the others)
+
+`<wire>` is the client frame exactly as received (its own 4-byte length
+included), so a worker hands it to the recipient's queue unchanged.  Bus
+messages use the same 4-byte big-endian framing as the clients.
+
+POSIX only (AF_UNIX + SO_REUSEPORT).
+"""
+from __future__ import annotations
+import logging, os, socket, tempfile, threading
+from typing import Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger("secure_chat.shard_bus")
+
+MAX_BUS_MSG = 64 * 1024 + 1024          # one client frame + bus header
+
+
+def default_path(port: int) -> str:
+    return os.path.join(tempfile.gettempdir(), f"secure_chat_bus_{port}.sock")
+
+
+def _read_exact(sock: socket.socket, n: int) -> Optional[bytes]:
+    data = b""
+    while len(data) < n:
+        chunk = sock.recv(n - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def _recv_msg(sock: socket.socket) -> Optional[memoryview]:
+    """One bus message (header stripped) read into a single buffer."""
+    hdr = _read_exact(sock, 4)
+    if hdr is None:
+        return None
+    length = int.from_bytes(hdr, "big")
+    if length <= 0 or length > MAX_BUS_MSG:
+        return None
+    buf = bytearray(length)
+    view, got = memoryview(buf), 0
+    while got < length:
+        n = sock.recv_into(view[got:])
+        if not n:
+            return None
+        got += n
+    return view
+
+
+class _Link:
+    """One framed Unix-socket connection; sends are serialised by a lock."""
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self._lock = threading.Lock()
+
+    def send(self, *parts) -> bool:
+        size = sum(len(p) for p in parts)
+        try:
+            with self._lock:
+                self.sock.sendall(size.to_bytes(4, "big"))
+                for p in parts:
+                    self.sock.sendall(p)
+            return True
+        except OSError as e:
+            logger.debug("bus send failed: %s", e)
+            return False
+
+
+# ── broker (supervisor process) ─────────────────────────────────────
+class ShardBroker:
+    """Accepts worker connections and routes between them."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._workers: Dict[int, _Link] = {}
+        self._presence: Dict[str, Tuple[int, bytes]] = {}   # user → (worker, pub)
+        self._lock = threading.Lock()
+        self._next_id = 0
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        self._srv = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._srv.bind(path)
+        self._srv.listen(64)
+
+    def start(self) -> "ShardBroker":
+        threading.Thread(target=self._accept_loop, daemon=True, name="bus-accept").start()
+        return self
+
+    def close(self) -> None:
+        try:
+            self._srv.close()
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    def _accept_loop(self) -> None:
+        while True:
+            try:
+                sock, _ = self._srv.accept()
+            except OSError:
+                return
+            with self._lock:
+                wid = self._next_id = self._next_id + 1
+                link = self._workers[wid] = _Link(sock)
+                roster = [(u, pub) for u, (_, pub) in self._presence.items()]
+            for user, pub in roster:                 # newcomer learns who is online
+                link.send(b"JOIN " + user.encode() + b" " + pub)
+            threading.Thread(target=self._serve, args=(wid, link), daemon=True,
+                             name=f"bus-w{wid}").start()
+
+    def _others(self, wid: int) -> list[_Link]:
+        with self._lock:
+            return [l for w, l in self._workers.items() if w != wid]
+
+    def _serve(self, wid: int, link: _Link) -> None:
+        logger.info("Shard worker %d attached", wid)
+        try:
+            while True:
+                msg = _recv_msg(link.sock)
+                if msg is None:
+                    break
+                self._handle(wid, msg)
+        finally:
+            with self._lock:
+                self._workers.pop(wid, None)
+                gone = [u for u, (w, _) in self._presence.items() if w == wid]
+                for u in gone:
+                    self._presence.pop(u, None)
+            for u in gone:
+                for l in self._others(wid):
+                    l.send(b"LEAVE " + u.encode())
+            logger.info("Shard worker %d detached (%d users dropped)", wid, len(gone))
+
+    def _handle(self, wid: int, msg: memoryview) -> None:
+        head = bytes(msg[:256])
+        verb, _, rest = head.partition(b" ")
+        name = rest.split(b" ", 1)[0]
+        if verb == b"ROUTE":
+            with self._lock:
+                owner = self._presence.get(name.decode(errors="replace"))
+                link = self._workers.get(owner[0]) if owner else None
+            if link is None or owner[0] == wid:     # nobody else has them: the
+                link = self._workers.get(wid)        # sender stores it offline
+            if link is not None:
+                link.send(msg)
+        elif verb == b"BCAST":
+            for l in self._others(wid):
+                l.send(msg)
+        elif verb == b"JOIN":
+            pub = bytes(msg[len(verb) + 1 + len(name) + 1:])
+            with self._lock:
+                self._presence[name.decode(errors="replace")] = (wid, pub)
+            for l in self._others(wid):
+                l.send(msg)
+        elif verb == b"LEAVE":
+            user = name.decode(errors="replace")
+            with self._lock:
+                owner = self._presence.get(user)
+                if owner is None or owner[0] != wid:
+                    return                           # user already re-joined elsewhere
+                self._presence.pop(user)
+            for l in self._others(wid):
+                l.send(msg)
+
+
+# ── worker side ─────────────────────────────────────────────────────
+class BusClient:
+    """
+    A worker's connection to the broker.  Incoming messages are handed to the
+    callbacks through *dispatch* (default: called on the reader thread; the
+    asyncio engine passes `loop.call_soon_threadsafe`).
+    """
+
+    def __init__(self, path: str, *,
+                 on_join: Callable[[str, str], None],
+                 on_leave: Callable[[str], None],
+                 on_route: Callable[[str, memoryview], None],
+                 on_bcast: Callable[[str, memoryview], None],
+                 dispatch: Callable = None):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(path)
+        self._link = _Link(sock)
+        self._cb = {b"JOIN": on_join, b"LEAVE": on_leave,
+                    b"ROUTE": on_route, b"BCAST": on_bcast}
+        self._dispatch = dispatch or (lambda fn, *a: fn(*a))
+        threading.Thread(target=self._reader, daemon=True, name="bus-reader").start()
+
+    # outgoing
+    def join(self, user: str, pub_b64: str) -> None:
+        self._link.send(b"JOIN " + user.encode() + b" " + pub_b64.encode())
+
+    def leave(self, user: str) -> None:
+        self._link.send(b"LEAVE " + user.encode())
+
+    def route(self, recipient: str, wire) -> None:
+        self._link.send(b"ROUTE " + recipient.encode() + b" ", wire)
+
+    def bcast(self, sender: str, wire) -> None:
+        self._link.send(b"BCAST " + sender.encode() + b" ", wire)
+
+    # incoming
+    def _reader(self) -> None:
+        while True:
+            msg = _recv_msg(self._link.sock)
+            if msg is None:
+                logger.error("Lost the shard bus - cross-worker delivery stopped")
+                return
+            head = bytes(msg[:256])
+            verb, _, rest = head.partition(b" ")
+            name_b = rest.split(b" ", 1)[0]
+            cb = self._cb.get(verb)
+            if cb is None:
+                continue
+            name = name_b.decode(errors="replace")
+            body = msg[len(verb) + 1 + len(name_b) + 1:]
+            if verb == b"LEAVE":
+                self._dispatch(cb, name)
+            elif verb == b"JOIN":
+                self._dispatch(cb, name, bytes(body).decode())
+            else:                                    # ROUTE / BCAST carry a client wire
+                self._dispatch(cb, name, body)
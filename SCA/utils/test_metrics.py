@@ -0,0 +1,76 @@
+# utils/test_metrics.py
+import urllib.request
+
+import pytest
+
+from utils.metrics import CONTENT_TYPE, Registry, serve
+
+
+@pytest.fixture
+def reg():
+    return Registry()
+
+
+def test_counter_and_gauge(reg):
+    c = reg.counter("x_total", "Things")
+    g = reg.gauge("x_depth", "Depth")
+    c.inc(); c.inc(2)
+    g.set(5); g.dec(1.5)
+    assert reg.render() == ("# HELP x_total Things\n# TYPE x_total counter\nx_total 3\n"
+                            "# HELP x_depth Depth\n# TYPE x_depth gauge\nx_depth 3.5\n")
+
+
+def test_labels_are_cached_and_escaped(reg):
+    c = reg.counter("f_total", "Frames", ("type",))
+    assert c.labels("CIPH") is c.labels("CIPH")
+    c.labels("CIPH").inc()
+    c.labels('a"b\\c\n').inc(4)
+    lines = reg.render().splitlines()[2:]
+    assert lines == ['f_total{type="CIPH"} 1', 'f_total{type="a\\"b\\\\c\\n"} 4']
+
+
+def test_fn_metrics_are_read_at_scrape_time(reg):
+    box = [1]
+    reg.gauge("live", "Live", fn=lambda: box[0])
+    box[0] = 7
+    assert reg.render().splitlines()[-1] == "live 7"
+
+
+def test_histogram_buckets_are_cumulative(reg):
+    h = reg.histogram("lat_seconds", "Latency", buckets=(0.1, 1.0))
+    for v in (0.05, 0.1, 0.5, 3):
+        h.observe(v)
+    assert reg.render().splitlines()[2:] == [
+        'lat_seconds_bucket{le="0.1"} 2', 'lat_seconds_bucket{le="1"} 3',
+        'lat_seconds_bucket{le="+Inf"} 4', "lat_seconds_sum 3.65", "lat_seconds_count 4"]
+
+
+def test_labelled_histogram(reg):
+    h = reg.histogram("op_seconds", "Ops", ("op",), buckets=(1.0,))
+    h.labels("auth").observe(0.5)
+    assert 'op_seconds_bucket{op="auth",le="1"} 1' in reg.render()
+
+
+def test_duplicate_names_are_refused(reg):
+    reg.counter("dup_total", "a")
+    with pytest.raises(ValueError):
+        reg.gauge("dup_total", "b")
+
+
+def test_broken_callback_does_not_hide_the_rest(reg):
+    reg.gauge("bad", "Bad", fn=lambda: 1 / 0)
+    reg.counter("good_total", "Good")
+    assert reg.render() == "# HELP good_total Good\n# TYPE good_total counter\ngood_total 0\n"
+
+
+def test_endpoint(reg):
+    reg.counter("hits_total", "Hits").inc()
+    httpd = serve(0, registry=reg)
+    try:
+        port = httpd.server_address[1]
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as r:
+            assert r.headers["Content-Type"] == CONTENT_TYPE
+            assert b"hits_total 1" in r.read()
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
@@ -0,0 +1,84 @@
+# utils/test_offline_queue.py
+import pytest
+
+from utils import offline_queue
+from utils.offline_queue import OfflineQueue, key_fingerprint
+
+FP = key_fingerprint("PUB")
+
+
+@pytest.fixture
+def make_queue(tmp_path):
+    queues = []
+    def make(**kw):
+        q = OfflineQueue(tmp_path / "offline.db", **kw)
+        queues.append(q)
+        return q
+    yield make
+    for q in queues:
+        q.close()
+
+
+def _frames(q, user="bob"):
+    return [frame for _, _, frame in q.peek(user, 100)]
+
+
+def test_frames_come_back_in_order(make_queue):
+    q = make_queue()
+    assert q.put("bob", "alice", FP, b"one") == 0
+    q.put_many("bob", FP, [("carol", b"two"), ("alice", memoryview(b"three"))])
+    rows = q.peek("bob", 2)
+    assert [(s, f) for _, s, f in rows] == [("alice", b"one"), ("carol", b"two")]
+    q.delete_upto("bob", rows[-1][0])
+    assert _frames(q) == [b"three"]
+
+
+def test_recipients_are_separate(make_queue):
+    q = make_queue(max_frames=1)
+    q.put("bob", "alice", FP, b"for bob")
+    q.put("carol", "alice", FP, b"for carol")
+    assert _frames(q, "bob") == [b"for bob"] and _frames(q, "carol") == [b"for carol"]
+
+
+def test_frame_limit_evicts_oldest(make_queue):
+    q = make_queue(max_frames=3)
+    evicted = [q.put("bob", "alice", FP, bytes([i])) for i in range(5)]
+    assert evicted == [0, 0, 0, 1, 1]
+    assert _frames(q) == [b"\2", b"\3", b"\4"]
+
+
+def test_byte_quota_evicts_oldest(make_queue):
+    q = make_queue(quota=1000)
+    for i in range(3):
+        q.put("bob", "alice", FP, bytes([i]) * 400)
+    assert [f[0] for f in _frames(q)] == [1, 2]
+
+
+def test_one_oversized_batch_keeps_the_newest(make_queue):
+    q = make_queue(quota=1000, max_frames=5)
+    assert q.put_many("bob", FP, [("alice", bytes([i]) * 300) for i in range(8)]) == 5
+    assert [f[0] for f in _frames(q)] == [5, 6, 7]
+
+
+def test_stale_key_frames_are_dropped(make_queue):
+    q = make_queue()
+    q.put("bob", "alice", key_fingerprint("OLD"), b"old")
+    q.put("bob", "alice", FP, b"new")
+    assert q.drop_stale("bob", FP) == 1
+    assert _frames(q) == [b"new"]
+
+
+def test_expire_drops_frames_past_ttl(make_queue, monkeypatch):
+    q = make_queue(ttl=60)
+    now = 1_800_000_000
+    monkeypatch.setattr(offline_queue.time, "time", lambda: now - 61)
+    q.put("bob", "alice", FP, b"old")
+    monkeypatch.setattr(offline_queue.time, "time", lambda: now)
+    q.put("bob", "alice", FP, b"new")
+    assert q.expire() == 1
+    assert _frames(q) == [b"new"]
+
+
+def test_shared_between_instances(make_queue):
+    make_queue().put("bob", "alice", FP, b"x")
+    assert _frames(make_queue()) == [b"x"]
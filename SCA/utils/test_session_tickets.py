@@ -0,0 +1,87 @@
+# utils/test_session_tickets.py
+import pytest
+
+from utils import session_tickets
+from utils.session_tickets import TicketAuthority
+
+KEY, FP = b"k" * 32, bytes.fromhex("0011223344556677")
+
+
+@pytest.fixture
+def make_authority(tmp_path):
+    made = []
+    def make(key=KEY, **kw):
+        ta = TicketAuthority(key, spent_db=tmp_path / "tickets.db", **kw)
+        made.append(ta)
+        return ta
+    yield make
+    for ta in made:
+        ta.close()
+
+
+def test_issue_and_redeem(make_authority):
+    ta = make_authority()
+    assert ta.redeem(ta.issue("bob", FP)) == ("bob", FP)
+
+
+def test_single_use(make_authority):
+    ta = make_authority()
+    ticket = ta.issue("bob", FP)
+    assert ta.redeem(ticket) is not None
+    assert ta.redeem(ticket) is None
+
+
+def test_replay_on_another_worker_or_after_restart(make_authority):
+    ticket = make_authority().issue("bob", FP)
+    assert make_authority().redeem(ticket) == ("bob", FP)
+    assert make_authority().redeem(ticket) is None
+
+
+def test_each_ticket_is_fresh(make_authority):
+    ta = make_authority()
+    first, second = ta.issue("bob", FP), ta.issue("bob", FP)
+    assert first != second
+    assert ta.redeem(first) and ta.redeem(second)
+
+
+@pytest.mark.parametrize("mangle", [
+    lambda t: t[:-2] + ("AA" if not t.endswith("AA") else "BB"),    # MAC
+    lambda t: "x" + t,                                               # claims
+    lambda t: t.replace(".", ""),
+    lambda t: "",
+])
+def test_forged_tickets(make_authority, mangle):
+    ta = make_authority()
+    assert ta.redeem(mangle(ta.issue("bob", FP))) is None
+
+
+def test_other_signing_key(make_authority):
+    assert make_authority(b"x" * 32).redeem(make_authority().issue("bob", FP)) is None
+
+
+def test_expired(make_authority, monkeypatch):
+    ta = make_authority(lifetime=60)
+    now = 1_800_000_000
+    monkeypatch.setattr(session_tickets.time, "time", lambda: now)
+    ticket = ta.issue("bob", FP)
+    monkeypatch.setattr(session_tickets.time, "time", lambda: now + 61)
+    assert ta.redeem(ticket) is None
+
+
+def test_spent_nonces_are_purged_after_expiry(make_authority, monkeypatch):
+    ta = make_authority(lifetime=60)
+    now = 1_800_000_000
+    monkeypatch.setattr(session_tickets.time, "time", lambda: now)
+    ta.redeem(ta.issue("bob", FP))
+    monkeypatch.setattr(session_tickets.time, "time", lambda: now + 61 + session_tickets.PURGE_SECS)
+    ta.redeem(ta.issue("bob", FP))
+    with ta._pool.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM spent_tickets").fetchone() == (1,)
+
+
+def test_key_file_is_created_once(tmp_path):
+    path = str(tmp_path / "cert" / "ticket_key.bin")
+    a = TicketAuthority.from_file(path, spent_db=tmp_path / "tickets.db")
+    b = TicketAuthority.from_file(path, spent_db=tmp_path / "tickets.db")
+    assert b.redeem(a.issue("bob", FP)) == ("bob", FP)
+    a.close(); b.close()
@@ -0,0 +1,59 @@
+# utils/test_shard_bus.py
+import queue
+import socket
+
+import pytest
+
+from utils.shard_bus import BusClient, ShardBroker
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="needs Unix sockets")
+
+
+class _Worker:
+    """A BusClient whose callbacks just record what arrived."""
+    def __init__(self, path):
+        self.events = queue.Queue()
+        self.bus = BusClient(path, on_join=self._on("JOIN"), on_leave=self._on("LEAVE"),
+                             on_route=self._on("ROUTE"), on_bcast=self._on("BCAST"))
+
+    def _on(self, kind):
+        return lambda *args: self.events.put(
+            (kind,) + tuple(bytes(a) if isinstance(a, memoryview) else a for a in args))
+
+    def next(self, kind):
+        while True:
+            ev = self.events.get(timeout=2)
+            if ev[0] == kind:
+                return ev[1:]
+
+
+@pytest.fixture
+def broker(tmp_path):
+    b = ShardBroker(str(tmp_path / "bus.sock")).start()
+    yield b
+    b.close()
+
+
+def test_route_reaches_the_owner(broker):
+    a, b = _Worker(broker.path), _Worker(broker.path)
+    b.bus.join("bob", "PUBB")
+    assert a.next("JOIN") == ("bob", "PUBB")
+    a.bus.route("bob", b"\0\0\0\4CIPH")
+    assert b.next("ROUTE") == ("bob", b"\0\0\0\4CIPH")
+
+
+def test_route_without_owner_comes_back_to_the_sender(broker):
+    a = _Worker(broker.path)
+    a.bus.route("ghost", b"\0\0\0\4CIPH")
+    assert a.next("ROUTE") == ("ghost", b"\0\0\0\4CIPH")
+
+
+def test_route_after_leave_comes_back(broker):
+    a, b = _Worker(broker.path), _Worker(broker.path)
+    b.bus.join("bob", "PUBB")
+    a.next("JOIN")
+    b.bus.leave("bob")
+    a.next("LEAVE")
+    a.bus.route("bob", b"\0\0\0\4CIPH")
+    assert a.next("ROUTE") == ("bob", b"\0\0\0\4CIPH")
+    assert b.events.empty()
@@ -0,0 +1,28 @@
+# utils/test_tracing.py
+import pytest
+
+from utils import tracing
+
+
+@pytest.fixture(autouse=True)
+def _off():
+    yield
+    tracing.set_rate(0)
+
+
+def test_rate_picks_one_frame_in_n():
+    tracing.set_rate(0.25)
+    assert tracing.rate() == 0.25
+    assert [tracing.sample() is not None for _ in range(8)].count(True) == 2
+
+
+@pytest.mark.parametrize("rate, expected", [(5, 1.0), (-1, 0.0), (1e-320, 0.0)])
+def test_out_of_range_rates_are_clamped(rate, expected):
+    tracing.set_rate(rate)
+    assert tracing.rate() == expected
+
+
+def test_endpoint_rejects_bad_rates():
+    assert tracing._http("POST", {"rate": "1e-320"}) == (200, "rate 0\n")
+    assert tracing._http("POST", {"rate": "nan"})[0] == 400
+    assert tracing._http("POST", {"rate": "x"})[0] == 400
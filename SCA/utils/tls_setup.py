@@ -85,6 +85,9 @@ def configure_tls_context(certfile, keyfile, purpose, cafile=None):
             ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
             ctx.load_cert_chain(certfile, keyfile)
             ctx.verify_mode = ssl.CERT_OPTIONAL     # ready for mTLS later
+            # TLS 1.3 resumption tickets: a client that passes its previous
+            # `session=` to wrap_socket() skips the certificate exchange
+            ctx.num_tickets = 2
 
         # ── Hardening common to both roles ────────────────────────────
         ctx.minimum_version = ssl.TLSVersion.TLSv1_3